@@ -0,0 +1,8 @@
+"""
+ASGI entry point, serves also the live stream of task changes: uvicorn asgi:app
+In production run it with Gunicorn's uvicorn workers: gunicorn -k uvicorn.workers.UvicornWorker asgi:app
+"""
+from website import create_app
+from website.asgi import TaskManagerASGI
+
+app = TaskManagerASGI(create_app())
@@ -0,0 +1,6 @@
+"""
+Benchmarks of the terminal API and authentication. Run from the repository root:
+    python -m TaskManager.benchmarks --tasks 100000 --users 50
+See __main__.py for all options. Seeding is in seed.py, the measured requests in scenarios.py and the drivers,
+statistics and baselines in runner.py.
+"""
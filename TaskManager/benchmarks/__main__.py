@@ -0,0 +1,102 @@
+"""
+Command line of the benchmarks, e.g.
+    python -m TaskManager.benchmarks --tasks 100000 --users 50 --save-baseline
+    python -m TaskManager.benchmarks --tasks 100000 --users 50 --mode server --server gunicorn --workers 4
+The database is seeded once and reused by the following runs with the same size (--reseed starts over). Results
+are compared with the baseline of the same mode and size, a regression makes the run exit with status 1.
+"""
+from pathlib import Path
+from sqlalchemy import func, select, text
+import click
+import tempfile
+
+from ..website import create_app, db
+from ..website.db_migrations import upgrade_database
+from ..website.db_models import User
+from .runner import compare_with_baseline, format_results, load_baseline, prepare_users, run_client, run_server, \
+    save_baseline, start_server
+from .scenarios import SCENARIOS, SCENARIOS_BY_NAME
+from .seed import SeedConfig, seed_database
+
+
+BASELINES_DIR = Path(__file__).resolve().parent / "baselines"
+
+
+@click.command()
+@click.option("--tasks", default=10_000, show_default=True, help="Tasks in the seeded database")
+@click.option("--users", default=10, show_default=True, help="Users owning the tasks")
+@click.option("--tree-size", default=50, show_default=True, help="Tasks of one subtask tree")
+@click.option("--branching", default=2, show_default=True, help="Children of a task, 1 makes trees chains")
+@click.option("--database-url", default=None, help="Database to seed, a file in the temp directory by default")
+@click.option("--reseed", is_flag=True, help="Drop and seed the database again")
+@click.option("--mode", type=click.Choice(["client", "server"]), default="client", show_default=True)
+@click.option("--server", type=click.Choice(["gunicorn", "uvicorn"]), default="gunicorn", show_default=True)
+@click.option("--workers", default=4, show_default=True, help="Server workers (server mode)")
+@click.option("--concurrency", default=16, show_default=True, help="Requests sent at once (server mode)")
+@click.option("--port", default=8765, show_default=True)
+@click.option("--iterations", default=200, show_default=True, help="Measured requests of every scenario")
+@click.option("--scenario", "scenario_names", multiple=True, type=click.Choice(list(SCENARIOS_BY_NAME)),
+              help="Run only these scenarios (repeatable)")
+@click.option("--read-only", is_flag=True, help="Skip scenarios that change tasks")
+@click.option("--baseline", "baseline_name", default=None, help="Name of the baseline, derived from mode and size "
+                                                                "by default")
+@click.option("--save-baseline", "store_baseline", is_flag=True, help="Store the results as the new baseline")
+@click.option("--tolerance", default=0.25, show_default=True, help="Allowed relative loss of p95 and throughput")
+def benchmark(tasks, users, tree_size, branching, database_url, reseed, mode, server, workers, concurrency, port,
+              iterations, scenario_names, read_only, baseline_name, store_baseline, tolerance):
+    """Seeds a database, measures the terminal and auth endpoints and compares the results with a baseline"""
+    seed_config = SeedConfig(tasks=tasks, users=users, tree_size=tree_size, branching=branching)
+    if database_url is None:
+        database_url = f"sqlite:///{Path(tempfile.gettempdir()) / f'taskmanager-bench-{tasks}-{users}.db'}"
+    app = create_app(config={"SQLALCHEMY_DATABASE_URI": database_url, "TASK_LIST_CACHE_BACKEND": "memory"})
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        if reseed:
+            db.drop_all()
+            if dialect == "sqlite":
+                db.session.execute(text("DROP TABLE IF EXISTS task_fts"))
+                db.session.commit()
+            upgrade_database()
+        if db.session.scalar(select(func.count()).select_from(User)) == 0:
+            click.echo(f"Seeding {tasks} tasks of {users} users...")
+            user_ids = seed_database(seed_config)
+        else:
+            user_ids = db.session.scalars(select(User.id).order_by(User.id)).all()
+        benchmark_users = prepare_users(user_ids, seed_config.seed)
+
+    scenarios = [SCENARIOS_BY_NAME[name] for name in scenario_names] or SCENARIOS
+    if read_only:
+        scenarios = [scenario for scenario in scenarios if not scenario.writes]
+    if mode == "client":
+        results = run_client(app, benchmark_users, scenarios, iterations)
+    else:
+        process = start_server(server, workers, port, database_url)
+        try:
+            results = run_server(f"http://127.0.0.1:{port}", benchmark_users, scenarios, iterations, concurrency)
+        finally:
+            process.terminate()
+            process.wait()
+    click.echo(format_results(results))
+
+    config = {**seed_config.as_dict(), "mode": mode, "server": server if mode == "server" else None,
+              "workers": workers if mode == "server" else None, "iterations": iterations,
+              "dialect": dialect}
+    baseline_path = BASELINES_DIR / f"{baseline_name or f'{mode}-{tasks}-{users}'}.json"
+    if store_baseline:
+        save_baseline(baseline_path, config, results)
+        click.echo(f"Baseline stored at {baseline_path}")
+        return
+    baseline = load_baseline(baseline_path)
+    if baseline is None:
+        click.echo(f"No baseline at {baseline_path}, store one with --save-baseline")
+        return
+    regressions = compare_with_baseline(results, baseline, tolerance)
+    for regression in regressions:
+        click.echo(f"REGRESSION {regression}", err=True)
+    if regressions:
+        raise SystemExit(1)
+    click.echo(f"No regressions against {baseline_path}")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,286 @@
+"""
+Drivers of the benchmark, statistics of the measured requests and baselines.
+
+ - client mode sends requests one at a time through the Flask test client, in this process. There is no network, so
+   the numbers show the cost of the app itself, and every request's SQL queries are counted
+ - server mode starts a real server with several workers (Gunicorn with gunicorn.conf.py or uvicorn with the ASGI
+   app) and sends requests from many threads over HTTP, which shows throughput under concurrency. A scenario with
+   'during' is measured while other threads keep sending that scenario, e.g. task requests during a burst of logins
+
+A baseline is a JSON file with results of an earlier run. Comparing with it fails when a scenario issues more queries
+per request than before (query counts do not depend on the machine, so there is no tolerance) or when its p95 latency
+or throughput got worse by more than the tolerance.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from http.cookiejar import CookieJar
+from pathlib import Path
+from sqlalchemy import event
+from threading import Event, Thread
+from time import perf_counter, sleep
+from typing import Callable, Optional
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, Request, build_opener, urlopen
+import json
+import os
+import random
+import subprocess
+import sys
+
+from ..website import db
+from .scenarios import BenchmarkUser, Scenario
+from .seed import BENCHMARK_PASSWORD, benchmark_username, sample_task_ids, sample_tree_roots
+
+
+APP_DIR = Path(__file__).resolve().parent.parent  # directory of the entry points (wsgi.py, asgi.py)
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    requests: int
+    errors: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    requests_per_second: float
+    queries_per_request: Optional[float] = None  # known only in client mode
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of already sorted values"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+def summarize(name: str, latencies: list[float], errors: int, elapsed: float,
+              queries: Optional[list[int]] = None) -> ScenarioResult:
+    latencies = sorted(latencies)
+    return ScenarioResult(
+        name=name,
+        requests=len(latencies),
+        errors=errors,
+        p50_ms=round(percentile(latencies, 0.50) * 1000, 3),
+        p95_ms=round(percentile(latencies, 0.95) * 1000, 3),
+        p99_ms=round(percentile(latencies, 0.99) * 1000, 3),
+        requests_per_second=round(len(latencies) / elapsed, 1) if elapsed > 0 else 0.0,
+        queries_per_request=round(sum(queries) / len(queries), 2) if queries else None,
+    )
+
+def prepare_users(user_ids: list[int], seed: int = 0, sample_size: int = 200) -> list[BenchmarkUser]:
+    """Samples tasks of every user used as request arguments. Requires an application context"""
+    rng = random.Random(seed)
+    users = []
+    for index, user_id in enumerate(user_ids):
+        users.append(BenchmarkUser(
+            user_id=user_id,
+            username=benchmark_username(index),
+            task_ids=sample_task_ids(user_id, sample_size, rng),
+            tree_roots=sample_tree_roots(user_id, sample_size),
+            rng=random.Random(seed + index),
+        ))
+    return [user for user in users if user.task_ids and user.tree_roots]
+
+
+class QueryCounter:
+    """Counts SQL statements executed by the engine between reset() calls"""
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _count(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._count)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, "before_cursor_execute", self._count)
+
+    def reset(self) -> int:
+        count, self.count = self.count, 0
+        return count
+
+
+def run_client(app, users: list[BenchmarkUser], scenarios: list[Scenario], iterations: int,
+               warmup: int = 10) -> list[ScenarioResult]:
+    """
+    Runs every scenario iterations times through the test client, users take turns. Scenarios measured 'during'
+    other requests are skipped - the test client sends one request at a time
+    """
+    scenarios = [scenario for scenario in scenarios if scenario.during is None]
+    clients = []
+    for user in users:
+        client = app.test_client()
+        response = client.post("/login", data={"username": user.username, "password": BENCHMARK_PASSWORD})
+        if response.status_code not in (200, 302):
+            raise RuntimeError(f"Benchmark user {user.username} could not log in")
+        clients.append(client)
+
+    with app.app_context():
+        engine = db.engine
+    results = []
+    # requests push their own app contexts, running them inside one would share flask.g (and the user) among them
+    with QueryCounter(engine) as query_counter:
+        for scenario in scenarios:
+            for iteration in range(warmup):
+                _client_request(clients[iteration % len(clients)], scenario, users[iteration % len(users)])
+            latencies, queries, errors = [], [], 0
+            scenario_start = perf_counter()
+            for iteration in range(iterations):
+                user_index = iteration % len(users)
+                query_counter.reset()
+                start = perf_counter()
+                status = _client_request(clients[user_index], scenario, users[user_index])
+                latencies.append(perf_counter() - start)
+                queries.append(query_counter.reset())
+                errors += status not in scenario.expected_statuses
+            results.append(summarize(scenario.name, latencies, errors, perf_counter() - scenario_start, queries))
+    return results
+
+def _client_request(client, scenario: Scenario, user: BenchmarkUser) -> int:
+    return client.open(scenario.path, method=scenario.method, **scenario.build(user)).status_code
+
+
+class _NoRedirect(HTTPRedirectHandler):
+    """Redirects are measured as they are, not followed"""
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+def _open_session(base_url: str, user: BenchmarkUser):
+    opener = build_opener(HTTPCookieProcessor(CookieJar()), _NoRedirect())
+    _http_request(opener, base_url, "POST", "/login",
+                  {"data": {"username": user.username, "password": BENCHMARK_PASSWORD}})
+    return opener
+
+def _http_request(opener, base_url: str, method: str, path: str, request_kwargs: dict) -> int:
+    headers = dict(request_kwargs.get("headers", {}))
+    body = None
+    if "json" in request_kwargs:
+        body = json.dumps(request_kwargs["json"]).encode()
+        headers["Content-Type"] = "application/json"
+    elif "data" in request_kwargs:
+        body = urlencode(request_kwargs["data"]).encode()
+        headers["Content-Type"] = "application/x-www-form-urlencoded"
+    try:
+        with opener.open(Request(base_url + path, data=body, headers=headers, method=method)) as response:
+            response.read()
+            return response.status
+    except HTTPError as e:
+        e.read()
+        return e.code
+
+def run_server(base_url: str, users: list[BenchmarkUser], scenarios: list[Scenario], iterations: int,
+               concurrency: int, warmup: int = 10) -> list[ScenarioResult]:
+    """Runs every scenario iterations times against a running server, from concurrency threads at once"""
+    sessions = [_open_session(base_url, user) for user in users]
+    anonymous = build_opener(_NoRedirect())
+
+    def one_request(iteration: int, scenario: Scenario) -> tuple[float, int]:
+        user_index = iteration % len(users)
+        opener = sessions[user_index] if scenario.logged_in else anonymous
+        request_kwargs = scenario.build(users[user_index])
+        start = perf_counter()
+        status = _http_request(opener, base_url, scenario.method, scenario.path, request_kwargs)
+        return perf_counter() - start, status
+
+    results = []
+    with ThreadPoolExecutor(concurrency) as executor:
+        for scenario in scenarios:
+            burst = None
+            if scenario.during is not None:
+                burst = _Burst(lambda iteration: one_request(iteration, scenario.during), concurrency)
+            try:
+                list(executor.map(lambda iteration: one_request(iteration, scenario), range(warmup)))
+                scenario_start = perf_counter()
+                measured = list(executor.map(lambda iteration: one_request(iteration, scenario), range(iterations)))
+                elapsed = perf_counter() - scenario_start
+            finally:
+                if burst is not None:
+                    burst.stop()
+            errors = sum(status not in scenario.expected_statuses for _, status in measured)
+            results.append(summarize(scenario.name, [latency for latency, _ in measured], errors, elapsed))
+    return results
+
+class _Burst:
+    """Sends requests from threads in a loop until stopped, e.g. logins while task requests are measured"""
+    def __init__(self, send: Callable[[int], object], threads: int):
+        self._stopped = Event()
+        self._threads = [Thread(target=self._run, args=(send, index, threads), daemon=True) for index in range(threads)]
+        for thread in self._threads:
+            thread.start()
+
+    def _run(self, send: Callable[[int], object], iteration: int, step: int):
+        while not self._stopped.is_set():
+            send(iteration)
+            iteration += step
+
+    def stop(self):
+        self._stopped.set()
+        for thread in self._threads:
+            thread.join()
+
+def start_server(server: str, workers: int, port: int, database_url: str) -> subprocess.Popen:
+    """Starts gunicorn (threaded workers, gunicorn.conf.py) or uvicorn (asgi:app) and waits until it answers"""
+    if server == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py", "--workers", str(workers),
+                   "--bind", f"127.0.0.1:{port}"]
+    elif server == "uvicorn":
+        command = [sys.executable, "-m", "uvicorn", "asgi:app", "--workers", str(workers), "--port", str(port),
+                   "--log-level", "warning"]
+    else:
+        raise ValueError(f"Unknown server {server}")
+    environment = {**os.environ, "TASKMANAGER_DATABASE_URL": database_url}
+    process = subprocess.Popen(command, cwd=APP_DIR, env=environment)
+    for _ in range(100):
+        if process.poll() is not None:
+            raise RuntimeError(f"{server} exited with code {process.returncode}")
+        try:
+            with urlopen(f"http://127.0.0.1:{port}/login", timeout=1):
+                return process
+        except (URLError, ConnectionError):
+            sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{server} did not start")
+
+
+def load_baseline(path: Path) -> Optional[dict]:
+    if not path.exists():
+        return None
+    return json.loads(path.read_text())
+
+def save_baseline(path: Path, config: dict, results: list[ScenarioResult]):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    baseline = {"config": config, "results": {result.name: asdict(result) for result in results}}
+    path.write_text(json.dumps(baseline, indent=2) + "\n")
+
+def compare_with_baseline(results: list[ScenarioResult], baseline: dict, tolerance: float) -> list[str]:
+    """Descriptions of regressions against the baseline, empty when there are none"""
+    regressions = []
+    for result in results:
+        previous = baseline["results"].get(result.name)
+        if previous is None:
+            continue
+        if result.queries_per_request is not None and previous.get("queries_per_request") is not None \
+                and result.queries_per_request > previous["queries_per_request"]:
+            regressions.append(f"{result.name}: {result.queries_per_request} queries per request, "
+                               f"baseline {previous['queries_per_request']}")
+        if result.p95_ms > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{result.name}: p95 {result.p95_ms} ms, baseline {previous['p95_ms']} ms")
+        if result.requests_per_second < previous["requests_per_second"] * (1 - tolerance):
+            regressions.append(f"{result.name}: {result.requests_per_second} requests/s, "
+                               f"baseline {previous['requests_per_second']}")
+    return regressions
+
+def format_results(results: list[ScenarioResult]) -> str:
+    header = f"{'scenario':<18}{'requests':>9}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}" \
+             f"{'req/s':>10}{'queries':>9}"
+    lines = [header, "-" * len(header)]
+    for result in results:
+        queries = "-" if result.queries_per_request is None else f"{result.queries_per_request:g}"
+        lines.append(f"{result.name:<18}{result.requests:>9}{result.errors:>8}{result.p50_ms:>10.2f}"
+                     f"{result.p95_ms:>10.2f}{result.p99_ms:>10.2f}{result.requests_per_second:>10.1f}{queries:>9}")
+    return "\n".join(lines)
@@ -0,0 +1,92 @@
+"""
+The measured requests. Every scenario builds its request from the data of a benchmark user, so that requests are
+spread over many tasks and users instead of hitting one cached row.
+"""
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Callable, Optional
+import random
+
+from .seed import BENCHMARK_PASSWORD, WORDS
+
+
+@dataclass
+class BenchmarkUser:
+    user_id: int
+    username: str
+    task_ids: list[int]
+    tree_roots: list[int]
+    rng: random.Random = field(default_factory=random.Random)
+
+    def task_id(self) -> int:
+        return self.rng.choice(self.task_ids)
+
+    def tree_root(self) -> int:
+        return self.rng.choice(self.tree_roots)
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: str
+    build: Callable[[BenchmarkUser], dict]  # keyword arguments of the request: json, data, query_string, headers
+    writes: bool = False  # changes tasks, skipped with --read-only
+    logged_in: bool = True
+    expected_statuses: tuple = (200,)
+    # sent continuously from other threads while this scenario is measured (server mode only)
+    during: Optional["Scenario"] = None
+
+
+def _days_range(user: BenchmarkUser, days: int) -> tuple[str, str]:
+    start = date.today() + timedelta(days=user.rng.randint(-365, 365 - days))
+    return start.isoformat(), (start + timedelta(days=days)).isoformat()
+
+def _calendar(user: BenchmarkUser) -> dict:
+    start, end = _days_range(user, 30)
+    return {"json": {"start": start, "end": end, "format": "structured"}}
+
+def _stats(user: BenchmarkUser) -> dict:
+    date_from, date_to = _days_range(user, 90)
+    return {"json": {"date_from": date_from, "date_to": date_to, "format": "structured"}}
+
+def _add(user: BenchmarkUser) -> dict:
+    return {"json": {"title": f"benchmark {user.rng.choice(WORDS)}", "importance": user.rng.randint(0, 10),
+                     "deadline": f"{date.today() + timedelta(days=user.rng.randint(0, 60))}T12:00:00",
+                     "est_time_days": 2, "description": "added by the benchmark"}}
+
+def _list(user: BenchmarkUser) -> dict:
+    return {"json": {"limit": 50, "format": "structured"}}
+
+
+LOGIN = Scenario("login", "POST", "/login",
+                 lambda user: {"data": {"username": user.username, "password": BENCHMARK_PASSWORD}},
+                 logged_in=False, expected_statuses=(200, 302))
+
+SCENARIOS = [
+    Scenario("list", "POST", "/terminal/list", _list),
+    Scenario("list_by_deadline", "POST", "/terminal/list",
+             lambda user: {"json": {"limit": 50, "sort_by": "deadline", "format": "structured"}}),
+    Scenario("list_filtered", "POST", "/terminal/list",
+             lambda user: {"json": {"limit": 50, "importance_min": 8, "title_contains": user.rng.choice(WORDS),
+                                    "format": "structured"}}),
+    # task ids are sent as strings, like the terminal does
+    Scenario("view", "POST", "/terminal/view",
+             lambda user: {"json": {"task_id": str(user.task_id()), "format": "structured"}}),
+    Scenario("tree", "POST", "/terminal/tree",
+             lambda user: {"json": {"task_id": str(user.tree_root()), "format": "structured"}}),
+    Scenario("calendar", "POST", "/terminal/calendar", _calendar),
+    Scenario("search", "POST", "/terminal/search",
+             lambda user: {"json": {"query": user.rng.choice(WORDS)[:4], "format": "structured"}}),
+    Scenario("stats", "POST", "/terminal/stats", _stats),
+    Scenario("next", "POST", "/terminal/next", lambda user: {"json": {"limit": 10, "format": "structured"}}),
+    Scenario("add", "POST", "/terminal/add", _add, writes=True),
+    Scenario("status", "POST", "/terminal/status",
+             lambda user: {"json": {"task_id": str(user.task_id()), "status": user.rng.choice(["todo", "done"])}},
+             writes=True),
+    LOGIN,
+    # latency of task requests while logins hash passwords, they must not wait for free workers
+    Scenario("list_during_logins", "POST", "/terminal/list", _list, during=LOGIN),
+]
+
+SCENARIOS_BY_NAME = {scenario.name: scenario for scenario in SCENARIOS}
@@ -0,0 +1,105 @@
+"""
+Seeding of benchmark databases. Tasks are inserted with executemany in large chunks, spread evenly among the users
+and arranged into subtask trees, so that tree, calendar and statistics requests have realistic data to work on.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert, select, text
+import random
+
+from ..website import db
+from ..website.db_models import Task, TASK_STATUSES, User
+from ..website.db_operations import reconcile_task_counts
+from ..website.password_hashing import password_hasher
+
+
+BENCHMARK_PASSWORD = "benchmark-password"
+SEED_CHUNK_SIZE = 5000
+WORDS = ["report", "invoice", "meeting", "garden", "refactor", "review", "deploy", "groceries", "dentist", "taxes",
+         "backup", "release", "migration", "budget", "interview", "holiday", "workout", "laundry", "newsletter"]
+
+
+@dataclass
+class SeedConfig:
+    tasks: int = 10_000
+    users: int = 10
+    tree_size: int = 50  # tasks of one subtask tree
+    branching: int = 2  # children of a task, 1 makes every tree a chain tree_size tasks deep
+    seed: int = 0
+
+    def as_dict(self) -> dict:
+        return dict(self.__dict__)
+
+
+def benchmark_username(index: int) -> str:
+    return f"bench_user_{index}"
+
+def seed_database(config: SeedConfig) -> list[int]:
+    """
+    Inserts config.users users (password BENCHMARK_PASSWORD) with config.tasks tasks among them. Returns ids of the
+    users. Requires an application context with an empty database
+    """
+    rng = random.Random(config.seed)
+    password_hash = password_hasher.hash(BENCHMARK_PASSWORD)  # the same for everyone, scrypt is slow
+    db.session.execute(insert(User), [
+        {"email": f"{benchmark_username(index)}@bench.test", "username": benchmark_username(index),
+         "password_hash": password_hash}
+        for index in range(config.users)
+    ])
+    db.session.commit()
+    user_ids = db.session.scalars(select(User.id).order_by(User.id)).all()
+
+    # ids are assigned here, so that children can reference their parents in the same executemany
+    next_id = (db.session.scalar(select(func.max(Task.id))) or 0) + 1
+    tasks_per_user = -(-config.tasks // config.users)
+    now = datetime.now().replace(microsecond=0)
+    chunk = []
+    inserted = 0
+    for user_id in user_ids:
+        user_task_count = min(tasks_per_user, config.tasks - inserted)
+        for position in range(user_task_count):
+            in_tree = position % config.tree_size
+            tree_root_id = next_id - in_tree
+            parent_id = tree_root_id + (in_tree - 1) // config.branching if in_tree else None
+            deadline = now + timedelta(days=rng.randint(-365, 365), hours=rng.randint(0, 23))
+            est_time_days = rng.choice([None, 1, 2, 3, 5, 8, 13])
+            chunk.append({
+                "id": next_id,
+                "title": f"{rng.choice(WORDS)} {rng.choice(WORDS)} {next_id}",
+                "importance": rng.randint(0, 10),
+                "deadline": deadline,
+                "est_time_days": est_time_days,
+                "description": " ".join(rng.choices(WORDS, k=rng.randint(0, 12))),
+                "user_id": user_id,
+                "parent_task_id": parent_id,
+                "start_date": Task.compute_start_date(deadline, est_time_days),
+                "status": rng.choice(TASK_STATUSES),
+            })
+            next_id += 1
+            if len(chunk) >= SEED_CHUNK_SIZE:
+                _insert_tasks(chunk)
+        inserted += user_task_count
+    _insert_tasks(chunk)
+
+    if db.engine.dialect.name == "postgresql":
+        # explicit ids do not advance the sequence of the column
+        db.session.execute(text("SELECT setval(pg_get_serial_sequence('task', 'id'), (SELECT max(id) FROM task))"))
+        db.session.commit()
+    reconcile_task_counts()
+    return list(user_ids)
+
+def _insert_tasks(chunk: list[dict]):
+    if chunk:
+        db.session.execute(insert(Task), chunk)
+        db.session.commit()
+        chunk.clear()
+
+def sample_task_ids(user_id: int, count: int, rng: random.Random) -> list[int]:
+    """Random ids of user's tasks, used as arguments of the benchmarked requests"""
+    task_ids = db.session.scalars(select(Task.id).where(Task.user_id == user_id)).all()
+    return rng.sample(task_ids, min(count, len(task_ids)))
+
+def sample_tree_roots(user_id: int, count: int) -> list[int]:
+    return db.session.scalars(
+        select(Task.id).where(Task.user_id == user_id, Task.parent_task_id.is_(None)).order_by(Task.id).limit(count)
+    ).all()
@@ -0,0 +1,41 @@
+"""
+Gunicorn configuration of the WSGI app, run from this directory: gunicorn -c gunicorn.conf.py
+Settings can be overridden on the command line (e.g. --workers 8) or with the TASKMANAGER_* variables below.
+"""
+from multiprocessing import cpu_count
+from os import environ, path
+from time import perf_counter
+import gc
+
+wsgi_app = "wsgi:app"
+bind = environ.get("TASKMANAGER_BIND", "127.0.0.1:8000")
+workers = int(environ.get("TASKMANAGER_WORKERS", cpu_count() * 2 + 1))
+# threaded workers: a login waiting for its password hash (see website/password_hashing.py) holds one thread, not the
+# whole worker. A worker has more threads than hashes that may run or wait at once (PASSWORD_HASH_WORKERS +
+# PASSWORD_HASH_QUEUE, 2 + 8 by default), so a burst of logins always leaves threads for task requests
+worker_class = "gthread"
+threads = int(environ.get("TASKMANAGER_THREADS", 16))
+# the app is created in the master and forked, see wsgi.py
+preload_app = environ.get("TASKMANAGER_PRELOAD", "1") != "0"
+# heartbeat files of workers are written often, keep them in memory when possible
+if path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"
+
+
+def when_ready(server):
+    if preload_app:
+        import wsgi
+        server.log.info("TaskManager app loaded in %.0f ms", wsgi.startup_seconds * 1000)
+        # objects created so far are never collected, so the garbage collector of workers does not touch (and copy)
+        # the memory pages they share with the master
+        gc.freeze()
+
+def post_fork(server, worker):
+    worker.boot_started = perf_counter()
+    if preload_app:
+        import wsgi
+        from website import after_fork
+        after_fork(wsgi.app)
+
+def post_worker_init(worker):
+    worker.log.info("Worker %s booted in %.0f ms", worker.pid, (perf_counter() - worker.boot_started) * 1000)
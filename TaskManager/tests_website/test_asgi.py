@@ -0,0 +1,159 @@
+from datetime import datetime
+from unittest import TestCase, skipIf
+import asyncio
+import os
+
+from sqlalchemy import update
+from sqlalchemy.orm import close_all_sessions
+from ..website import db, create_app, TEST_DATABASE_PATH
+from ..website.auth import register_user
+from ..website.change_feed import ChangeFeed
+from ..website.db_models import TaskRevision, User
+from ..website.db_operations import try_add_new_task
+from ..website.models.requests import AddTaskRequestModel
+from ..website.task_cache import task_list_cache
+from ..website.user_cache import user_cache
+
+try:
+    from ..website.asgi import TaskManagerASGI, EVENTS_PATH
+except ImportError:  # asgiref is needed only by the ASGI server
+    TaskManagerASGI = None
+
+
+class TestChangeFeed(TestCase):
+
+    def test_publish_wakes_subscriptions_of_the_user(self):
+        async def scenario():
+            feed = ChangeFeed()
+            subscription = feed.subscribe(42)
+            other_subscription = feed.subscribe(43)
+            feed.publish(42, 7)
+            self.assertEqual(await subscription.wait(1), (True, 7))
+            self.assertEqual(await other_subscription.wait(0.01), (False, None))
+
+            feed.publish(42, 7)  # already published
+            self.assertEqual(await subscription.wait(0.01), (False, None))
+            await asyncio.to_thread(feed.publish, 42)
+            self.assertEqual(await subscription.wait(1), (True, None))
+
+            feed.unsubscribe(subscription)
+            feed.unsubscribe(other_subscription)
+            self.assertEqual(feed.subscribed_users(), [])
+        asyncio.run(scenario())
+
+
+@skipIf(TaskManagerASGI is None, "asgiref is not installed")
+class TestAsgi(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app(test=True, config={"CHANGE_FEED_POLL_INTERVAL": 0.05})
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+
+    @classmethod
+    def tearDownClass(cls):
+        close_all_sessions()
+        db.drop_all()
+        if os.path.exists(TEST_DATABASE_PATH):
+            os.remove(TEST_DATABASE_PATH)
+            print(f"Removed test database from {TEST_DATABASE_PATH}")
+        cls.app_context.pop()
+
+    def setUp(self):
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+        task_list_cache.clear()
+        user_cache.clear()
+
+        with self.app.test_request_context():
+            self.assertTrue(register_user("asgi@test.com", "asgi_user", "Ladidadida").success)
+        self.user_id = db.session.scalar(db.select(User.id).where(User.username == "asgi_user"))
+        client = self.app.test_client()
+        client.post("/login", data={"username": "asgi_user", "password": "Ladidadida"})
+        self.cookie = f"session={client.get_cookie('session').value}".encode()
+        self.asgi = TaskManagerASGI(self.app)
+
+    def tearDown(self):
+        # users loaded by the test must not stay in the identity map - the next test reuses their ids
+        db.session.remove()
+
+    def _scope(self, path, headers=()):
+        return {
+            "type": "http", "http_version": "1.1", "method": "GET", "scheme": "http", "path": path,
+            "root_path": "", "query_string": b"", "headers": [(b"host", b"localhost"), *headers],
+            "client": ("127.0.0.1", 5000), "server": ("localhost", 80),
+        }
+
+    async def _open(self, scope):
+        """Starts the app with scope, returns the queue of sent messages, the disconnecting function and the task"""
+        incoming, sent = asyncio.Queue(), asyncio.Queue()
+        incoming.put_nowait({"type": "http.request", "body": b"", "more_body": False})
+
+        async def send(message):
+            sent.put_nowait(message)
+
+        task = asyncio.ensure_future(self.asgi(scope, incoming.get, send))
+        return sent, lambda: incoming.put_nowait({"type": "http.disconnect"}), task
+
+    async def _next_event(self, sent) -> bytes:
+        while True:
+            message = await asyncio.wait_for(sent.get(), 5)
+            if message.get("body", b"").startswith(b"event:"):
+                return message["body"]
+
+    def _add_task(self):
+        task_data = AddTaskRequestModel(title="Live", importance=1, deadline=datetime(2030, 1, 1),
+                                        est_time_days=None, description="")
+        self.assertTrue(try_add_new_task(task_data, self.user_id).success)
+
+    def test_events_require_login(self):
+        async def scenario():
+            sent, disconnect, task = await self._open(self._scope(EVENTS_PATH))
+            await asyncio.wait_for(task, 5)
+            return (await sent.get())["status"]
+        self.assertEqual(asyncio.run(scenario()), 401)
+
+    def test_events_stream_changes_of_tasks(self):
+        async def scenario():
+            sent, disconnect, task = await self._open(self._scope(EVENTS_PATH, [(b"cookie", self.cookie)]))
+            start = await asyncio.wait_for(sent.get(), 5)
+            self.assertEqual(start["status"], 200)
+            self.assertIn((b"content-type", b"text/event-stream"), start["headers"])
+            self.assertIn(b"id: 0\n", await self._next_event(sent))
+
+            await asyncio.to_thread(self._add_task)  # published by db_operations in this process
+            self.assertIn(b"id: 1\n", await self._next_event(sent))
+
+            # a change made by another process is found by polling the revisions
+            await asyncio.to_thread(self._bump_revision_directly)
+            self.assertIn(b"id: 2\n", await self._next_event(sent))
+
+            disconnect()
+            await asyncio.wait_for(task, 5)
+            self.assertEqual(self.asgi.feed.subscribed_users(), [])
+        asyncio.run(scenario())
+
+    def _bump_revision_directly(self):
+        with self.app.app_context():
+            db.session.execute(update(TaskRevision).where(TaskRevision.user_id == self.user_id)
+                               .values(revision=TaskRevision.revision + 1))
+            db.session.commit()
+
+    def test_reconnect_with_current_revision_gets_no_repeated_event(self):
+        async def scenario():
+            headers = [(b"cookie", self.cookie), (b"last-event-id", b"0")]
+            sent, disconnect, task = await self._open(self._scope(EVENTS_PATH, headers))
+            await asyncio.to_thread(self._add_task)
+            self.assertIn(b"id: 1\n", await self._next_event(sent))
+            disconnect()
+            await asyncio.wait_for(task, 5)
+        asyncio.run(scenario())
+
+    def test_other_requests_are_served_by_flask(self):
+        async def scenario():
+            sent, disconnect, task = await self._open(self._scope("/login"))
+            await asyncio.wait_for(task, 5)
+            return (await sent.get())["status"]
+        self.assertEqual(asyncio.run(scenario()), 200)
@@ -1,9 +1,14 @@
+from threading import Barrier, Thread
 from unittest import TestCase
 import os
 from sqlalchemy.orm import close_all_sessions
 from sqlalchemy.exc import IntegrityError, ResourceClosedError, NoResultFound
+from werkzeug.security import generate_password_hash
 from ..website import db, create_app, TEST_DATABASE_PATH
-from ..website.auth import register_user, is_email_available, is_username_available, perform_login
+from ..website.admission import auth_admission, AdmissionRejected
+from ..website.auth import register_user, is_email_available, is_username_available, perform_login, \
+    find_taken_fields
+from ..website.db_models import User
 
 
 class TestAuth(TestCase):
@@ -37,6 +42,8 @@ class TestAuth(TestCase):
         self.request_ctx.push()
 
     def tearDown(self):
+        # users loaded by the test must not stay in the identity map - the next test reuses their ids
+        db.session.remove()
         self.request_ctx.pop()
 
     def test_register_user_valid(self):
@@ -84,3 +91,70 @@ class TestAuth(TestCase):
         res2 = perform_login("random_of_course", "Ladidadida")
         self.assertTrue(res2.success)
 
+
+    def test_perform_login_rejects_after_failures(self):
+        register_user("random@randomness.ran", "random_of_course", "Ladidadida")
+        auth_admission.init_limits(login_failures_per_username=3)
+        try:
+            for _ in range(3):
+                self.assertEqual(perform_login("random_of_course", "wrong password").message, "Wrong password!")
+            res = perform_login("random_of_course", "Ladidadida")
+            self.assertFalse(res.success)
+            self.assertIsInstance(res.exception, AdmissionRejected)
+            self.assertNotIsInstance(perform_login("someone_else", "Ladidadida").exception, AdmissionRejected)
+        finally:
+            auth_admission.init_app(self.app)
+
+    def test_perform_login_rehashes_old_hashes(self):
+        register_user("random@randomness.ran", "random_of_course", "Ladidadida")
+        user = User.query.filter_by(username="random_of_course").one()
+        user.password_hash = generate_password_hash("Ladidadida", "pbkdf2")
+        db.session.commit()
+
+        self.assertTrue(perform_login("random_of_course", "Ladidadida").success)
+        user = User.query.filter_by(username="random_of_course").one()
+        self.assertTrue(user.password_hash.startswith("scrypt:"))
+        self.assertTrue(user.check_password("Ladidadida"))
+
+    def test_find_taken_fields(self):
+        register_user("jack@email.com", "Jack", "Ladidadida")
+        register_user("jill@email.com", "Jill", "Ladidadida")
+        self.assertEqual(find_taken_fields("new@email.com", "New"), [])
+        self.assertEqual(find_taken_fields("new@email.com", "Jack"), ["username"])
+        self.assertEqual(find_taken_fields("jack@email.com", "New"), ["email"])
+        self.assertEqual(find_taken_fields("jill@email.com", "Jack"), ["username", "email"])
+
+    def test_register_user_reports_taken_field(self):
+        register_user("jack@email.com", "Jack", "Ladidadida")
+        res = register_user("other@email.com", "Jack", "Ladidadida")
+        self.assertEqual(res.message, "Username Jack is already taken!")
+        self.assertIsInstance(res.exception, IntegrityError)
+        res = register_user("jack@email.com", "Other", "Ladidadida")
+        self.assertEqual(res.message, "Account registered on jack@email.com already exists!")
+
+    def test_concurrent_registrations_create_no_duplicates(self):
+        threads_count = 8
+        barrier = Barrier(threads_count)
+        results = []
+        def register(i):
+            with self.app.app_context():
+                barrier.wait()
+                # half of the threads compete for one username, the other half for one email
+                if i % 2:
+                    results.append(register_user(f"user{i}@email.com", "same_username", "Ladidadida"))
+                else:
+                    results.append(register_user("same@email.com", f"user{i}", "Ladidadida"))
+
+        threads = [Thread(target=register, args=(i,)) for i in range(threads_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sum(result.success for result in results), 2)
+        for result in results:
+            if not result.success:
+                self.assertIsInstance(result.exception, IntegrityError)
+                self.assertIn(result.message, ["Username same_username is already taken!",
+                                               "Account registered on same@email.com already exists!"])
+        self.assertEqual(User.query.count(), 2)
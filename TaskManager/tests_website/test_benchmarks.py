@@ -0,0 +1,75 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+import os
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import close_all_sessions
+from ..website import db, create_app, TEST_DATABASE_PATH
+from ..website.db_models import Task
+from ..website.task_cache import task_list_cache
+from ..website.user_cache import user_cache
+from ..benchmarks.runner import ScenarioResult, compare_with_baseline, percentile, prepare_users, run_client
+from ..benchmarks.scenarios import SCENARIOS
+from ..benchmarks.seed import SeedConfig, seed_database
+
+
+class TestBenchmarks(TestCase):
+    """The benchmark suite itself is not run by the tests, only checked on a tiny database"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app(test=True)
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+
+    @classmethod
+    def tearDownClass(cls):
+        close_all_sessions()
+        db.drop_all()
+        if os.path.exists(TEST_DATABASE_PATH):
+            os.remove(TEST_DATABASE_PATH)
+            print(f"Removed test database from {TEST_DATABASE_PATH}")
+        cls.app_context.pop()
+
+    def setUp(self):
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+        task_list_cache.clear()
+        user_cache.clear()
+
+    def test_seed_builds_trees(self):
+        user_ids = seed_database(SeedConfig(tasks=30, users=3, tree_size=5, branching=1))
+        self.assertEqual(len(user_ids), 3)
+        self.assertEqual(db.session.scalar(select(func.count()).select_from(Task)), 30)
+        roots = db.session.scalar(select(func.count()).select_from(Task).where(Task.parent_task_id.is_(None)))
+        self.assertEqual(roots, 6)
+        # chains: every task of a tree but the root is the child of the previous one
+        tasks = db.session.execute(select(Task.id, Task.parent_task_id).order_by(Task.id).limit(5)).all()
+        self.assertEqual([parent for _, parent in tasks], [None] + [task_id for task_id, _ in tasks[:4]])
+
+    def test_every_scenario_runs_without_errors(self):
+        user_ids = seed_database(SeedConfig(tasks=40, users=2, tree_size=10))
+        users = prepare_users(user_ids)
+        # run outside the app context of the test case, which requests of all the users would share
+        with ThreadPoolExecutor(1) as executor:
+            results = executor.submit(run_client, self.app, users, SCENARIOS, 3, 1).result()
+        # scenarios measured during other requests need a server
+        self.assertEqual([result.name for result in results],
+                         [scenario.name for scenario in SCENARIOS if scenario.during is None])
+        for result in results:
+            self.assertEqual(result.errors, 0, result.name)
+            self.assertIsNotNone(result.queries_per_request)
+
+    def test_compare_with_baseline(self):
+        baseline = {"results": {"list": {"p95_ms": 10.0, "requests_per_second": 100.0, "queries_per_request": 2}}}
+        same = ScenarioResult("list", 100, 0, 5.0, 11.0, 12.0, 95.0, 2)
+        self.assertEqual(compare_with_baseline([same], baseline, tolerance=0.25), [])
+        regressed = ScenarioResult("list", 100, 0, 5.0, 20.0, 25.0, 50.0, 3)
+        self.assertEqual(len(compare_with_baseline([regressed], baseline, tolerance=0.25)), 3)
+
+    def test_percentile(self):
+        values = [float(value) for value in range(1, 101)]
+        self.assertEqual(percentile(values, 0.5), 50)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile([], 0.5), 0.0)
@@ -0,0 +1,120 @@
+from datetime import date, datetime, timedelta
+from unittest import TestCase
+import os
+
+from sqlalchemy import delete, inspect, select
+from sqlalchemy.orm import close_all_sessions
+from ..website import db, create_app, TEST_DATABASE_PATH
+from ..website.db_migrations import upgrade_database, get_schema_version, pending_migrations, latest_version, \
+    TASK_INDEXES
+from ..website.db_models import SchemaMigration, Task, User
+from ..website.db_operations import try_add_new_task, try_getting_task_stats
+from ..website.models.requests import AddTaskRequestModel, TaskStatsRequestModel
+
+
+class TestDbMigrations(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app(test=True)
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+
+    @classmethod
+    def tearDownClass(cls):
+        close_all_sessions()
+        db.drop_all()
+        if os.path.exists(TEST_DATABASE_PATH):
+            os.remove(TEST_DATABASE_PATH)
+            print(f"Removed test database from {TEST_DATABASE_PATH}")
+        cls.app_context.pop()
+
+    def setUp(self):
+        for table in reversed(db.metadata.sorted_tables):
+            if table is not SchemaMigration.__table__:
+                db.session.execute(table.delete())
+        db.session.execute(User.__table__.insert(), [
+            {"id": 42, "email": "user42@test.com", "username": "user42", "password_hash": ""}
+        ])
+        db.session.commit()
+        upgrade_database()  # other test cases empty schema_migration
+
+        self.request_ctx = self.app.test_request_context()
+        self.request_ctx.push()
+
+    def tearDown(self):
+        self.request_ctx.pop()
+
+    def _add_task(self) -> int:
+        task_data = AddTaskRequestModel(
+            title="Test task", importance=10, deadline=datetime.now(), est_time_days=12, description="Test"
+        )
+        res = try_add_new_task(task_data, 42)
+        self.assertTrue(res.success)
+        return int(res.message)
+
+    def _rewind_to(self, version: int):
+        """Makes the database look like it was migrated only up to given version"""
+        db.session.execute(delete(SchemaMigration).where(SchemaMigration.version > version))
+        db.session.commit()
+
+    def test_database_is_at_latest_version(self):
+        self.assertEqual(get_schema_version(), latest_version())
+        self.assertEqual(pending_migrations(), [])
+        self.assertEqual(upgrade_database(), [])
+
+    def test_upgrade_database_to_target_version(self):
+        self._rewind_to(0)
+        self.assertEqual(len(pending_migrations()), latest_version())
+
+        self.assertEqual(upgrade_database(2), [1, 2])
+        self.assertEqual(get_schema_version(), 2)
+        self.assertEqual(upgrade_database(), list(range(3, latest_version() + 1)))
+
+    def test_upgrade_database_fills_task_counts(self):
+        self._add_task()
+        db.session.execute(db.text("DROP TABLE task_daily_count"))
+        db.session.commit()
+        self._rewind_to(4)
+
+        self.assertEqual(upgrade_database(), list(range(5, latest_version() + 1)))
+        stats = try_getting_task_stats(42, TaskStatsRequestModel(date_from=date(2000, 1, 1), date_to=date(2100, 1, 1)))
+        self.assertEqual(stats.stats["total"], 1)
+
+    def test_upgrade_database_adds_and_backfills_columns(self):
+        task_id = self._add_task()
+        db.session.execute(db.text("DROP INDEX ix_task_user_id_start_date"))
+        db.session.execute(db.text("ALTER TABLE task DROP COLUMN start_date"))
+        db.session.commit()
+        self._rewind_to(1)
+
+        upgrade_database()
+        deadline, est_time_days, start_date = db.session.execute(
+            select(Task.deadline, Task.est_time_days, Task.start_date).where(Task.id == task_id)
+        ).one()
+        self.assertEqual(start_date, deadline - timedelta(days=est_time_days))
+        index_names = {index["name"] for index in inspect(db.engine).get_indexes("task")}
+        self.assertIn("ix_task_user_id_start_date", index_names)
+
+    def test_upgrade_database_is_idempotent(self):
+        db.session.execute(db.text("DROP INDEX ix_task_user_id_deadline"))
+        db.session.commit()
+        self._rewind_to(0)
+
+        upgrade_database()
+        self._rewind_to(0)
+        upgrade_database()
+        index_names = {index["name"] for index in inspect(db.engine).get_indexes("task")}
+        for expected in TASK_INDEXES:
+            self.assertIn(expected, index_names)
+
+    def test_migration_commands(self):
+        self._rewind_to(3)
+        runner = self.app.test_cli_runner()
+
+        result = runner.invoke(args=["db-version"])
+        self.assertIn("Schema version: 3", result.output)
+        self.assertIn("Pending migration 4", result.output)
+        result = runner.invoke(args=["db-upgrade"])
+        self.assertIn("Applied migration 4", result.output)
+        self.assertEqual(get_schema_version(), latest_version())
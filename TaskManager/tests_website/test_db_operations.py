@@ -1,14 +1,26 @@
-from datetime import datetime
+from datetime import date, datetime, timedelta
 from unittest import TestCase
 import os
+import random
+import re
 
 from pydantic import ValidationError
+from sqlalchemy import event, select
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.orm import close_all_sessions
 from ..website import db, create_app, TEST_DATABASE_PATH
 from ..website.db_operations import try_getting_user_tasks, try_add_new_task, try_getting_specific_task, \
-    try_removing_specific_task, try_editing_specific_task
-from ..website.models.requests import AddTaskRequestModel, EditTaskRequestModel
+    try_removing_specific_task, try_editing_specific_task, try_getting_user_tasks_page, try_importing_tasks, \
+    iter_user_tasks, try_getting_task_revision, try_getting_task_tree, try_removing_task_subtree, try_moving_task, \
+    try_getting_tasks_in_range, try_searching_tasks, try_setting_task_status, try_getting_task_stats, \
+    reconcile_task_counts, try_running_batch, try_patching_task, try_getting_most_urgent_tasks, \
+    IMPORT_MAX_ERRORS
+from ..website.db_models import Task, TaskDailyCount, User
+from ..website.utils.ranking import urgency
+from ..website.models.requests import AddTaskRequestModel, EditTaskRequestModel, ListTasksRequestModel, \
+    TaskTreeRequestModel, MoveTaskRequestModel, CalendarRangeRequestModel, SearchTasksRequestModel, \
+    SetTaskStatusRequestModel, TaskStatsRequestModel, BatchRequestModel, PatchTaskRequestModel, \
+    UrgentTasksRequestModel
 
 
 class TestDbOperations(TestCase):
@@ -34,6 +46,11 @@ class TestDbOperations(TestCase):
     def setUp(self):
         for table in reversed(db.metadata.sorted_tables):
             db.session.execute(table.delete())
+        # owners of the tasks used in tests, databases like PostgreSQL enforce the foreign key
+        db.session.execute(User.__table__.insert(), [
+            {"id": user_id, "email": f"user{user_id}@test.com", "username": f"user{user_id}", "password_hash": ""}
+            for user_id in [42, 43]
+        ])
         db.session.commit()
 
         self.request_ctx = self.app.test_request_context()
@@ -264,4 +281,551 @@ class TestDbOperations(TestCase):
         test_user_id = 42
         res1 = try_editing_specific_task(test_user_id, edit_request)
         self.assertFalse(res1.success)
-        self.assertIsInstance(res1.exception, NoResultFound)
\ No newline at end of file
+        self.assertIsInstance(res1.exception, NoResultFound)
+
+    def test_try_patching_task(self):
+        task_data = AddTaskRequestModel(title="Patched", importance=4, deadline=datetime(2030, 1, 10, 12),
+                                        est_time_days=3, description="Before")
+        task_id = int(try_add_new_task(task_data, 42).message)
+
+        res = try_patching_task(42, PatchTaskRequestModel(task_id=task_id, title="Renamed"))
+        self.assertTrue(res.success)
+        task = try_getting_specific_task(42, task_id).task
+        self.assertEqual((task["title"], task["importance"], task["description"]), ("Renamed", 4, "Before"))
+
+        self.assertTrue(try_patching_task(42, PatchTaskRequestModel(task_id=task_id, est_time_days=5)).success)
+        self.assertEqual(db.session.scalar(select(Task.start_date).where(Task.id == task_id)), datetime(2030, 1, 5, 12))
+        patch = PatchTaskRequestModel(task_id=task_id, deadline=datetime(2030, 2, 10, 12), status="done",
+                                      description=None)
+        self.assertTrue(try_patching_task(42, patch).success)
+        task = try_getting_specific_task(42, task_id).task
+        self.assertEqual((task["deadline"], task["status"], task["description"], task["est_time_days"]),
+                         (datetime(2030, 2, 10, 12), "done", None, 5))
+        self.assertEqual(db.session.scalar(select(Task.start_date).where(Task.id == task_id)), datetime(2030, 2, 5, 12))
+        self.assertEqual(self._stats(42)["by_status"], {"todo": 0, "in_progress": 0, "done": 1})
+        self.assertEqual(reconcile_task_counts(), 0)
+
+        res = try_patching_task(43, PatchTaskRequestModel(task_id=task_id, title="Not mine"))
+        self.assertFalse(res.success)
+        self.assertIsInstance(res.exception, NoResultFound)
+        self.assertIsInstance(try_patching_task(42, {"task_id": task_id}).exception, TypeError)
+
+    def test_PatchTaskRequestModel_validation(self):
+        self.assertEqual(PatchTaskRequestModel(task_id=1, est_time_days=None).changes(), {"est_time_days": None})
+        with self.assertRaises(ValidationError):
+            PatchTaskRequestModel(task_id=1)
+        with self.assertRaises(ValidationError):
+            PatchTaskRequestModel(task_id=1, title=None)
+
+    def test_removing_task_keeps_its_subtasks(self):
+        task_data = AddTaskRequestModel(title="Parent", importance=1, deadline=datetime(2030, 1, 1),
+                                        est_time_days=None, description=None)
+        parent_id = int(try_add_new_task(task_data, 42).message)
+        child_id = int(try_add_new_task(task_data, 42, parent_task_id=parent_id).message)
+
+        res = try_removing_specific_task(42, parent_id)
+        self.assertEqual(res.message, "Parent")
+        self.assertIsNone(try_getting_specific_task(42, child_id).task["parent_task_id"])
+        self.assertIsInstance(try_removing_specific_task(42, parent_id).exception, NoResultFound)
+
+    def test_single_statement_writes_do_not_read_tasks(self):
+        task_data = AddTaskRequestModel(title="Hot", importance=1, deadline=datetime(2030, 1, 1),
+                                        est_time_days=None, description=None)
+        task_id = int(try_add_new_task(task_data, 42).message)
+        child_id = int(try_add_new_task(task_data, 42, parent_task_id=task_id).message)
+        edit_request = EditTaskRequestModel(task_id=task_id, title="Hotter", importance=2,
+                                            deadline=datetime(2030, 2, 1, 8, 30, 0, 250), est_time_days=2,
+                                            description=None, status="in_progress")
+        writes = [
+            lambda: try_patching_task(42, PatchTaskRequestModel(task_id=task_id, title="Still hot")),
+            lambda: try_editing_specific_task(42, edit_request),
+            lambda: try_patching_task(42, PatchTaskRequestModel(task_id=task_id, est_time_days=3)),
+            lambda: try_setting_task_status(42, SetTaskStatusRequestModel(task_id=task_id, status="done")),
+            lambda: try_removing_specific_task(42, task_id),
+        ]
+        for write in writes:
+            statements = []
+            record = lambda conn, cursor, statement, *args: statements.append(statement.lstrip().upper())
+            event.listen(db.engine, "before_cursor_execute", record)
+            try:
+                self.assertTrue(write().success)
+            finally:
+                event.remove(db.engine, "before_cursor_execute", record)
+            self.assertFalse([statement for statement in statements if statement.startswith("SELECT")])
+            # one statement reads and writes the task, the rest are upserts of counts and of the revision
+            self.assertEqual(len([statement for statement in statements if re.search(r"\bTASK\b", statement)]), 1)
+            if write is writes[2]:
+                start_date = db.session.scalar(select(Task.start_date).where(Task.id == task_id))
+                self.assertEqual(start_date, datetime(2030, 1, 29, 8, 30, 0, 250))
+        self.assertIsNone(try_getting_specific_task(42, child_id).task["parent_task_id"])
+        self.assertEqual(reconcile_task_counts(), 0)
+
+    def _add_numbered_tasks(self, user_id, count):
+        base_deadline = datetime(2030, 1, 1)
+        for i in range(count):
+            task_data = AddTaskRequestModel(
+                title=f"Task number {i}",
+                importance=i % 3,
+                deadline=base_deadline + timedelta(days=count - i),
+                est_time_days=1,
+                description=None
+            )
+            self.assertTrue(try_add_new_task(task_data, user_id).success)
+
+    def _collect_all_pages(self, user_id, list_request):
+        collected = []
+        while True:
+            res = try_getting_user_tasks_page(user_id, list_request)
+            self.assertTrue(res.success)
+            collected.extend(res.tasks)
+            if res.next_cursor is None:
+                return collected
+            list_request.cursor = res.next_cursor
+
+    def test_try_getting_user_tasks_page_walks_all_pages(self):
+        test_user_id = 42
+        self._add_numbered_tasks(test_user_id, 7)
+        self._add_numbered_tasks(test_user_id + 1, 3)
+
+        for sort_by in ["id", "deadline", "importance"]:
+            for descending in [False, True]:
+                list_request = ListTasksRequestModel(limit=3, sort_by=sort_by, descending=descending)
+                tasks = self._collect_all_pages(test_user_id, list_request)
+                keys = [(task[sort_by if sort_by != "id" else "task_id"], task["task_id"]) for task in tasks]
+                self.assertEqual(len(tasks), 7)
+                self.assertEqual(keys, sorted(keys, reverse=descending))
+                self.assertTrue(all(task["user_id"] == test_user_id for task in tasks))
+
+    def test_try_getting_user_tasks_page_filters(self):
+        test_user_id = 42
+        self._add_numbered_tasks(test_user_id, 9)
+
+        res = try_getting_user_tasks_page(test_user_id, ListTasksRequestModel(importance_min=1, importance_max=1))
+        self.assertTrue(res.success)
+        self.assertEqual(len(res.tasks), 3)
+        self.assertTrue(all(task["importance"] == 1 for task in res.tasks))
+
+        res = try_getting_user_tasks_page(test_user_id, ListTasksRequestModel(
+            deadline_from=datetime(2030, 1, 3), deadline_to=datetime(2030, 1, 5)))
+        self.assertEqual(sorted(task["deadline"].day for task in res.tasks), [3, 4])
+
+        res = try_getting_user_tasks_page(test_user_id, ListTasksRequestModel(title_contains="number 1"))
+        self.assertEqual([task["title"] for task in res.tasks], ["Task number 1"])
+
+        res = try_getting_user_tasks_page(test_user_id, ListTasksRequestModel(title_contains="%"))
+        self.assertEqual(res.tasks, [])
+
+    def test_try_getting_user_tasks_page_bad_cursor(self):
+        res = try_getting_user_tasks_page(42, ListTasksRequestModel(cursor="definitely not a cursor"))
+        self.assertFalse(res.success)
+        self.assertIsInstance(res.exception, ValueError)
+
+        self._add_numbered_tasks(42, 2)
+        res = try_getting_user_tasks_page(42, ListTasksRequestModel(limit=1, sort_by="deadline"))
+        res = try_getting_user_tasks_page(42, ListTasksRequestModel(sort_by="importance", cursor=res.next_cursor))
+        self.assertFalse(res.success)
+        self.assertIsInstance(res.exception, ValueError)
+
+    def test_reads_do_not_load_orm_instances(self):
+        self._add_numbered_tasks(42, 5)
+        expected = [task.to_dict() for task in db.session.scalars(select(Task).order_by(Task.id))]
+        db.session.expunge_all()
+
+        self.assertEqual(sorted(try_getting_user_tasks(42).tasks, key=lambda task: task["task_id"]), expected)
+        self.assertEqual(try_getting_user_tasks_page(42, ListTasksRequestModel()).tasks, expected)
+        self.assertEqual(try_getting_specific_task(42, expected[2]["task_id"]).task, expected[2])
+        self.assertEqual(list(iter_user_tasks(42, chunk_size=2)), expected)
+        self.assertEqual(len(db.session.identity_map), 0)
+
+    def test_try_importing_tasks_in_chunks(self):
+        test_user_id = 42
+        records = []
+        for i in range(25):
+            record = {"title": f"Imported {i}", "importance": i, "deadline": "2030-01-01T00:00:00",
+                      "est_time_days": None, "description": None}
+            records.append((i + 1, record))
+        records.insert(10, (100, {"title": "Missing everything"}))
+        records.insert(20, (101, ValueError("Could not parse")))
+
+        res = try_importing_tasks(records, test_user_id, chunk_size=4)
+        self.assertTrue(res.success)
+        self.assertEqual(res.imported, 25)
+        self.assertEqual(len(res.errors), 2)
+        self.assertEqual(res.rejected, 2)
+        self.assertTrue(res.errors[0].startswith("line 100"))
+
+        exported = list(iter_user_tasks(test_user_id, chunk_size=7))
+        self.assertEqual([task["title"] for task in exported], [f"Imported {i}" for i in range(25)])
+        self.assertTrue(all(task["user_id"] == test_user_id for task in exported))
+        self.assertEqual(list(iter_user_tasks(test_user_id + 1)), [])
+
+    def test_iter_user_tasks_holds_no_transaction_between_chunks(self):
+        self._add_numbered_tasks(42, 5)
+        exported = iter_user_tasks(42, chunk_size=2)
+        for _ in range(3):
+            next(exported)
+            self.assertFalse(db.session().in_transaction())
+        self.assertEqual(len(list(exported)), 2)
+
+    def test_try_importing_tasks_limits_errors(self):
+        records = [(i + 1, {"title": "Invalid"}) for i in range(IMPORT_MAX_ERRORS + 50)]
+        res = try_importing_tasks(records, 42)
+        self.assertTrue(res.success)
+        self.assertEqual(res.imported, 0)
+        self.assertEqual(res.rejected, IMPORT_MAX_ERRORS + 50)
+        self.assertEqual(len(res.errors), IMPORT_MAX_ERRORS)
+
+    def test_try_importing_tasks_wrong_arg(self):
+        res = try_importing_tasks([], "cat")
+        self.assertFalse(res.success)
+        self.assertIsInstance(res.exception, TypeError)
+
+    def test_try_getting_task_revision(self):
+        test_user_id = 42
+        revisions = [try_getting_task_revision(test_user_id).message]
+        task_data = AddTaskRequestModel(
+            title="Test task",
+            importance=10,
+            deadline=datetime.now(),
+            est_time_days=12,
+            description=None
+        )
+        task_id = int(try_add_new_task(task_data, test_user_id).message)
+        revisions.append(try_getting_task_revision(test_user_id).message)
+        edit_request = EditTaskRequestModel(task_id=task_id, **task_data.model_dump())
+        try_editing_specific_task(test_user_id, edit_request)
+        revisions.append(try_getting_task_revision(test_user_id).message)
+        try_removing_specific_task(test_user_id, task_id)
+        revisions.append(try_getting_task_revision(test_user_id).message)
+        try_importing_tasks([(1, task_data.model_dump())], test_user_id)
+        revisions.append(try_getting_task_revision(test_user_id).message)
+
+        self.assertEqual(revisions, ["0", "1", "2", "3", "4"])
+        self.assertEqual(try_getting_task_revision(test_user_id + 1).message, "0")
+
+    def _build_tree(self, user_id):
+        """root -> (a -> (a1 -> a11), b), other_root. Returns ids by name"""
+        ids = {}
+        for name, parent in [("root", None), ("a", "root"), ("b", "root"), ("a1", "a"), ("a11", "a1"),
+                             ("other_root", None)]:
+            task_data = AddTaskRequestModel(title=name, importance=1, deadline=datetime(2030, 1, 1),
+                                            est_time_days=None, description=None)
+            res = try_add_new_task(task_data, user_id, ids.get(parent))
+            self.assertTrue(res.success)
+            ids[name] = int(res.message)
+        return ids
+
+    def _titles(self, nodes):
+        return [(node["title"], self._titles(node["children"])) for node in nodes]
+
+    def test_try_getting_task_tree(self):
+        test_user_id = 42
+        ids = self._build_tree(test_user_id)
+        self._build_tree(test_user_id + 1)
+
+        statements = []
+        record = lambda *args: statements.append(args[2])
+        event.listen(db.engine, "before_cursor_execute", record)
+        res = try_getting_task_tree(test_user_id, TaskTreeRequestModel())
+        event.remove(db.engine, "before_cursor_execute", record)
+        self.assertTrue(res.success)
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(self._titles(res.tasks), [
+            ("root", [("a", [("a1", [("a11", [])])]), ("b", [])]),
+            ("other_root", [])
+        ])
+
+        res = try_getting_task_tree(test_user_id, TaskTreeRequestModel(task_id=ids["a"]))
+        self.assertEqual(self._titles(res.tasks), [("a", [("a1", [("a11", [])])])])
+
+        res = try_getting_task_tree(test_user_id, TaskTreeRequestModel(task_id=ids["root"], max_depth=1))
+        self.assertEqual(self._titles(res.tasks), [("root", [("a", []), ("b", [])])])
+
+        res = try_getting_task_tree(test_user_id + 1, TaskTreeRequestModel(task_id=ids["root"]))
+        self.assertFalse(res.success)
+        self.assertIsInstance(res.exception, NoResultFound)
+
+    def test_try_removing_task_subtree(self):
+        test_user_id = 42
+        ids = self._build_tree(test_user_id)
+
+        res = try_removing_task_subtree(test_user_id + 1, ids["a"])
+        self.assertFalse(res.success)
+        self.assertIsInstance(res.exception, NoResultFound)
+
+        res = try_removing_task_subtree(test_user_id, ids["a"])
+        self.assertTrue(res.success)
+        self.assertEqual(res.message, "3")
+        res = try_getting_task_tree(test_user_id, TaskTreeRequestModel())
+        self.assertEqual(self._titles(res.tasks), [("root", [("b", [])]), ("other_root", [])])
+
+    def test_try_moving_task(self):
+        test_user_id = 42
+        ids = self._build_tree(test_user_id)
+
+        res = try_moving_task(test_user_id, MoveTaskRequestModel(task_id=ids["a1"], new_parent_task_id=ids["b"]))
+        self.assertTrue(res.success)
+        res = try_moving_task(test_user_id, MoveTaskRequestModel(task_id=ids["other_root"],
+                                                                 new_parent_task_id=ids["a"]))
+        self.assertTrue(res.success)
+        res = try_moving_task(test_user_id, MoveTaskRequestModel(task_id=ids["root"]))
+        self.assertTrue(res.success)
+        res = try_getting_task_tree(test_user_id, TaskTreeRequestModel())
+        self.assertEqual(self._titles(res.tasks), [
+            ("root", [("a", [("other_root", [])]), ("b", [("a1", [("a11", [])])])])
+        ])
+
+        # moving into own subtree would create a cycle
+        res = try_moving_task(test_user_id, MoveTaskRequestModel(task_id=ids["b"], new_parent_task_id=ids["a11"]))
+        self.assertFalse(res.success)
+        self.assertIsInstance(res.exception, ValueError)
+        res = try_moving_task(test_user_id, MoveTaskRequestModel(task_id=ids["b"], new_parent_task_id=ids["b"]))
+        self.assertIsInstance(res.exception, ValueError)
+
+        other_ids = self._build_tree(test_user_id + 1)
+        res = try_moving_task(test_user_id, MoveTaskRequestModel(task_id=ids["b"],
+                                                                 new_parent_task_id=other_ids["root"]))
+        self.assertIsInstance(res.exception, ValueError)
+        res = try_moving_task(test_user_id, MoveTaskRequestModel(task_id=other_ids["b"]))
+        self.assertIsInstance(res.exception, NoResultFound)
+
+    def test_try_getting_tasks_in_range(self):
+        test_user_id = 42
+        ids = {}
+        # name: (deadline day of January 2030, est_time_days)
+        for name, (day, est_time_days) in {"long": (20, 15), "early": (3, 1), "inside": (12, 2), "late": (28, 2),
+                                           "no_estimate": (10, None), "ends_at_start": (8, 1)}.items():
+            task_data = AddTaskRequestModel(title=name, importance=1, deadline=datetime(2030, 1, day),
+                                            est_time_days=est_time_days, description=None)
+            ids[name] = int(try_add_new_task(task_data, test_user_id).message)
+        task_data.deadline = datetime(2030, 1, 11)
+        try_add_new_task(task_data, test_user_id + 1)
+
+        range_request = CalendarRangeRequestModel(start=datetime(2030, 1, 8), end=datetime(2030, 1, 15))
+        res = try_getting_tasks_in_range(test_user_id, range_request)
+        self.assertTrue(res.success)
+        self.assertEqual([task["title"] for task in res.tasks], ["long", "ends_at_start", "inside", "no_estimate"])
+        self.assertEqual(res.tasks[0]["start_date"], datetime(2030, 1, 5))
+        lanes = {task["title"]: task["lane"] for task in res.tasks}
+        self.assertNotEqual(lanes["long"], lanes["inside"])
+        self.assertNotEqual(lanes["long"], lanes["no_estimate"])
+
+        # editing the estimate moves the start of the task
+        edit_request = EditTaskRequestModel(task_id=ids["late"], title="late", importance=1,
+                                            deadline=datetime(2030, 1, 28), est_time_days=20, description=None)
+        try_editing_specific_task(test_user_id, edit_request)
+        res = try_getting_tasks_in_range(test_user_id, range_request)
+        self.assertIn("late", [task["title"] for task in res.tasks])
+
+    def test_CalendarRangeRequestModel_validation(self):
+        with self.assertRaises(ValidationError):
+            CalendarRangeRequestModel(start=datetime(2030, 1, 8), end=datetime(2030, 1, 8))
+
+    def _search_titles(self, user_id, query):
+        res = try_searching_tasks(user_id, SearchTasksRequestModel(query=query))
+        self.assertTrue(res.success)
+        return [task["title"] for task in res.tasks]
+
+    def test_try_searching_tasks(self):
+        test_user_id = 42
+        ids = {}
+        for title, description in [("Buy groceries", "milk, eggs and bread"),
+                                   ("Bake bread", None),
+                                   ("Write report", "quarterly numbers for the bakery")]:
+            task_data = AddTaskRequestModel(title=title, importance=1, deadline=datetime(2030, 1, 1),
+                                            est_time_days=None, description=description)
+            ids[title] = int(try_add_new_task(task_data, test_user_id).message)
+        try_add_new_task(task_data, test_user_id + 1)
+
+        # title matches rank higher than description matches
+        self.assertEqual(self._search_titles(test_user_id, "bread"), ["Bake bread", "Buy groceries"])
+        # prefix matching, all words have to match
+        self.assertEqual(self._search_titles(test_user_id, "bak"), ["Bake bread", "Write report"])
+        self.assertEqual(self._search_titles(test_user_id, "bak quart"), ["Write report"])
+        self.assertEqual(self._search_titles(test_user_id + 1, "report"), ["Write report"])
+        # FTS syntax in user input is treated as plain words
+        self.assertEqual(self._search_titles(test_user_id, 'bread" OR NEAR(report'), [])
+
+        res = try_searching_tasks(test_user_id, SearchTasksRequestModel(query="eggs"))
+        self.assertEqual(res.tasks[0]["snippet"], "milk, [eggs] and bread")
+        self.assertEqual(res.tasks[0]["deadline"], datetime(2030, 1, 1))
+
+        edit_request = EditTaskRequestModel(task_id=ids["Bake bread"], title="Bake cake", importance=1,
+                                            deadline=datetime(2030, 1, 1), est_time_days=None, description=None)
+        try_editing_specific_task(test_user_id, edit_request)
+        try_removing_specific_task(test_user_id, ids["Buy groceries"])
+        self.assertEqual(self._search_titles(test_user_id, "bread"), [])
+        self.assertEqual(self._search_titles(test_user_id, "cake"), ["Bake cake"])
+
+        res = try_searching_tasks(test_user_id, SearchTasksRequestModel(query="?!"))
+        self.assertIsInstance(res.exception, ValueError)
+
+    def test_rebuild_search_index_command(self):
+        if db.engine.dialect.name != "sqlite":
+            self.skipTest("The FTS5 index exists only in SQLite")
+        task_data = AddTaskRequestModel(title="Searchable", importance=1, deadline=datetime(2030, 1, 1),
+                                        est_time_days=None, description=None)
+        try_add_new_task(task_data, 42)
+        db.session.execute(db.text("INSERT INTO task_fts (task_fts) VALUES ('delete-all')"))
+        db.session.commit()
+        self.assertEqual(self._search_titles(42, "searchable"), [])
+
+        result = self.app.test_cli_runner().invoke(args=["rebuild-search-index"])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(self._search_titles(42, "searchable"), ["Searchable"])
+
+    def _stats(self, user_id, date_from=date(2030, 1, 1), date_to=date(2030, 12, 31)):
+        res = try_getting_task_stats(user_id, TaskStatsRequestModel(date_from=date_from, date_to=date_to))
+        self.assertTrue(res.success)
+        return res.stats
+
+    def test_try_getting_most_urgent_tasks(self):
+        now = datetime(2030, 1, 1)
+        rng = random.Random(5)
+        task_ids = []
+        for i in range(60):
+            task_data = AddTaskRequestModel(title=f"Ranked {i}", importance=rng.randint(0, 10),
+                                            deadline=now + timedelta(days=rng.randint(-5, 90), hours=i),
+                                            est_time_days=rng.choice([None, 1, 5, 20]), description=None)
+            task_ids.append(int(try_add_new_task(task_data, 42).message))
+        for task_id in task_ids[:10]:
+            try_setting_task_status(42, SetTaskStatusRequestModel(task_id=task_id, status="done"))
+
+        open_tasks = [task for task in try_getting_user_tasks(42).tasks if task["status"] != "done"]
+        expected = sorted(open_tasks, key=lambda task: -urgency(
+            task["importance"], task["deadline"] - timedelta(days=task["est_time_days"] or 0), now))
+        for limit in [1, 7, 50, 100]:
+            res = try_getting_most_urgent_tasks(42, UrgentTasksRequestModel(limit=limit), now=now, batch_size=4)
+            self.assertTrue(res.success)
+            self.assertEqual([task["urgency"] for task in res.tasks],
+                             [round(urgency(task["importance"], task["deadline"] - timedelta(
+                                 days=task["est_time_days"] or 0), now), 4) for task in expected[:limit]])
+        self.assertEqual(try_getting_most_urgent_tasks(43, UrgentTasksRequestModel()).tasks, [])
+        self.assertIsInstance(try_getting_most_urgent_tasks(42, {"limit": 3}).exception, TypeError)
+
+    def test_task_stats_follow_changes_of_tasks(self):
+        test_user_id = 42
+        ids = []
+        for day, importance in [(1, 5), (1, 5), (2, 3), (20, 3)]:
+            task_data = AddTaskRequestModel(title="Stat", importance=importance, deadline=datetime(2030, 1, day, 12),
+                                            est_time_days=None, description=None)
+            ids.append(int(try_add_new_task(task_data, test_user_id).message))
+        try_add_new_task(task_data, test_user_id + 1)
+
+        stats = self._stats(test_user_id)
+        self.assertEqual(stats["total"], 4)
+        self.assertEqual(stats["by_status"], {"todo": 4, "in_progress": 0, "done": 0})
+        self.assertEqual([row["importance"] for row in stats["by_importance"]], [5, 3])
+        self.assertEqual(self._stats(test_user_id, date(2030, 1, 1), date(2030, 1, 2))["total"], 3)
+
+        self.assertTrue(try_setting_task_status(test_user_id, SetTaskStatusRequestModel(task_id=ids[0], status="done")).success)
+        self.assertTrue(try_setting_task_status(test_user_id, SetTaskStatusRequestModel(task_id=ids[1], status="in_progress")).success)
+        edit_request = EditTaskRequestModel(task_id=ids[2], title="Stat", importance=7, deadline=datetime(2031, 1, 1),
+                                            est_time_days=None, description=None)
+        try_editing_specific_task(test_user_id, edit_request)
+        try_removing_specific_task(test_user_id, ids[3])
+
+        stats = self._stats(test_user_id)
+        self.assertEqual(stats["by_status"], {"todo": 0, "in_progress": 1, "done": 1})
+        self.assertEqual(stats["by_importance"], [{"importance": 5, "todo": 0, "in_progress": 1, "done": 1}])
+        self.assertEqual(self._stats(test_user_id, date(2031, 1, 1), date(2031, 1, 1))["by_importance"],
+                         [{"importance": 7, "todo": 1, "in_progress": 0, "done": 0}])
+
+        try_removing_task_subtree(test_user_id, ids[0])
+        try_importing_tasks([(1, {"title": "Imported", "importance": 5, "deadline": "2030-01-01T00:00:00",
+                                  "est_time_days": None, "description": None, "status": "done"})], test_user_id)
+        self.assertEqual(self._stats(test_user_id)["by_status"], {"todo": 0, "in_progress": 1, "done": 1})
+        self.assertEqual(reconcile_task_counts(), 0)
+
+    def test_setting_the_same_status_changes_nothing(self):
+        task_data = AddTaskRequestModel(title="Done already", importance=1, deadline=datetime(2030, 1, 1),
+                                        est_time_days=None, description=None, status="done")
+        task_id = int(try_add_new_task(task_data, 42).message)
+        revision = try_getting_task_revision(42).message
+        res = try_setting_task_status(42, SetTaskStatusRequestModel(task_id=task_id, status="done"))
+        self.assertEqual((res.success, res.message), (True, f"Task {task_id} is now done"))
+        self.assertEqual(try_getting_task_revision(42).message, revision)
+        self.assertEqual(reconcile_task_counts(), 0)
+
+    def test_try_setting_task_status_nonexistent_task(self):
+        res = try_setting_task_status(42, SetTaskStatusRequestModel(task_id=1, status="done"))
+        self.assertFalse(res.success)
+        self.assertIsInstance(res.exception, NoResultFound)
+        with self.assertRaises(ValidationError):
+            SetTaskStatusRequestModel(task_id=1, status="abandoned")
+        with self.assertRaises(ValidationError):
+            TaskStatsRequestModel(date_from=date(2030, 1, 2), date_to=date(2030, 1, 1))
+
+    def test_reconcile_task_counts(self):
+        task_data = AddTaskRequestModel(title="Stat", importance=1, deadline=datetime(2030, 1, 1),
+                                        est_time_days=None, description=None)
+        try_add_new_task(task_data, 42)
+        try_add_new_task(task_data, 43)
+        revision = try_getting_task_revision(42).message
+        # counts drift, e.g. when tasks are changed directly in the database
+        db.session.execute(TaskDailyCount.__table__.update().where(TaskDailyCount.user_id == 42).values(count=5))
+        db.session.execute(TaskDailyCount.__table__.insert().values(
+            user_id=42, day=date(2030, 2, 1), status="done", importance=1, count=2))
+        db.session.commit()
+        self.assertEqual(self._stats(42)["total"], 7)
+
+        self.assertEqual(reconcile_task_counts(), 2)
+        self.assertEqual(self._stats(42)["total"], 1)
+        self.assertEqual(self._stats(43)["total"], 1)
+        self.assertNotEqual(try_getting_task_revision(42).message, revision)
+
+        result = self.app.test_cli_runner().invoke(args=["reconcile-task-counts", "--user-id", "42"])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn("Corrected 0", result.output)
+
+    def _batch(self, operations, atomic=False):
+        return BatchRequestModel(operations=[{"command": command, "args": args} for command, args in operations],
+                                 atomic=atomic)
+
+    def test_try_running_batch(self):
+        test_user_id = 42
+        task_args = {"title": "Batch", "importance": 1, "deadline": "2030-01-01T00:00:00", "est_time_days": None,
+                     "description": None}
+        existing_id = int(try_add_new_task(AddTaskRequestModel.model_validate(task_args), test_user_id).message)
+        revision = int(try_getting_task_revision(test_user_id).message)
+
+        res = try_running_batch(test_user_id, self._batch([
+            ("add", dict(task_args, title="Added in batch")),
+            ("add", {"title": "No importance"}),
+            ("edit", dict(task_args, task_id=existing_id, importance=9)),
+            ("view", {"title": "Added in batch"}),
+            ("delete", {"task_id": 12345}),
+            ("delete", {"task_id": existing_id}),
+        ]))
+        self.assertTrue(res.success)
+        self.assertEqual([result["status"] for result in res.results],
+                         ["success", "error", "success", "success", "error", "success"])
+        self.assertEqual(res.results[3]["result"]["task_id"], res.results[0]["result"])
+        self.assertIn("12345", res.results[4]["message"])
+        self.assertEqual(res.message, "4 of 6 commands succeeded")
+
+        tasks = try_getting_user_tasks(test_user_id).tasks
+        self.assertEqual([task["title"] for task in tasks], ["Added in batch"])
+        self.assertEqual(int(try_getting_task_revision(test_user_id).message), revision + 1)
+        self.assertEqual(reconcile_task_counts(), 0)
+
+    def test_try_running_batch_atomic(self):
+        task_args = {"title": "Batch", "importance": 1, "deadline": "2030-01-01T00:00:00", "est_time_days": None,
+                     "description": None}
+        try_add_new_task(AddTaskRequestModel.model_validate(task_args), 42)
+        try_add_new_task(AddTaskRequestModel.model_validate(task_args), 42)
+
+        res = try_running_batch(42, self._batch([("add", task_args), ("view", {"title": "Batch"})], atomic=True))
+        self.assertFalse(res.success)
+        self.assertIsInstance(res.exception, ValueError)
+        self.assertIn("More than one task", res.results[1]["message"])
+        self.assertEqual(len(try_getting_user_tasks(42).tasks), 2)
+
+        res = try_running_batch(42, self._batch([("add", task_args)], atomic=True))
+        self.assertTrue(res.success)
+        self.assertEqual(len(try_getting_user_tasks(42).tasks), 3)
+
+        with self.assertRaises(ValidationError):
+            self._batch([("rename", {})])
+        res = try_running_batch(42, "not a batch")
+        self.assertIsInstance(res.exception, TypeError)
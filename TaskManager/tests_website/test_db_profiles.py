@@ -0,0 +1,146 @@
+from unittest import TestCase
+from threading import Thread
+import os
+import sqlite3
+import tempfile
+
+from flask import Flask
+from sqlalchemy import text
+from sqlalchemy.pool import NullPool, QueuePool, StaticPool
+from unittest.mock import patch
+from ..website import create_app, db
+from ..website.db_profiles import SQLITE_PROFILES, apply_sqlite_pragmas, configure_engine_options, get_profile, \
+    pool_options_from_environment
+
+
+class TestDbProfiles(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.database_path = os.path.join(self.temp_dir.name, "profile.db")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _connect(self, profile_name):
+        connection = sqlite3.connect(self.database_path, timeout=0)  # 0 so that only busy_timeout pragma waits
+        apply_sqlite_pragmas(connection, get_profile(profile_name)["pragmas"])
+        return connection
+
+    def test_production_pragmas_applied(self):
+        connection = self._connect("production")
+        try:
+            self.assertEqual(connection.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+            self.assertEqual(connection.execute("PRAGMA synchronous").fetchone()[0], 1)  # NORMAL
+            self.assertEqual(connection.execute("PRAGMA busy_timeout").fetchone()[0], 5000)
+            self.assertEqual(connection.execute("PRAGMA temp_store").fetchone()[0], 2)  # MEMORY
+            self.assertEqual(connection.execute("PRAGMA cache_size").fetchone()[0], -64000)
+        finally:
+            connection.close()
+
+    def test_invalid_pragmas_rejected(self):
+        connection = sqlite3.connect(":memory:")
+        try:
+            with self.assertRaises(ValueError):
+                apply_sqlite_pragmas(connection, {"journal_mode; DROP TABLE task": "WAL"})
+            with self.assertRaises(ValueError):
+                apply_sqlite_pragmas(connection, {"journal_mode": "WAL; DROP TABLE task"})
+        finally:
+            connection.close()
+
+    def test_unknown_profile(self):
+        with self.assertRaises(ValueError):
+            get_profile("turbo")
+
+    def test_engine_options_from_config_take_precedence(self):
+        app = Flask(__name__)
+        app.config["DB_PERFORMANCE_PROFILE"] = "production"
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"pool_size": 1}
+        configure_engine_options(app)
+        self.assertEqual(app.config["SQLALCHEMY_ENGINE_OPTIONS"]["pool_size"], 1)
+        self.assertEqual(app.config["SQLALCHEMY_ENGINE_OPTIONS"]["max_overflow"],
+                         SQLITE_PROFILES["production"]["engine_options"]["max_overflow"])
+
+    def test_pool_options_from_environment(self):
+        options = pool_options_from_environment({
+            "TASKMANAGER_DB_POOL_SIZE": "20",
+            "TASKMANAGER_DB_POOL_RECYCLE": "1800",
+            "TASKMANAGER_DB_POOL_PRE_PING": "true",
+            "UNRELATED": "1",
+        })
+        self.assertEqual(options, {"pool_size": 20, "pool_recycle": 1800, "pool_pre_ping": True})
+        with self.assertRaises(ValueError):
+            pool_options_from_environment({"TASKMANAGER_DB_MAX_OVERFLOW": "many"})
+
+        app = Flask(__name__)
+        app.config["DB_PERFORMANCE_PROFILE"] = "production"
+        with patch.dict(os.environ, {"TASKMANAGER_DB_POOL_SIZE": "20"}):
+            configure_engine_options(app)
+        self.assertEqual(app.config["SQLALCHEMY_ENGINE_OPTIONS"]["pool_size"], 20)
+
+    def test_queue_pool_options_only_for_queue_pool(self):
+        for database_uri, poolclass, expected in [
+            (f"sqlite:///{self.database_path}", None, True),
+            ("sqlite://", None, False),
+            ("sqlite:///:memory:", None, False),
+            (f"sqlite:///{self.database_path}", NullPool, False),
+        ]:
+            app = Flask(__name__)
+            app.config["DB_PERFORMANCE_PROFILE"] = "production"
+            app.config["SQLALCHEMY_DATABASE_URI"] = database_uri
+            if poolclass is not None:
+                app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"poolclass": poolclass}
+            with patch.dict(os.environ, {"TASKMANAGER_DB_POOL_SIZE": "20", "TASKMANAGER_DB_POOL_PRE_PING": "1"}):
+                configure_engine_options(app)
+            options = app.config["SQLALCHEMY_ENGINE_OPTIONS"]
+            self.assertEqual("pool_size" in options, expected, database_uri)
+            self.assertEqual("max_overflow" in options, expected, database_uri)
+            self.assertTrue(options["pool_pre_ping"])
+
+    def test_production_profile_with_in_memory_database(self):
+        with patch.dict(os.environ, {"TASKMANAGER_DB_POOL_SIZE": "20"}):
+            app = create_app(config={"SQLALCHEMY_DATABASE_URI": "sqlite://", "DB_PERFORMANCE_PROFILE": "production",
+                                     "TASK_LIST_CACHE_BACKEND": "memory"})
+        with app.app_context():
+            self.assertIsInstance(db.engine.pool, StaticPool)
+            self.assertEqual(db.session.execute(text("SELECT 1")).scalar(), 1)
+            db.session.remove()
+            db.engine.dispose()
+
+        app = create_app(config={"SQLALCHEMY_DATABASE_URI": f"sqlite:///{self.database_path}",
+                                 "DB_PERFORMANCE_PROFILE": "production", "TASK_LIST_CACHE_BACKEND": "memory"})
+        with app.app_context():
+            self.assertIsInstance(db.engine.pool, QueuePool)
+            db.engine.dispose()
+
+    def test_concurrent_writers_and_readers(self):
+        setup_connection = self._connect("production")
+        setup_connection.execute("CREATE TABLE item (id INTEGER PRIMARY KEY, worker INTEGER)")
+        setup_connection.commit()
+        setup_connection.close()
+
+        errors = []
+        def writer(worker):
+            connection = self._connect("production")
+            try:
+                for _ in range(50):
+                    connection.execute("INSERT INTO item (worker) VALUES (?)", (worker,))
+                    connection.commit()
+                    connection.execute("SELECT COUNT(*) FROM item").fetchone()
+            except sqlite3.OperationalError as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [Thread(target=writer, args=(worker,)) for worker in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        connection = self._connect("production")
+        try:
+            self.assertEqual(connection.execute("SELECT COUNT(*) FROM item").fetchone()[0], 200)
+        finally:
+            connection.close()
@@ -0,0 +1,69 @@
+from unittest import TestCase
+import os
+import tempfile
+
+from sqlalchemy import text
+from sqlalchemy.orm import close_all_sessions
+from ..website import db, create_app, after_fork, prepare_for_fork, TEST_DATABASE_PATH
+from ..website.task_cache import task_list_cache
+
+
+class TestForking(TestCase):
+    """Workers forked from a preloaded app (Gunicorn preload_app) must not share connections with the master"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cache_dir = tempfile.TemporaryDirectory()
+        cls.app = create_app(test=True, config={
+            "TASK_LIST_CACHE_BACKEND": "sqlite",
+            "TASK_LIST_CACHE_PATH": os.path.join(cls.cache_dir.name, "task_cache.db")
+        })
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            close_all_sessions()
+            db.drop_all()
+        if os.path.exists(TEST_DATABASE_PATH):
+            os.remove(TEST_DATABASE_PATH)
+            print(f"Removed test database from {TEST_DATABASE_PATH}")
+        task_list_cache.close()
+        cls.cache_dir.cleanup()
+
+    def test_prepare_for_fork_closes_connections(self):
+        with self.app.app_context():
+            db.session.execute(text("SELECT 1"))
+            db.session.commit()
+            self.assertGreater(db.engine.pool.checkedin(), 0)
+        task_list_cache.invalidate(1)
+
+        prepare_for_fork(self.app)
+        with self.app.app_context():
+            self.assertEqual(db.engine.pool.checkedin(), 0)
+
+    def test_forked_worker_uses_own_connections(self):
+        with self.app.app_context():
+            db.session.execute(text("SELECT 1"))
+            db.session.commit()
+        task_list_cache.invalidate(1)
+        _, generation = task_list_cache.get(1, "key")
+
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                after_fork(self.app)
+                with self.app.app_context():
+                    status = 0 if db.session.scalar(text("SELECT 1")) == 1 else 1
+                    db.session.commit()
+                task_list_cache.invalidate(1)
+            finally:
+                os._exit(status)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+        # connections of this process still work
+        with self.app.app_context():
+            self.assertEqual(db.session.scalar(text("SELECT 1")), 1)
+            db.session.commit()
+        # the worker's invalidation went through its own connection of the shared cache
+        self.assertEqual(task_list_cache.get(1, "key"), (None, generation + 1))
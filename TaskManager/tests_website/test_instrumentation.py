@@ -0,0 +1,84 @@
+from unittest import TestCase
+import os
+import re
+
+from sqlalchemy.orm import close_all_sessions
+from ..website import db, create_app, TEST_DATABASE_PATH
+from ..website.auth import register_user
+from ..website.instrumentation import Histogram, instrumentation
+from ..website.task_cache import task_list_cache
+from ..website.user_cache import user_cache
+
+
+class TestHistogram(TestCase):
+
+    def test_render_is_cumulative(self):
+        histogram = Histogram("test_seconds", "Test", (0.1, 1), ("endpoint",))
+        for value in [0.05, 0.1, 0.5, 3]:
+            histogram.observe(value, "a")
+
+        lines = histogram.render()
+        self.assertIn('test_seconds_bucket{endpoint="a",le="0.1"} 2', lines)
+        self.assertIn('test_seconds_bucket{endpoint="a",le="1"} 3', lines)
+        self.assertIn('test_seconds_bucket{endpoint="a",le="+Inf"} 4', lines)
+        self.assertIn('test_seconds_count{endpoint="a"} 4', lines)
+        self.assertEqual(histogram.count("a"), 4)
+
+
+class TestInstrumentation(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app(test=True, config={"INSTRUMENTATION": True, "SLOW_REQUEST_SECONDS": 0})
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+
+    @classmethod
+    def tearDownClass(cls):
+        close_all_sessions()
+        db.drop_all()
+        if os.path.exists(TEST_DATABASE_PATH):
+            os.remove(TEST_DATABASE_PATH)
+            print(f"Removed test database from {TEST_DATABASE_PATH}")
+        cls.app_context.pop()
+
+    def setUp(self):
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+        task_list_cache.clear()
+        user_cache.clear()
+
+        self.test_app_context = self.app.app_context()
+        self.test_app_context.push()
+        with self.app.test_request_context():
+            self.assertTrue(register_user("metrics@test.com", "metrics_user", "Ladidadida").success)
+        self.client = self.app.test_client()
+        self.client.post("/login", data={"username": "metrics_user", "password": "Ladidadida"})
+
+    def tearDown(self):
+        self.test_app_context.pop()
+
+    def test_requests_are_measured(self):
+        listed_before = instrumentation.request_queries.count("terminal.show_list")
+        with self.assertLogs("taskmanager.performance", "WARNING") as logs:
+            response = self.client.post("/terminal/list", json={"format": "structured"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(any("Slow request POST terminal.show_list" in line for line in logs.output))
+        self.assertEqual(instrumentation.request_queries.count("terminal.show_list"), listed_before + 1)
+
+        metrics = self.client.get("/metrics").get_data(as_text=True)
+        self.assertIn('taskmanager_requests_total{endpoint="terminal.show_list",method="POST",status="200"}', metrics)
+        self.assertRegex(metrics, r'taskmanager_request_queries_count\{endpoint="terminal.show_list"\} \d+')
+        self.assertIn("taskmanager_serialization_seconds_bucket", metrics)
+        self.assertIn("taskmanager_user_cache_hits_total", metrics)
+
+    def test_queries_of_a_request_are_counted(self):
+        self.client.post("/terminal/list", json={})
+        metrics = self.client.get("/metrics").get_data(as_text=True)
+        query_sum = re.search(r'taskmanager_request_queries_sum\{endpoint="terminal.show_list"\} ([\d.]+)', metrics)
+        self.assertGreater(float(query_sum.group(1)), 0)
+
+    def test_metrics_are_not_served_when_disabled(self):
+        app = create_app(test=True)
+        self.assertEqual(app.test_client().get("/metrics").status_code, 404)
@@ -0,0 +1,38 @@
+from unittest import TestCase
+import random
+
+from ..website.utils.intervals import assign_lanes
+
+
+class TestAssignLanes(TestCase):
+
+    def _assert_no_overlaps(self, intervals, lanes):
+        for i, (start_i, end_i) in enumerate(intervals):
+            for j, (start_j, end_j) in enumerate(intervals[:i]):
+                if lanes[i] == lanes[j]:
+                    self.assertTrue(end_i <= start_j or end_j <= start_i, f"{intervals[i]} and {intervals[j]}")
+
+    def test_simple(self):
+        intervals = [(0, 10), (2, 5), (5, 8), (10, 12), (3, 4)]
+        lanes = assign_lanes(intervals)
+        self.assertEqual(lanes, [0, 1, 1, 0, 2])
+
+    def test_empty(self):
+        self.assertEqual(assign_lanes([]), [])
+
+    def test_uses_minimal_number_of_lanes(self):
+        rng = random.Random(1)
+        for _ in range(20):
+            intervals = []
+            for _ in range(200):
+                start = rng.randint(0, 1000)
+                intervals.append((start, start + rng.randint(0, 50)))
+            lanes = assign_lanes(intervals)
+            self._assert_no_overlaps(intervals, lanes)
+            # the number of lanes equals the maximal number of intervals overlapping at one point
+            events = sorted([(end, -1) for _, end in intervals] + [(start, 1) for start, _ in intervals])
+            depth = max_depth = 0
+            for _, change in events:
+                depth += change
+                max_depth = max(max_depth, depth)
+            self.assertEqual(max(lanes) + 1, max_depth)
@@ -0,0 +1,61 @@
+from threading import Event, Thread
+from unittest import TestCase
+from unittest.mock import patch
+
+from werkzeug.security import generate_password_hash
+from ..website.admission import AttemptLimiter
+from ..website.password_hashing import PasswordHasher, PasswordHashingBusy
+
+
+class TestPasswordHasher(TestCase):
+
+    def test_hash_and_verify(self):
+        hasher = PasswordHasher()
+        password_hash = hasher.hash("Ladidadida")
+        self.assertTrue(password_hash.startswith("scrypt:"))
+        self.assertTrue(hasher.verify(password_hash, "Ladidadida"))
+        self.assertFalse(hasher.verify(password_hash, "Ladidadido"))
+
+    def test_needs_rehash(self):
+        hasher = PasswordHasher()
+        self.assertFalse(hasher.needs_rehash(hasher.hash("Ladidadida")))
+        self.assertTrue(hasher.needs_rehash(generate_password_hash("Ladidadida", "pbkdf2")))
+        self.assertTrue(hasher.needs_rehash(generate_password_hash("Ladidadida", "scrypt:16384:8:1")))
+
+    def test_rejects_when_full(self):
+        hasher = PasswordHasher(workers=1, queue_size=0)
+        started, release = Event(), Event()
+        def slow_hash():
+            started.set()
+            release.wait(5)
+
+        blocking_thread = Thread(target=hasher._run, args=(slow_hash,))
+        blocking_thread.start()
+        try:
+            self.assertTrue(started.wait(5))
+            with self.assertRaises(PasswordHashingBusy):
+                hasher.hash("Ladidadida")
+        finally:
+            release.set()
+            blocking_thread.join()
+        self.assertTrue(hasher.verify(hasher.hash("Ladidadida"), "Ladidadida"))
+
+
+class TestAttemptLimiter(TestCase):
+
+    def test_sliding_window(self):
+        limiter = AttemptLimiter(max_attempts=2, window=60)
+        with patch("time.monotonic", return_value=1000.0):
+            limiter.record("1.2.3.4")
+            limiter.record("1.2.3.4")
+            self.assertFalse(limiter.is_allowed("1.2.3.4"))
+            self.assertTrue(limiter.is_allowed("5.6.7.8"))
+        with patch("time.monotonic", return_value=1060.0):
+            self.assertTrue(limiter.is_allowed("1.2.3.4"))
+
+    def test_number_of_keys_is_bounded(self):
+        limiter = AttemptLimiter(max_attempts=1, window=60, max_keys=10)
+        for i in range(100):
+            limiter.record(str(i))
+        self.assertEqual(len(limiter._attempts), 10)
+        self.assertFalse(limiter.is_allowed("99"))
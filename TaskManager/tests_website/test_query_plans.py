@@ -0,0 +1,242 @@
+from datetime import date, datetime, timedelta
+from unittest import SkipTest, TestCase
+import os
+import re
+
+from sqlalchemy import event
+from sqlalchemy.orm import close_all_sessions
+from ..website import db, create_app, TEST_DATABASE_PATH
+from ..website.auth import find_taken_fields
+from ..website.db_operations import try_getting_user_tasks, try_add_new_task, try_getting_specific_task, \
+    try_removing_specific_task, try_editing_specific_task, try_getting_user_tasks_page, try_getting_task_tree, \
+    try_removing_task_subtree, try_moving_task, try_getting_tasks_in_range, try_searching_tasks, \
+    try_setting_task_status, try_getting_task_stats, reconcile_task_counts, try_getting_most_urgent_tasks, \
+    try_importing_tasks, iter_user_tasks, try_running_batch, try_patching_task
+from ..website.db_migrations import TASK_PARENT_DELETE_TRIGGER_DDL
+from ..website.models.requests import AddTaskRequestModel, EditTaskRequestModel, ListTasksRequestModel, \
+    TaskTreeRequestModel, MoveTaskRequestModel, CalendarRangeRequestModel, SearchTasksRequestModel, \
+    SetTaskStatusRequestModel, TaskStatsRequestModel, UrgentTasksRequestModel, BatchRequestModel, \
+    PatchTaskRequestModel
+
+
+# a plan step like "SCAN task" means that every row of the table is visited
+FULL_SCAN_PATTERN = re.compile(r"^SCAN (task|user|task_daily_count)\b")
+
+
+class TestQueryPlans(TestCase):
+    """Runs EXPLAIN QUERY PLAN for every statement issued by the try_* functions and fails on full table scans"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app(test=True)
+        with cls.app.app_context():
+            if db.engine.dialect.name != "sqlite":
+                raise SkipTest("EXPLAIN QUERY PLAN is SQLite specific")
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+
+    @classmethod
+    def tearDownClass(cls):
+        close_all_sessions()
+        db.drop_all()
+        if os.path.exists(TEST_DATABASE_PATH):
+            os.remove(TEST_DATABASE_PATH)
+            print(f"Removed test database from {TEST_DATABASE_PATH}")
+        cls.app_context.pop()
+
+    def setUp(self):
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+
+        self.request_ctx = self.app.test_request_context()
+        self.request_ctx.push()
+
+        self.statements = []
+        event.listen(db.engine, "before_cursor_execute", self._record_statement)
+
+    def tearDown(self):
+        event.remove(db.engine, "before_cursor_execute", self._record_statement)
+        self.request_ctx.pop()
+
+    def _record_statement(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")):
+            # the plan of an executemany statement is the same for every row of parameters
+            self.statements.append((statement, parameters[0] if executemany else parameters))
+
+    def assertNoFullScans(self, allow_sorting=True):
+        """allow_sorting=False also fails when rows are sorted instead of being read in the order of an index"""
+        self.assertTrue(self.statements, "No statements were recorded")
+        statements, self.statements = self.statements, []
+        for statement, parameters in statements:
+            plan = db.session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+            for row in plan:
+                detail = row[-1]
+                self.assertIsNone(FULL_SCAN_PATTERN.match(detail), f"Full table scan in:\n{statement}\n{detail}")
+                if not allow_sorting:
+                    self.assertNotIn("TEMP B-TREE", detail, f"Sorting in:\n{statement}")
+
+    def _add_task(self, user_id=42):
+        task_data = AddTaskRequestModel(
+            title="Test task",
+            importance=10,
+            deadline=datetime.now(),
+            est_time_days=12,
+            description="Hello, it's a test. Also, hello world!"
+        )
+        res = try_add_new_task(task_data, user_id)
+        self.assertTrue(res.success)
+        return int(res.message)
+
+    def test_getting_tasks_plans(self):
+        task_id = self._add_task()
+        self.statements = []
+
+        try_getting_user_tasks(42)
+        self.assertNoFullScans()
+        try_getting_specific_task(42, task_id)
+        self.assertNoFullScans()
+
+    def test_getting_tasks_page_plans(self):
+        self._add_task()
+        self._add_task()
+        first_page = try_getting_user_tasks_page(42, ListTasksRequestModel(limit=1))
+        self.statements = []
+
+        for sort_by in ["id", "deadline", "importance"]:
+            for descending in [False, True]:
+                try_getting_user_tasks_page(42, ListTasksRequestModel(sort_by=sort_by, descending=descending))
+                self.assertNoFullScans()
+        try_getting_user_tasks_page(42, ListTasksRequestModel(cursor=first_page.next_cursor))
+        self.assertNoFullScans()
+        try_getting_user_tasks_page(42, ListTasksRequestModel(
+            importance_min=1, importance_max=5, deadline_from=datetime(2020, 1, 1), parent_task_id=1,
+            title_contains="Test"))
+        self.assertNoFullScans()
+
+    def test_editing_and_removing_plans(self):
+        task_id = self._add_task()
+        self.statements = []
+
+        edit_request = EditTaskRequestModel(
+            task_id=task_id,
+            title="Edited",
+            importance=1,
+            deadline=datetime.now(),
+            est_time_days=15,
+            description="This was edited"
+        )
+        try_editing_specific_task(42, edit_request)
+        self.assertNoFullScans()
+        try_removing_specific_task(42, task_id)
+        self.assertNoFullScans()
+
+    def test_task_tree_plans(self):
+        root_id = self._add_task()
+        child_id = self._add_task()
+        self.statements = []
+
+        try_getting_task_tree(42, TaskTreeRequestModel())
+        self.assertNoFullScans()
+        try_getting_task_tree(42, TaskTreeRequestModel(task_id=root_id, max_depth=3))
+        self.assertNoFullScans()
+        try_moving_task(42, MoveTaskRequestModel(task_id=child_id, new_parent_task_id=root_id))
+        self.assertNoFullScans()
+        try_removing_task_subtree(42, root_id)
+        self.assertNoFullScans()
+
+    def test_calendar_range_plans(self):
+        self._add_task()
+        self.statements = []
+
+        try_getting_tasks_in_range(42, CalendarRangeRequestModel(start=datetime(2030, 1, 1), end=datetime(2030, 2, 1)))
+        self.assertNoFullScans()
+
+    def test_most_urgent_tasks_plans(self):
+        # the most important task is the last one to start, so that more than one batch is read from both indexes
+        for importance, days in [(10, 100), (5, 10), (0, 1)]:
+            task_data = AddTaskRequestModel(title="Ranked", importance=importance,
+                                            deadline=datetime.now() + timedelta(days=days), est_time_days=None,
+                                            description=None)
+            self.assertTrue(try_add_new_task(task_data, 42).success)
+        self.statements = []
+
+        # batches of one task, so that the following batches (with the keyset condition) are read too
+        try_getting_most_urgent_tasks(42, UrgentTasksRequestModel(limit=1), batch_size=1)
+        self.assertEqual(len(self.statements), 4)
+        self.assertNoFullScans(allow_sorting=False)
+
+    def test_import_plans(self):
+        records = [(line_number, {"title": f"Imported {line_number}", "importance": 1,
+                                  "deadline": "2030-01-01T00:00:00", "est_time_days": 2, "description": None})
+                   for line_number in range(1, 4)]
+        self.assertEqual(try_importing_tasks(records, 42, chunk_size=2).imported, 3)
+        self.assertNoFullScans()
+
+    def test_export_plans(self):
+        for _ in range(3):
+            self._add_task()
+        self._add_task(user_id=43)
+        self.statements = []
+
+        # chunks of one task, so that the following chunks (with the keyset condition) are read too
+        self.assertEqual(len(list(iter_user_tasks(42, chunk_size=1))), 3)
+        self.assertEqual(len(self.statements), 4)
+        self.assertNoFullScans(allow_sorting=False)
+
+    def test_patch_plans(self):
+        task_id = self._add_task()
+        self.statements = []
+
+        try_patching_task(42, PatchTaskRequestModel(task_id=task_id, title="Renamed"))
+        self.assertNoFullScans()
+        try_patching_task(42, PatchTaskRequestModel(task_id=task_id, deadline=datetime(2030, 1, 1)))
+        self.assertNoFullScans()
+        try_patching_task(42, PatchTaskRequestModel(task_id=task_id, importance=3, status="done"))
+        self.assertNoFullScans()
+
+    def test_batch_plans(self):
+        task_id = self._add_task()
+        self.statements = []
+
+        batch = BatchRequestModel.model_validate({"operations": [
+            {"command": "add", "args": {"title": "Batched", "importance": 1, "deadline": "2030-01-01T00:00:00",
+                                        "est_time_days": None, "description": None}},
+            {"command": "edit", "args": {"task_id": task_id, "title": "Edited", "importance": 2,
+                                         "deadline": "2030-02-01T00:00:00", "est_time_days": 1,
+                                         "description": None}},
+            {"command": "view", "args": {"title": "Batched"}},
+            {"command": "view", "args": {"task_id": str(task_id)}},
+            {"command": "delete", "args": {"title": "Batched"}},
+        ]})
+        self.assertTrue(try_running_batch(42, batch).success)
+        self.assertNoFullScans()
+
+    def test_delete_trigger_plans(self):
+        # plans of statements run by triggers are not part of the plan of the DELETE that fires them
+        trigger_body = re.search(r"BEGIN\s+(.*?);\s+END", TASK_PARENT_DELETE_TRIGGER_DDL, re.DOTALL).group(1)
+        self.statements = [(trigger_body.replace("old.id", "?"), (1,))]
+        self.assertNoFullScans()
+
+    def test_search_plans(self):
+        self._add_task()
+        self.statements = []
+
+        try_searching_tasks(42, SearchTasksRequestModel(query="hello wor"))
+        self.assertNoFullScans()
+
+    def test_task_stats_plans(self):
+        task_id = self._add_task()
+        self._add_task(user_id=43)
+        self.statements = []
+
+        try_setting_task_status(42, SetTaskStatusRequestModel(task_id=task_id, status="done"))
+        self.assertNoFullScans()
+        try_getting_task_stats(42, TaskStatsRequestModel(date_from=date(2030, 1, 1), date_to=date(2030, 1, 31)))
+        self.assertNoFullScans()
+        reconcile_task_counts(42)
+        self.assertNoFullScans()
+
+    def test_signup_check_plans(self):
+        find_taken_fields("jack@email.com", "Jack")
+        self.assertNoFullScans()
@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+from unittest import TestCase
+import random
+
+from ..website.utils.ranking import threshold_top_k, urgency
+
+
+class TestRanking(TestCase):
+
+    def test_urgency(self):
+        now = datetime(2030, 1, 1)
+        self.assertEqual(urgency(9, now + timedelta(days=4), now), 2.0)
+        self.assertGreater(urgency(5, now + timedelta(days=1), now), urgency(5, now + timedelta(days=2), now))
+        self.assertGreater(urgency(6, now + timedelta(days=2), now), urgency(5, now + timedelta(days=2), now))
+        # tasks that should have been started already are all as urgent as their importance allows
+        self.assertEqual(urgency(3, now - timedelta(days=30), now), urgency(3, now, now))
+
+    def _top_k(self, items, k):
+        reads = []
+
+        def source(order):
+            for item in order:
+                reads.append(item)
+                yield item
+
+        by_first = source(sorted(items, key=lambda item: -item[0]))
+        by_second = source(sorted(items, key=lambda item: item[1]))
+        score = lambda item: item[0] - item[1]
+        result = threshold_top_k(k, [by_first, by_second], key=lambda item: item, score=score,
+                                 bound=lambda last: last[0][0] - last[1][1])
+        return result, reads
+
+    def test_same_as_sorting(self):
+        rng = random.Random(3)
+        for _ in range(50):
+            items = list({(rng.randint(0, 100), rng.randint(0, 100)) for _ in range(rng.randint(0, 60))})
+            k = rng.randint(1, 10)
+            result, _ = self._top_k(items, k)
+            expected = sorted(items, key=lambda item: item[0] - item[1], reverse=True)[:k]
+            self.assertEqual([a - b for a, b in result], [a - b for a, b in expected])
+
+    def test_stops_early_when_orders_agree(self):
+        items = [(value, -value) for value in range(1000)]
+        result, reads = self._top_k(items, 5)
+        self.assertEqual(result, [(999, -999), (998, -998), (997, -997), (996, -996), (995, -995)])
+        self.assertEqual(len(reads), 10)
@@ -0,0 +1,49 @@
+from datetime import datetime
+from unittest import TestCase
+from unittest.mock import patch
+import json
+
+from ..website.models.responses import TerminalAPIResponse
+from ..website.utils import serialization
+from ..website.utils.serialization import dumps, wants_pretty, wants_structured
+
+
+class TestSerialization(TestCase):
+
+    payload = {
+        "status": "success",
+        "result": [{"task_id": 1, "title": "Zażółć", "deadline": datetime(2030, 1, 2, 3, 4, 5), "description": None}]
+    }
+
+    def _check_backend(self):
+        encoded = dumps(self.payload)
+        self.assertIsInstance(encoded, bytes)
+        self.assertNotIn(b"\n", encoded)
+        decoded = json.loads(encoded)
+        self.assertEqual(decoded["result"][0]["deadline"], "2030-01-02T03:04:05")
+        self.assertEqual(decoded["result"][0]["title"], "Zażółć")
+
+        self.assertIn(b"\n", dumps(self.payload, pretty=True))
+        self.assertEqual(json.loads(dumps(self.payload, pretty=True)), decoded)
+
+        model = TerminalAPIResponse(status="success", result=self.payload["result"])
+        self.assertEqual(json.loads(dumps(model))["result"], decoded["result"])
+
+    def test_default_backend(self):
+        self._check_backend()
+
+    def test_pydantic_core_fallback(self):
+        with patch.object(serialization, "orjson", None):
+            self._check_backend()
+            fallback_pretty = dumps(self.payload, pretty=True)
+        # pretty output is the same with any backend, indented by 4 spaces
+        self.assertEqual(dumps(self.payload, pretty=True), fallback_pretty)
+        self.assertIn(b'\n    "status"', fallback_pretty)
+
+    def test_output_options(self):
+        self.assertTrue(wants_pretty({"pretty": True}))
+        self.assertTrue(wants_pretty({"pretty": "true"}))
+        self.assertFalse(wants_pretty({"pretty": "false"}))
+        self.assertFalse(wants_pretty({}))
+        self.assertTrue(wants_structured({"format": "structured"}))
+        self.assertFalse(wants_structured({"format": "text"}))
@@ -0,0 +1,189 @@
+from unittest import TestCase
+from threading import Thread
+import os
+import tempfile
+
+from flask import Flask
+from sqlalchemy.orm import close_all_sessions
+
+from ..website import BACKEND_DIR, create_app, db
+from ..website.auth import register_user
+from ..website.task_cache import MemoryCacheBackend, SQLiteCacheBackend, default_cache_path, task_list_cache
+from ..website.user_cache import user_cache
+
+
+class CacheBackendTests:
+    """Tests shared by all cache backends, mixed into TestCase subclasses below"""
+
+    def make_backend(self, max_entries):
+        raise NotImplementedError
+
+    def test_get_set(self):
+        backend = self.make_backend(10)
+        value, generation = backend.get(1, "page")
+        self.assertIsNone(value)
+        backend.set(1, "page", "cached list", generation)
+
+        self.assertEqual(backend.get(1, "page")[0], "cached list")
+        self.assertIsNone(backend.get(1, "other page")[0])
+        self.assertIsNone(backend.get(2, "page")[0])
+
+    def test_invalidate_affects_only_one_user(self):
+        backend = self.make_backend(10)
+        for user_id in [1, 2]:
+            _, generation = backend.get(user_id, "page")
+            backend.set(user_id, "page", f"list of {user_id}", generation)
+
+        backend.invalidate(1)
+        self.assertIsNone(backend.get(1, "page")[0])
+        self.assertEqual(backend.get(2, "page")[0], "list of 2")
+
+    def test_set_with_outdated_generation_is_ignored(self):
+        backend = self.make_backend(10)
+        _, generation = backend.get(1, "page")
+        backend.invalidate(1)  # a write happened while the list was being computed
+        backend.set(1, "page", "stale list", generation)
+        self.assertIsNone(backend.get(1, "page")[0])
+
+    def test_size_is_bounded(self):
+        backend = self.make_backend(5)
+        for i in range(200):
+            _, generation = backend.get(1, f"page {i}")
+            backend.set(1, f"page {i}", "list", generation)
+        self.assertEqual(backend.get(1, "page 199")[0], "list")
+        self.assertLessEqual(self.count_entries(backend), 5 + getattr(backend, "TRIM_INTERVAL", 0))
+
+
+class TestMemoryCacheBackend(CacheBackendTests, TestCase):
+
+    def make_backend(self, max_entries):
+        return MemoryCacheBackend(max_entries)
+
+    def count_entries(self, backend):
+        return len(backend._entries)
+
+    def test_least_recently_used_evicted(self):
+        backend = self.make_backend(2)
+        for key in ["a", "b"]:
+            backend.set(1, key, key, 0)
+        backend.get(1, "a")
+        backend.set(1, "c", "c", 0)
+        self.assertEqual(backend.get(1, "a")[0], "a")
+        self.assertIsNone(backend.get(1, "b")[0])
+
+
+class TestSQLiteCacheBackend(CacheBackendTests, TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def make_backend(self, max_entries):
+        return SQLiteCacheBackend(os.path.join(self.temp_dir.name, "cache.db"), max_entries)
+
+    def count_entries(self, backend):
+        return backend._connection().execute("SELECT COUNT(*) FROM cache_entry").fetchone()[0]
+
+    def test_shared_between_instances(self):
+        # two instances on the same file behave like two Gunicorn workers
+        first_worker = self.make_backend(10)
+        second_worker = self.make_backend(10)
+        _, generation = first_worker.get(1, "page")
+        first_worker.set(1, "page", "cached list", generation)
+        self.assertEqual(second_worker.get(1, "page")[0], "cached list")
+
+        second_worker.invalidate(1)
+        self.assertIsNone(first_worker.get(1, "page")[0])
+
+    def test_used_from_many_threads(self):
+        backend = self.make_backend(100)
+        errors = []
+        def worker(user_id):
+            try:
+                for i in range(20):
+                    _, generation = backend.get(user_id, "page")
+                    backend.set(user_id, "page", str(i), generation)
+                    backend.invalidate(user_id)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [Thread(target=worker, args=(user_id,)) for user_id in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+
+class TestDefaultCachePath(TestCase):
+    def make_app(self, database_uri):
+        app = Flask(__name__)
+        app.config["SQLALCHEMY_DATABASE_URI"] = database_uri
+        return app
+
+    def test_outside_of_source_tree(self):
+        cache_path = default_cache_path(self.make_app("sqlite:///tasks.db"))
+        self.assertEqual(os.path.dirname(cache_path), tempfile.gettempdir())
+        self.assertFalse(os.path.abspath(cache_path).startswith(os.path.abspath(BACKEND_DIR) + os.sep))
+
+    def test_one_per_database(self):
+        first = default_cache_path(self.make_app("sqlite:///tasks.db"))
+        self.assertEqual(first, default_cache_path(self.make_app("sqlite:///tasks.db")))
+        self.assertNotEqual(first, default_cache_path(self.make_app("sqlite:///other.db")))
+
+
+class TestCacheOfHostsSharingDatabase(TestCase):
+    """Two apps with separate caches (hosts) and one database - invalidation reaches only the cache of the writer"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.TemporaryDirectory()
+        database_uri = f"sqlite:///{os.path.join(cls.temp_dir.name, 'shared.db')}"
+        cls.apps = [
+            create_app(test=True, config={
+                "SQLALCHEMY_DATABASE_URI": database_uri,
+                "TASK_LIST_CACHE_BACKEND": "sqlite",
+                "TASK_LIST_CACHE_PATH": os.path.join(cls.temp_dir.name, f"cache_{host}.db")
+            })
+            for host in ("a", "b")
+        ]
+        with cls.apps[0].app_context(), cls.apps[0].test_request_context():
+            register_user("hosts@test.com", "hosts_user", "Ladidadida")
+            close_all_sessions()
+
+    @classmethod
+    def tearDownClass(cls):
+        task_list_cache.close()
+        task_list_cache.init_app(Flask(__name__))  # back to the default in-process cache, the files are removed
+        user_cache.clear()
+        for app in cls.apps:
+            with app.app_context():
+                db.engine.dispose()
+        cls.temp_dir.cleanup()
+
+    def on_host(self, app):
+        """Test client of the app, with the cache of its host (the cache is per process, one process serves both)"""
+        task_list_cache.close()
+        task_list_cache.init_app(app)
+        user_cache.clear()
+        client = app.test_client()
+        client.post("/login", data={"username": "hosts_user", "password": "Ladidadida"})
+        return client
+
+    def add_and_list(self, app, title):
+        client = self.on_host(app)
+        task = {"title": title, "importance": 1, "deadline": "2030-01-01T12:00:00", "est_time_days": None,
+                "description": ""}
+        self.assertEqual(client.post("/terminal/add", json=task).status_code, 200)
+        return [task["title"] for task in client.post("/terminal/list", json={"format": "structured"}).json["result"]]
+
+    def test_change_made_through_other_host_is_listed(self):
+        app_a, app_b = self.apps
+        self.assertEqual(self.add_and_list(app_a, "first"), ["first"])
+        self.assertEqual(self.add_and_list(app_b, "second"), ["first", "second"])
+        # host a cached the list with one task and was not told about the change
+        client = self.on_host(app_a)
+        response = client.post("/terminal/list", json={"format": "structured"})
+        self.assertEqual([task["title"] for task in response.json["result"]], ["first", "second"])
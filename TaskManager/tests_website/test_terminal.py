@@ -0,0 +1,316 @@
+from unittest import TestCase
+import json
+import os
+import re
+
+from flask import g
+from sqlalchemy import event
+from sqlalchemy.orm import close_all_sessions
+from ..website import db, create_app, TEST_DATABASE_PATH
+from ..website.auth import register_user
+from ..website.task_cache import task_list_cache
+from ..website.user_cache import user_cache
+
+
+class TestTerminal(TestCase):
+    """Tests of the terminal endpoints, requests are sent by a logged in test client"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app(test=True)
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+
+    @classmethod
+    def tearDownClass(cls):
+        close_all_sessions()
+        db.drop_all()
+        if os.path.exists(TEST_DATABASE_PATH):
+            os.remove(TEST_DATABASE_PATH)
+            print(f"Removed test database from {TEST_DATABASE_PATH}")
+        cls.app_context.pop()
+
+    def setUp(self):
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+        task_list_cache.clear()
+        user_cache.clear()
+
+        # per-test app context - requests of the test client reuse it, and flask_login keeps the user in its g
+        self.test_app_context = self.app.app_context()
+        self.test_app_context.push()
+        with self.app.test_request_context():
+            self.assertTrue(register_user("terminal@test.com", "terminal_user", "Ladidadida").success)
+        self.client = self.app.test_client()
+        self.client.post("/login", data={"username": "terminal_user", "password": "Ladidadida"})
+
+    def tearDown(self):
+        self.test_app_context.pop()
+
+    def _task_json(self, i):
+        return {
+            "title": f"Imported {i}",
+            "importance": i,
+            "deadline": f"2030-01-{i + 1:02d}T12:00:00",
+            "est_time_days": None,
+            "description": "from the old tool"
+        }
+
+    def test_import_ndjson_and_export(self):
+        body = "\n".join(json.dumps(self._task_json(i)) for i in range(5))
+        body += "\nnot json at all\n" + json.dumps({"title": "no importance"}) + "\n"
+        response = self.client.post("/terminal/import", data=body, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["imported"], 5)
+        self.assertEqual(len(response.json["errors"]), 2)
+        self.assertTrue(response.json["errors"][0].startswith("line 6"))
+
+        response = self.client.get("/terminal/export")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        exported = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual([task["title"] for task in exported], [f"Imported {i}" for i in range(5)])
+        self.assertEqual(exported[2]["deadline"], "2030-01-03T12:00:00")
+
+    def test_import_csv(self):
+        body = ("title,importance,deadline,est_time_days,description\n"
+                "First,1,2030-01-01T00:00:00,3,\n"
+                "Second,2,2030-01-02T00:00:00,,Something to do\n"
+                "Broken,high,someday,,\n")
+        response = self.client.post("/terminal/import", data=body, content_type="text/csv")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["imported"], 2)
+        self.assertEqual(len(response.json["errors"]), 1)
+
+        response = self.client.post("/terminal/list", json={})
+        tasks = json.loads(response.json["result"])
+        self.assertEqual([task["title"] for task in tasks], ["First", "Second"])
+        self.assertIsNone(tasks[0]["description"])
+        self.assertIsNone(tasks[1]["est_time_days"])
+
+    def test_import_rejects_lines_that_are_not_utf8(self):
+        lines = [json.dumps(self._task_json(i % 9)).encode() for i in range(600)]
+        body = b"\n".join(lines + [b"\xff\xfe", json.dumps(self._task_json(9)).encode().replace(b"old", b"\xe9")])
+        response = self.client.post("/terminal/import", data=body, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json["imported"], response.json["rejected"]), (600, 2))
+        self.assertTrue(response.json["errors"][0].startswith("line 601"))
+        self.assertTrue(response.json["errors"][1].startswith("line 602"))
+
+        body = (b"title,importance,deadline,est_time_days,description\n"
+                b"First,1,2030-01-01T00:00:00,,\n"
+                b"Caf\xe9,1,2030-01-01T00:00:00,,\n")
+        response = self.client.post("/terminal/import", data=body, content_type="text/csv")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json["imported"], response.json["rejected"]), (1, 1))
+
+    def _count_task_queries(self, send_request):
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if re.search(r"FROM task\b", statement):
+                statements.append(statement)
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            response = send_request()
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        return response, len(statements)
+
+    def test_list_cached_until_tasks_change(self):
+        self.client.post("/terminal/add", json=self._task_json(1))
+        response, queries = self._count_task_queries(lambda: self.client.post("/terminal/list", json={"limit": 5}))
+        self.assertEqual(queries, 1)
+        first_result = response.json
+
+        response, queries = self._count_task_queries(lambda: self.client.post("/terminal/list", json={"limit": 5}))
+        self.assertEqual(queries, 0)
+        self.assertEqual(response.json, first_result)
+
+        # different filters are cached separately
+        _, queries = self._count_task_queries(lambda: self.client.post("/terminal/list", json={"limit": 6}))
+        self.assertEqual(queries, 1)
+
+        self.client.post("/terminal/add", json=self._task_json(2))
+        response, queries = self._count_task_queries(lambda: self.client.post("/terminal/list", json={"limit": 5}))
+        self.assertEqual(queries, 1)
+        self.assertEqual(len(json.loads(response.json["result"])), 2)
+
+    def test_list_cache_keeps_pretty_options_apart(self):
+        self.client.post("/terminal/add", json=self._task_json(1))
+        # without 'pretty' the text result is pretty printed, with "pretty": "false" it is compact
+        default_result = self.client.post("/terminal/list", json={}).json["result"]
+        compact_result = self.client.post("/terminal/list", json={"pretty": "false"}).json["result"]
+        self.assertIn("\n", default_result)
+        self.assertNotIn("\n", compact_result)
+        self.assertEqual(self.client.post("/terminal/list", json={}).json["result"], default_result)
+
+    def test_conditional_list(self):
+        self.client.post("/terminal/add", json=self._task_json(1))
+        response = self.client.get("/terminal/list?limit=5&sort_by=deadline&descending=true")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.json["result"])), 1)
+        etag = response.headers["ETag"]
+        self.assertIn("private", response.headers["Cache-Control"])
+
+        response, queries = self._count_task_queries(
+            lambda: self.client.get("/terminal/list?limit=5", headers={"If-None-Match": etag}))
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(queries, 0)
+
+        self.client.post("/terminal/add", json=self._task_json(2))
+        response = self.client.get("/terminal/list?limit=5", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        self.assertEqual(len(json.loads(response.json["result"])), 2)
+
+    def test_conditional_view(self):
+        response = self.client.post("/terminal/add", json=self._task_json(1))
+        task_id = json.loads(self.client.get("/terminal/list").json["result"])[0]["task_id"]
+
+        response = self.client.get(f"/terminal/view?task_id={task_id}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.json["result"])["title"], "Imported 1")
+        response = self.client.get(f"/terminal/view?task_id={task_id}",
+                                   headers={"If-None-Match": response.headers["ETag"]})
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get("/terminal/view?task_id=12345")
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get("/terminal/view?task_id=cat")
+        self.assertEqual(response.status_code, 400)
+
+    def test_structured_results(self):
+        self.client.post("/terminal/add", json=self._task_json(1))
+        response = self.client.post("/terminal/list", json={"format": "structured"})
+        self.assertEqual(response.json["result"][0]["title"], "Imported 1")
+        self.assertNotIn(b"\n", response.data)
+
+        task_id = response.json["result"][0]["task_id"]
+        response = self.client.post("/terminal/view", json={"task_id": str(task_id), "format": "structured"})
+        self.assertEqual(response.json["result"]["deadline"], "2030-01-02T12:00:00")
+        self.assertNotIn("user_id", response.json["result"])
+
+        response = self.client.get(f"/terminal/view?task_id={task_id}&format=structured&pretty=true")
+        self.assertIn(b"\n", response.data)
+        self.assertIsInstance(response.json["result"], dict)
+
+    def test_tree_move_and_delete_tree(self):
+        for i in range(3):
+            self.client.post("/terminal/add", json=self._task_json(i))
+        first, second, third = [task["task_id"] for task in
+                                self.client.post("/terminal/list", json={"format": "structured"}).json["result"]]
+        self.assertEqual(self.client.post("/terminal/move", json={"task_id": second, "new_parent_task_id": first})
+                         .status_code, 200)
+        self.assertEqual(self.client.post("/terminal/move", json={"task_id": third, "new_parent_task_id": second})
+                         .status_code, 200)
+        response = self.client.post("/terminal/move", json={"task_id": first, "new_parent_task_id": third})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(f"/terminal/tree?task_id={first}&max_depth=1&format=structured")
+        root = response.json["result"][0]
+        self.assertEqual(root["task_id"], first)
+        self.assertEqual([child["task_id"] for child in root["children"]], [second])
+        self.assertEqual(root["children"][0]["children"], [])
+
+        response = self.client.post("/terminal/delete_tree", json={"task_id": str(second)})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post("/terminal/tree", json={"format": "structured"})
+        self.assertEqual(response.json["result"], [dict(root, children=[])])
+
+    def test_status_and_stats(self):
+        for i in range(3):
+            self.client.post("/terminal/add", json=self._task_json(i))
+        task_ids = [task["task_id"] for task in
+                    self.client.post("/terminal/list", json={"format": "structured"}).json["result"]]
+        response = self.client.post("/terminal/status", json={"task_id": task_ids[0], "status": "done"})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post("/terminal/status", json={"task_id": task_ids[0], "status": "forgotten"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post("/terminal/status", json={"task_id": 12345, "status": "done"})
+        self.assertEqual(response.status_code, 404)
+
+        response = self.client.get("/terminal/stats?date_from=2030-01-01&date_to=2030-01-02&format=structured")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["result"]["by_status"], {"todo": 1, "in_progress": 0, "done": 1})
+        response = self.client.get("/terminal/stats?date_from=2030-01-01&date_to=2030-01-02",
+                                   headers={"If-None-Match": response.headers["ETag"]})
+        self.assertEqual(response.status_code, 304)
+        response = self.client.post("/terminal/stats", json={"date_from": "2030-01-02", "date_to": "2030-01-01"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_patch_edit(self):
+        self.client.post("/terminal/add", json=self._task_json(1))
+        task_id = self.client.post("/terminal/list", json={"format": "structured"}).json["result"][0]["task_id"]
+        response = self.client.patch("/terminal/edit", json={"task_id": str(task_id), "est_time_days": 3,
+                                                             "description": None})
+        self.assertEqual(response.status_code, 200)
+        task = self.client.post("/terminal/view", json={"task_id": str(task_id), "format": "structured"}).json["result"]
+        self.assertEqual((task["title"], task["est_time_days"], task["description"]), ("Imported 1", 3, None))
+
+        response = self.client.patch("/terminal/edit", json={"task_id": str(task_id)})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.patch("/terminal/edit", json={"task_id": str(task_id), "title": None})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.patch("/terminal/edit", json={"task_id": "12345", "title": "Missing"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_next(self):
+        for i in range(3):
+            self.client.post("/terminal/add", json=self._task_json(i))
+        response = self.client.post("/terminal/next", json={"limit": 2, "format": "structured"})
+        self.assertEqual(response.status_code, 200)
+        # same deadlines apart from a day, the more important one wins
+        self.assertEqual([task["title"] for task in response.json["result"]], ["Imported 2", "Imported 1"])
+        for task in response.json["result"]:
+            self.assertNotIn("user_id", task)
+            self.assertNotIn("parent_task_id", task)
+        response = self.client.post("/terminal/next", json={"limit": 0})
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch(self):
+        operations = [{"command": "add", "args": self._task_json(i)} for i in range(3)]
+        operations.append({"command": "view", "args": {"task_id": "12345"}})
+        response = self.client.post("/terminal/batch", json={"operations": operations, "format": "structured"})
+        self.assertEqual(response.status_code, 200)
+        task_ids = [result["result"] for result in response.json["result"][:3]]
+        self.assertEqual(response.json["result"][3]["status"], "error")
+
+        operations = [{"command": "delete", "args": {"task_id": str(task_id)}} for task_id in task_ids[:2]]
+        operations.append({"command": "view", "args": {"task_id": task_ids[2]}})
+        response = self.client.post("/terminal/batch", json={"operations": operations, "format": "structured"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["result"][2]["result"]["title"], "Imported 2")
+        self.assertNotIn("user_id", response.json["result"][2]["result"])
+        response = self.client.post("/terminal/list", json={"format": "structured"})
+        self.assertEqual([task["task_id"] for task in response.json["result"]], task_ids[2:])
+
+        response = self.client.post("/terminal/batch", json={"operations": operations[:1], "atomic": True})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post("/terminal/batch", json={"operations": []})
+        self.assertEqual(response.status_code, 400)
+
+    def test_logged_in_user_is_cached(self):
+        statements = []
+        def record_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        self.client.post("/terminal/list", json={})
+        g.pop("_login_user")  # as in a new app context, so that the user is loaded again
+        event.listen(db.engine, "before_cursor_execute", record_statement)
+        try:
+            response = self.client.post("/terminal/list", json={})
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record_statement)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([statement for statement in statements if re.search(r'FROM "?user\b', statement)])
+        self.assertGreater(user_cache.stats()["hits"], 0)
+
+        self.client.get("/logout")
+        self.assertIsNone(user_cache.get(1))
+
+    def test_list_requires_login(self):
+        anonymous_client = self.app.test_client()
+        with self.app.app_context():
+            response = anonymous_client.post("/terminal/list", json={})
+        self.assertEqual(response.status_code, 302)
@@ -0,0 +1,48 @@
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import patch
+
+from ..website.user_cache import UserCache
+
+
+def make_user(user_id):
+    return SimpleNamespace(id=user_id, username=f"user{user_id}", email=f"user{user_id}@test.com")
+
+
+class TestUserCache(TestCase):
+
+    def test_get_set(self):
+        cache = UserCache(ttl=60, max_entries=10)
+        self.assertIsNone(cache.get(1))
+        cached_user = cache.set(make_user(1))
+        self.assertEqual(cached_user.get_id(), "1")
+        self.assertTrue(cached_user.is_authenticated)
+
+        self.assertEqual(cache.get(1).username, "user1")
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1, "hit_rate": 0.5, "size": 1})
+
+    def test_entries_expire(self):
+        cache = UserCache(ttl=60, max_entries=10)
+        with patch("time.monotonic", return_value=1000.0):
+            cache.set(make_user(1))
+        with patch("time.monotonic", return_value=1059.0):
+            self.assertIsNotNone(cache.get(1))
+        with patch("time.monotonic", return_value=1060.0):
+            self.assertIsNone(cache.get(1))
+
+    def test_invalidate_and_size_bound(self):
+        cache = UserCache(ttl=60, max_entries=2)
+        for user_id in [1, 2]:
+            cache.set(make_user(user_id))
+        cache.get(1)
+        cache.set(make_user(3))
+        self.assertIsNone(cache.get(2))  # least recently used
+        self.assertIsNotNone(cache.get(1))
+
+        cache.invalidate(1)
+        self.assertIsNone(cache.get(1))
+
+    def test_disabled(self):
+        cache = UserCache(ttl=0)
+        self.assertEqual(cache.set(make_user(1)).username, "user1")
+        self.assertIsNone(cache.get(1))
@@ -0,0 +1,90 @@
+"""
+Admission control of the authentication endpoints. Requests over the limit are rejected before any password is
+hashed, so that guessing passwords or mass signups cannot keep the password hashing pool busy.
+
+Limits are counted in a sliding window of ADMISSION_WINDOW seconds, separately in every worker process:
+ - failed logins per client IP (LOGIN_FAILURES_PER_IP) and per username (LOGIN_FAILURES_PER_USERNAME)
+ - signups per client IP (SIGNUPS_PER_IP)
+"""
+from collections import OrderedDict, deque
+from flask import Flask
+from threading import Lock
+import time
+
+
+class AdmissionRejected(Exception):
+    """Raised (or returned in a response) when a request is over the limit"""
+
+
+class AttemptLimiter:
+    """Counts attempts per key in a sliding time window. Remembers at most max_keys keys (least recently used go)"""
+    def __init__(self, max_attempts: int, window: float, max_keys: int = 10000):
+        self.max_attempts = max_attempts
+        self.window = window
+        self.max_keys = max_keys
+        self._attempts = OrderedDict()  # key -> deque of attempt times
+        self._lock = Lock()
+
+    def _recent_attempts(self, key: str, now: float) -> deque:
+        attempts = self._attempts.get(key)
+        if attempts is None:
+            attempts = self._attempts[key] = deque()
+            while len(self._attempts) > self.max_keys:
+                self._attempts.popitem(last=False)
+        self._attempts.move_to_end(key)
+        while attempts and attempts[0] <= now - self.window:
+            attempts.popleft()
+        return attempts
+
+    def is_allowed(self, key: str) -> bool:
+        """False when key already has max_attempts attempts in the window"""
+        with self._lock:
+            return len(self._recent_attempts(key, time.monotonic())) < self.max_attempts
+
+    def record(self, key: str):
+        with self._lock:
+            now = time.monotonic()
+            self._recent_attempts(key, now).append(now)
+
+    def clear(self):
+        with self._lock:
+            self._attempts.clear()
+
+
+class AuthAdmission:
+    def __init__(self):
+        self.init_limits()
+
+    def init_limits(self, window: float = 60, login_failures_per_ip: int = 30, login_failures_per_username: int = 10,
+                    signups_per_ip: int = 10):
+        self.login_failures_by_ip = AttemptLimiter(login_failures_per_ip, window)
+        self.login_failures_by_username = AttemptLimiter(login_failures_per_username, window)
+        self.signups_by_ip = AttemptLimiter(signups_per_ip, window)
+
+    def init_app(self, app: Flask):
+        self.init_limits(
+            window=app.config.get("ADMISSION_WINDOW", 60),
+            login_failures_per_ip=app.config.get("LOGIN_FAILURES_PER_IP", 30),
+            login_failures_per_username=app.config.get("LOGIN_FAILURES_PER_USERNAME", 10),
+            signups_per_ip=app.config.get("SIGNUPS_PER_IP", 10),
+        )
+
+    def admit_login(self, ip: str, username: str) -> bool:
+        return self.login_failures_by_ip.is_allowed(ip) and self.login_failures_by_username.is_allowed(username)
+
+    def login_failed(self, ip: str, username: str):
+        self.login_failures_by_ip.record(ip)
+        self.login_failures_by_username.record(username)
+
+    def admit_signup(self, ip: str) -> bool:
+        if not self.signups_by_ip.is_allowed(ip):
+            return False
+        self.signups_by_ip.record(ip)
+        return True
+
+    def clear(self):
+        for limiter in [self.login_failures_by_ip, self.login_failures_by_username, self.signups_by_ip]:
+            limiter.clear()
+
+
+auth_admission = AuthAdmission()
@@ -0,0 +1,152 @@
+"""
+ASGI version of the app, run by asgi.py with uvicorn (or Gunicorn with uvicorn workers). Requires asgiref.
+
+Requests are passed to the Flask app through asgiref's WSGI adapter, which runs them in a pool of threads like the
+sync server does. Only GET /terminal/events is served by the event loop itself - a server-sent events stream that
+sends the revision of user's tasks whenever they change (see change_feed.py). An idle stream costs a coroutine and
+a few objects instead of a worker thread, so thousands of clients can stay connected to one process.
+
+Every event looks like:
+    event: tasks
+    id: <revision>
+    data: {"revision": <revision>}
+A client that reconnects with Last-Event-ID of the current revision does not get the same event again.
+"""
+from asgiref.wsgi import WsgiToAsgi
+from flask import Flask
+from flask_login import current_user
+from sqlalchemy.exc import SQLAlchemyError
+from typing import Optional
+import asyncio
+
+from .change_feed import ChangeFeed, change_feed
+from .db_operations import get_task_revisions, try_getting_task_revision
+from .utils import dumps
+
+
+EVENTS_PATH = "/terminal/events"
+
+
+class TaskManagerASGI:
+    def __init__(self, app: Flask, feed: ChangeFeed = change_feed):
+        self.app = app
+        self.feed = feed
+        self.wsgi = WsgiToAsgi(app)
+        # how often revisions changed by other processes are looked for, 0 disables it
+        self.poll_interval = app.config.get("CHANGE_FEED_POLL_INTERVAL", 2)
+        # idle streams get a comment this often, so that proxies do not close them
+        self.heartbeat_interval = app.config.get("CHANGE_FEED_HEARTBEAT", 15)
+        self._poller = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http" and scope["path"] == EVENTS_PATH:
+            await self._events(scope, receive, send)
+        else:
+            await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self._poller is not None:
+                    self._poller.cancel()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _events(self, scope, receive, send):
+        if scope["method"] != "GET":
+            await self._send_json(send, 405, {"status": "error", "message": "Method not allowed"})
+            return
+        user_id = await asyncio.to_thread(self._authenticate, scope)
+        if user_id is None:
+            await self._send_json(send, 401, {"status": "error", "message": "Log in to receive changes of your tasks"})
+            return
+
+        # subscribed before reading the revision, so that no change is missed in between
+        subscription = self.feed.subscribe(user_id)
+        self._start_poller()
+        disconnected = asyncio.ensure_future(self._wait_for_disconnect(receive))
+        try:
+            await send({"type": "http.response.start", "status": 200, "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),  # nginx would buffer the stream otherwise
+            ]})
+            await send({"type": "http.response.body", "body": b"retry: 5000\n\n", "more_body": True})
+            last_event_id = dict(scope["headers"]).get(b"last-event-id", b"")
+            sent_revision = int(last_event_id) if last_event_id.isdigit() else None
+            revision = await asyncio.to_thread(self._read_revision, user_id)
+            while True:
+                if revision is not None and revision != sent_revision:
+                    await send({"type": "http.response.body", "body": self._event(revision), "more_body": True})
+                    sent_revision = revision
+                waiting = asyncio.ensure_future(subscription.wait(self.heartbeat_interval))
+                await asyncio.wait({waiting, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                if disconnected.done():
+                    waiting.cancel()
+                    return
+                changed, revision = waiting.result()
+                if not changed:
+                    await send({"type": "http.response.body", "body": b": keep-alive\n\n", "more_body": True})
+                elif revision is None:
+                    revision = await asyncio.to_thread(self._read_revision, user_id)
+        finally:
+            self.feed.unsubscribe(subscription)
+            disconnected.cancel()
+
+    @staticmethod
+    def _event(revision: int) -> bytes:
+        return b"event: tasks\nid: %d\ndata: %s\n\n" % (revision, dumps({"revision": revision}))
+
+    @staticmethod
+    async def _wait_for_disconnect(receive):
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    @staticmethod
+    async def _send_json(send, status: int, payload: dict):
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": dumps(payload)})
+
+    def _authenticate(self, scope) -> Optional[int]:
+        """Id of the user logged in by the cookies of the request, None for anonymous requests"""
+        headers = [(name.decode("latin1"), value.decode("latin1")) for name, value in scope["headers"]]
+        client_address = (scope.get("client") or ("",))[0]
+        # own app context, so that flask_login does not reuse a user loaded for another request
+        with self.app.app_context(), self.app.test_request_context(
+                scope["path"], headers=headers, environ_base={"REMOTE_ADDR": client_address}):
+            if not current_user.is_authenticated:
+                return None
+            return int(current_user.id)
+
+    def _read_revision(self, user_id: int) -> Optional[int]:
+        with self.app.app_context():
+            revision = try_getting_task_revision(user_id)
+        return int(revision.message) if revision.success else None
+
+    def _read_revisions(self, user_ids: list[int]) -> dict[int, int]:
+        with self.app.app_context():
+            return get_task_revisions(user_ids)
+
+    def _start_poller(self):
+        if self.poll_interval > 0 and (self._poller is None or self._poller.done()):
+            self._poller = asyncio.ensure_future(self._poll_revisions())
+
+    async def _poll_revisions(self):
+        """Publishes revisions of subscribed users changed by other processes, one query per interval"""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            user_ids = self.feed.subscribed_users()
+            if not user_ids:
+                continue
+            try:
+                revisions = await asyncio.to_thread(self._read_revisions, user_ids)
+            except SQLAlchemyError:
+                continue  # the next poll tries again
+            for user_id, revision in revisions.items():
+                self.feed.publish(user_id, revision)
@@ -1,27 +1,63 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for
-from flask_login import login_required, login_user, logout_user
+from flask_login import login_required, login_user, logout_user, current_user
 from .db_models import User
+from .user_cache import user_cache
+from .password_hashing import password_hasher, PasswordHashingBusy
+from .admission import auth_admission, AdmissionRejected
 from . import db
-from sqlalchemy.exc import SQLAlchemyError, NoResultFound
+from sqlalchemy import or_, select
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError, NoResultFound
+from typing import Optional
 from .models.responses import SimpleResponse
 
 auth = Blueprint("auth", __name__)
 
 
 def perform_login(username, password) -> SimpleResponse:
+    ip = request.remote_addr or ""
+    if not auth_admission.admit_login(ip, username):
+        err = AdmissionRejected("Too many failed login attempts, try again in a minute")
+        return SimpleResponse(False, str(err), err)
     try:
         user = User.query.filter_by(username=username).one()
     except NoResultFound as e:
+        auth_admission.login_failed(ip, username)
         return SimpleResponse(False, f"Username {username} not found", e)
     except SQLAlchemyError as e:
         return SimpleResponse(False, f"Database error: {e}", e)
-    password_correct = user.check_password(password)
+    try:
+        password_correct = user.check_password(password)
+    except PasswordHashingBusy as e:
+        return SimpleResponse(False, str(e), e)
     if password_correct is not True:
+        auth_admission.login_failed(ip, username)
         return SimpleResponse(False, "Wrong password!")
 
+    if password_hasher.needs_rehash(user.password_hash):
+        rehash_password(user, password)
     login_user(user, remember=True)
+    user_cache.set(user)  # the following requests of the user will not have to load them
     return SimpleResponse(True)
 
+def rehash_password(user: User, password: str):
+    """
+    Replaces the hash of user's (just checked) password by one made with the current hashing method. A failure only
+    postpones it to the next login
+    """
+    try:
+        user.set_password(password)
+        db.session.commit()
+    except (PasswordHashingBusy, SQLAlchemyError):
+        db.session.rollback()
+
+def _rejection_code(exception) -> int:
+    """HTTP code of a page rendered after a failed login or signup"""
+    if isinstance(exception, AdmissionRejected):
+        return 429
+    if isinstance(exception, PasswordHashingBusy):
+        return 503
+    return 200
+
 @auth.route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "GET":
@@ -35,7 +71,7 @@ def login():
         return redirect(url_for("views.index"))
     else:
         flash(f"You have not been logged in: {result.message}", category="error")
-        return render_template("login.html")
+        return render_template("login.html"), _rejection_code(result.exception)
 
 
 
@@ -47,6 +83,35 @@ def is_username_available(username) -> bool:
     existence_query = User.query.filter_by(username=username).exists()
     return not db.session.query(existence_query).scalar()
 
+# messages for unique fields of User that are already used by another account
+TAKEN_FIELD_MESSAGES = {
+    "username": "Username {username} is already taken!",
+    "email": "Account registered on {email} already exists!",
+}
+
+def find_taken_fields(email, username) -> list[str]:
+    """Names of the fields (of TAKEN_FIELD_MESSAGES) already used by other accounts, checked with one query"""
+    query = (
+        select(User.username == username, User.email == email)
+        .where(or_(User.username == username, User.email == email))
+    )
+    taken = set()
+    for username_taken, email_taken in db.session.execute(query):
+        if username_taken:
+            taken.add("username")
+        if email_taken:
+            taken.add("email")
+    return [field for field in TAKEN_FIELD_MESSAGES if field in taken]
+
+def _taken_field_of(error: IntegrityError) -> Optional[str]:
+    """The unique field violated by an INSERT, read from the database's error message"""
+    message = str(error.orig)
+    for field in TAKEN_FIELD_MESSAGES:
+        # SQLite: "UNIQUE constraint failed: user.username", PostgreSQL: "... constraint "user_username_key""
+        if f"user.{field}" in message or f"user_{field}_key" in message:
+            return field
+    return None
+
 def validate_signup(email, username, password1, password2) -> bool:
     success = True
     if password1 != password2:
@@ -58,21 +123,28 @@ def validate_signup(email, username, password1, password2) -> bool:
     if len(password1) <=7: #passwords are equal at this point
         flash("Password too short! Should be at least 8 characters", category="error")
         success = False
-    # check if either email or username already used
-    if is_username_available(username) is False:
-        flash(f"Username {username} is already taken!", category="error")
-        success = False
-    if is_email_available(email) is False:
-        flash(f"Account registered on {email} already exists!", category="error")
+    # check if either email or username already used. It saves hashing the password of most duplicate signups, but
+    # only the unique constraints can be relied on - a concurrent signup may take them in the meantime
+    for field in find_taken_fields(email, username):
+        flash(TAKEN_FIELD_MESSAGES[field].format(email=email, username=username), category="error")
         success = False
     return success
 
 def register_user(email, username, password) -> SimpleResponse:
     """Function to register a new user in the database."""
-    new_user = User(email, username, password)
+    try:
+        new_user = User(email, username, password)
+    except PasswordHashingBusy as e:
+        return SimpleResponse(False, str(e), e)
     try:
         db.session.add(new_user)
         db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        field = _taken_field_of(e)
+        if field is None:
+            return SimpleResponse(False, str(e), e)
+        return SimpleResponse(False, TAKEN_FIELD_MESSAGES[field].format(email=email, username=username), e)
     except SQLAlchemyError as e:
         db.session.rollback()
         return SimpleResponse(False, str(e), e)
@@ -82,6 +154,9 @@ def register_user(email, username, password) -> SimpleResponse:
 def register():
     if request.method == "GET":
         return render_template("register.html")
+    if not auth_admission.admit_signup(request.remote_addr or ""):
+        flash("Too many accounts registered from your address, try again in a minute", category="error")
+        return render_template("register.html"), 429
     email = request.form["email"]
     username = request.form["username"]
     password1 = request.form["password1"]
@@ -94,10 +169,11 @@ def register():
         flash("Account registered successfully!", category="success")
     if result.success is not True:
         flash(f"Account was not registered: {result.message}", category="error")
-    return render_template("register.html")
+    return render_template("register.html"), _rejection_code(result.exception)
 
 @auth.route("/logout")
 @login_required
 def logout():
+    user_cache.invalidate(current_user.id)
     logout_user()
     return render_template("after_logout.html")
\ No newline at end of file
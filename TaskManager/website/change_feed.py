@@ -0,0 +1,89 @@
+"""
+Feed of changes of users' tasks, delivered to the server-sent events streams of the ASGI app (see asgi.py).
+
+db_operations publishes to the feed after every commit that changed tasks of a user, which wakes the streams of that
+user in this process at once. Changes made by other processes (e.g. the sync Gunicorn workers) are found by the ASGI
+app polling task revisions of the subscribed users, so they arrive within CHANGE_FEED_POLL_INTERVAL seconds.
+
+Publishing is thread safe and cheap when nobody is subscribed, subscriptions live in an asyncio event loop.
+"""
+from threading import Lock
+from typing import Optional
+import asyncio
+
+
+class Subscription:
+    """Changes of one user's tasks, as seen by one stream. Created by ChangeFeed.subscribe()"""
+    def __init__(self, user_id: int, loop: asyncio.AbstractEventLoop):
+        self.user_id = user_id
+        self.loop = loop
+        self._changed = asyncio.Event()
+        self._revision = None
+
+    def _notify(self, revision: Optional[int]):
+        self._revision = revision
+        self._changed.set()
+
+    async def wait(self, timeout: float) -> tuple[bool, Optional[int]]:
+        """
+        Waits at most timeout seconds for a change. Returns whether tasks changed and the new revision, if the
+        publisher knew it. Changes published while the stream was busy are not lost, they end the next wait at once
+        """
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False, None
+        self._changed.clear()
+        return True, self._revision
+
+
+class ChangeFeed:
+    def __init__(self):
+        self._lock = Lock()
+        self._subscriptions = {}  # user_id -> set of Subscription
+        self._revisions = {}  # user_id -> last published revision, of subscribed users only
+
+    def subscribe(self, user_id: int) -> Subscription:
+        """Has to be called from the event loop of the stream"""
+        subscription = Subscription(user_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.user_id, None)
+                self._revisions.pop(subscription.user_id, None)
+
+    def publish(self, user_id: int, revision: Optional[int] = None):
+        """
+        Notifies subscriptions of the user that their tasks changed. revision is the new revision of user's tasks
+        when the caller knows it - a revision already published is then ignored. Can be called from any thread
+        """
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+            if not subscriptions:
+                return
+            if revision is not None:
+                if self._revisions.get(user_id) == revision:
+                    return
+                self._revisions[user_id] = revision
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._notify, revision)
+            except RuntimeError:  # the loop was closed, the subscription goes away with it
+                pass
+
+    def subscribed_users(self) -> list[int]:
+        with self._lock:
+            return list(self._subscriptions)
+
+    def subscription_count(self) -> int:
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+
+change_feed = ChangeFeed()
@@ -0,0 +1,54 @@
+"""Maintenance commands, available through the Flask CLI: flask --app main <command>"""
+from flask import Flask
+from flask.cli import with_appcontext
+import click
+
+from . import db
+
+
+@click.command("rebuild-search-index")
+@with_appcontext
+def rebuild_search_index_command():
+    """Rebuilds the full-text index of tasks from scratch"""
+    from .db_migrations import rebuild_task_search_index
+    if db.engine.dialect.name != "sqlite":
+        raise click.ClickException("The full-text index is kept only in SQLite databases")
+    rebuild_task_search_index()
+    db.session.commit()
+    click.echo("Search index rebuilt")
+
+@click.command("reconcile-task-counts")
+@click.option("--user-id", type=int, default=None, help="Reconcile only counts of this user")
+@with_appcontext
+def reconcile_task_counts_command(user_id):
+    """Recomputes task statistics from the tasks and corrects counts that drifted"""
+    from .db_operations import reconcile_task_counts
+    corrected = reconcile_task_counts(user_id)
+    click.echo(f"Corrected {corrected} task count rows")
+
+@click.command("db-upgrade")
+@click.option("--to", "target_version", type=int, default=None, help="Stop at this version of the schema")
+@with_appcontext
+def db_upgrade_command(target_version):
+    """Applies pending schema migrations"""
+    from .db_migrations import upgrade_database, get_schema_version
+    applied = upgrade_database(target_version)
+    if not applied:
+        click.echo(f"Database schema is up to date (version {get_schema_version()})")
+    for version in applied:
+        click.echo(f"Applied migration {version}")
+
+@click.command("db-version")
+@with_appcontext
+def db_version_command():
+    """Shows the version of the database schema and migrations waiting to be applied"""
+    from .db_migrations import get_schema_version, pending_migrations
+    click.echo(f"Schema version: {get_schema_version()}")
+    for version, description in pending_migrations():
+        click.echo(f"Pending migration {version}: {description}")
+
+def register_commands(app: Flask):
+    app.cli.add_command(db_upgrade_command)
+    app.cli.add_command(db_version_command)
+    app.cli.add_command(rebuild_search_index_command)
+    app.cli.add_command(reconcile_task_counts_command)
@@ -0,0 +1,271 @@
+"""
+Versioned schema migrations. Migrations are numbered and applied in order, every applied one is recorded in the
+schema_migration table, so upgrade_database() (or 'flask db-upgrade') brings a database created by any older version
+of the app to the current schema.
+
+Databases created before migrations were versioned have no schema_migration table and start at version 0. That is
+why every migration checks what already exists before creating it, and why migration 1 may create tables in their
+current shape - the following migrations then find their columns and indexes already there.
+
+Steps are safe to run while the app serves requests: backfills go in short batches with a commit after each one, and
+on PostgreSQL indexes are built with CREATE INDEX CONCURRENTLY, which does not block writes to the table. SQLite has
+no such option, there the build holds the write lock, which takes a few seconds even for large task tables.
+"""
+from . import db
+from .db_models import SchemaMigration
+from contextlib import contextmanager
+from datetime import datetime
+from hashlib import sha1
+from os import path
+from sqlalchemy import func, inspect, select, text, update
+from sqlalchemy.schema import CreateColumn
+from tempfile import gettempdir
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows, migrations of SQLite databases are not locked there
+    fcntl = None
+
+
+BACKFILL_BATCH_SIZE = 1000
+# key of the PostgreSQL advisory lock held while migrating
+MIGRATION_LOCK_KEY = 7401
+
+MIGRATIONS = []  # (version, description, function), ordered by version
+
+def migration(version: int, description: str):
+    """Registers the decorated function as the migration to given version of the schema"""
+    def register(function):
+        if MIGRATIONS and MIGRATIONS[-1][0] >= version:
+            raise ValueError(f"Migration {version} must have a higher version than migration {MIGRATIONS[-1][0]}")
+        MIGRATIONS.append((version, description, function))
+        return function
+    return register
+
+def latest_version() -> int:
+    return MIGRATIONS[-1][0]
+
+def get_schema_version() -> int:
+    """Version of the database schema, 0 for databases never migrated. Requires an application context"""
+    if not inspect(db.engine).has_table(SchemaMigration.__tablename__):
+        return 0
+    return db.session.scalar(select(func.max(SchemaMigration.version))) or 0
+
+def pending_migrations() -> list[tuple[int, str]]:
+    """(version, description) of the migrations not applied to the database yet"""
+    schema_version = get_schema_version()
+    return [(version, description) for version, description, _ in MIGRATIONS if version > schema_version]
+
+def upgrade_database(target_version: Optional[int] = None) -> list[int]:
+    """
+    Applies the migrations newer than the database schema, up to target_version (all of them by default). Every
+    migration is recorded as soon as it finishes, so an interrupted upgrade continues where it stopped. Returns
+    versions of the applied migrations. Requires an application context.
+    """
+    applied = []
+    with _migration_lock():
+        SchemaMigration.__table__.create(bind=db.engine, checkfirst=True)
+        schema_version = get_schema_version()
+        for version, description, function in MIGRATIONS:
+            if version <= schema_version or (target_version is not None and version > target_version):
+                continue
+            # CREATE INDEX CONCURRENTLY waits for every open transaction, including an idle one of this session
+            db.session.commit()
+            function()
+            db.session.add(SchemaMigration(version=version, description=description, applied_at=datetime.now()))
+            db.session.commit()
+            applied.append(version)
+    return applied
+
+@contextmanager
+def _migration_lock():
+    """Only one process migrates at a time, e.g. when several Gunicorn workers start together"""
+    if db.engine.dialect.name == "postgresql":
+        with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+            try:
+                yield
+            finally:
+                connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        return
+    database = db.engine.url.database
+    if db.engine.dialect.name != "sqlite" or fcntl is None or not database or database == ":memory:":
+        yield
+        return
+    # the lock file is kept out of the directory of the database, one per database file
+    database_key = sha1(path.abspath(database).encode()).hexdigest()[:16]
+    with open(path.join(gettempdir(), f"taskmanager-{database_key}.migration-lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _add_column(model, column_name: str) -> bool:
+    """
+    ALTER TABLE ... ADD COLUMN for a column of the model missing in its table. It must be nullable or have a server
+    default, which becomes the value of existing rows. Returns whether the column was added.
+    """
+    table = model.__table__
+    column = table.columns[column_name]
+    existing_columns = {existing["name"] for existing in inspect(db.engine).get_columns(table.name)}
+    if column.name in existing_columns:
+        return False
+    if not column.nullable and column.server_default is None:
+        raise RuntimeError(f"Cannot add NOT NULL column {table.name}.{column.name} to existing table")
+    column_ddl = CreateColumn(column).compile(dialect=db.engine.dialect)
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql(f'ALTER TABLE "{table.name}" ADD COLUMN {column_ddl}')
+    return True
+
+def _create_index(model, index_name: str):
+    """Creates an index declared on the model unless it exists, without blocking writes on PostgreSQL"""
+    index = next(index for index in model.__table__.indexes if index.name == index_name)
+    if db.engine.dialect.name != "postgresql":
+        index.create(bind=db.engine, checkfirst=True)
+        return
+    columns = ", ".join(f'"{column.name}"' for column in index.columns)
+    _create_index_concurrently(index_name, f'"{index.table.name}" ({columns})')
+
+def _create_index_concurrently(index_name: str, definition: str):
+    """
+    CREATE INDEX CONCURRENTLY on PostgreSQL. A concurrent build that failed (or was interrupted) leaves an invalid
+    index behind, such index is dropped and built again
+    """
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        invalid = connection.execute(text(
+            "SELECT NOT pg_index.indisvalid FROM pg_index JOIN pg_class ON pg_class.oid = pg_index.indexrelid "
+            "WHERE pg_class.relname = :name"
+        ), {"name": index_name}).scalar()
+        if invalid:
+            connection.exec_driver_sql(f"DROP INDEX CONCURRENTLY {index_name}")
+        connection.exec_driver_sql(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON {definition}")
+
+
+# The migrations. Released ones must never change, a change of the schema is always a new migration
+
+@migration(1, "create tables")
+def _create_tables():
+    db.create_all()  # creates only missing tables (along with their indexes)
+
+@migration(2, "add task.start_date")
+def _add_task_start_date():
+    from .db_models import Task
+    if _add_column(Task, "start_date"):
+        _backfill_task_start_date()
+
+def _backfill_task_start_date():
+    """Computes Task.start_date of tasks created before the column existed, one short transaction per batch"""
+    from .db_models import Task
+    last_id = 0
+    while True:
+        batch = db.session.execute(
+            select(Task.id, Task.deadline, Task.est_time_days)
+            .where(Task.id > last_id)
+            .order_by(Task.id)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not batch:
+            db.session.commit()
+            return
+        db.session.execute(update(Task), [
+            {"id": task_id, "start_date": Task.compute_start_date(deadline, est_time_days)}
+            for task_id, deadline, est_time_days in batch
+        ])
+        db.session.commit()
+        last_id = batch[-1].id
+
+TASK_INDEXES = ["ix_task_user_id", "ix_task_user_id_deadline", "ix_task_user_id_importance", "ix_task_parent_task_id",
+                "ix_task_user_id_start_date", "ix_task_user_id_est_time_days"]
+
+@migration(3, "indexes of task lists, trees and calendar")
+def _create_task_indexes():
+    from .db_models import Task
+    for index_name in TASK_INDEXES:
+        _create_index(Task, index_name)
+
+@migration(4, "full-text index of tasks")
+def _create_search_index():
+    if db.engine.dialect.name == "sqlite":
+        _create_task_search_index()
+    elif db.engine.dialect.name == "postgresql":
+        _create_index_concurrently("ix_task_search", f"task USING GIN (({TASK_SEARCH_VECTOR}))")
+
+@migration(5, "task status and counts of tasks per day")
+def _add_task_status():
+    from .db_models import Task, TaskDailyCount
+    from .db_operations import reconcile_task_counts
+    _add_column(Task, "status")
+    TaskDailyCount.__table__.create(bind=db.engine, checkfirst=True)
+    reconcile_task_counts()  # counts of tasks created before they were maintained
+
+# Full-text index of task titles and descriptions. It is an external content FTS5 table - it stores only the index,
+# texts are read from the task table - kept in sync by triggers, so every way of writing tasks (ORM, bulk inserts,
+# single-statement updates) updates it. prefix='2 3' speeds up prefix queries of short words.
+TASK_SEARCH_INDEX_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS task_fts USING fts5(
+        title, description, content='task', content_rowid='id', tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS task_fts_after_insert AFTER INSERT ON task BEGIN
+        INSERT INTO task_fts (rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS task_fts_after_delete AFTER DELETE ON task BEGIN
+        INSERT INTO task_fts (task_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS task_fts_after_update AFTER UPDATE OF title, description ON task BEGIN
+        INSERT INTO task_fts (task_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO task_fts (rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+]
+
+def _create_task_search_index():
+    """Creates the FTS5 index of tasks (SQLite only). When the index is new, it is filled with existing tasks"""
+    index_existed = db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'task_fts'")
+    ).first() is not None
+    for statement in TASK_SEARCH_INDEX_DDL:
+        db.session.execute(text(statement))
+    if not index_existed:
+        rebuild_task_search_index()
+    db.session.commit()
+
+# PostgreSQL has no FTS5, there the same search is done with a tsvector of the task, indexed with GIN. Title words
+# get weight A and description words weight B, so that ts_rank puts title matches first
+TASK_SEARCH_VECTOR = ("setweight(to_tsvector('simple', title), 'A') || "
+                      "setweight(to_tsvector('simple', coalesce(description, '')), 'B')")
+
+def rebuild_task_search_index():
+    """Recreates the whole full-text index from the task table. Does not commit"""
+    db.session.execute(text("INSERT INTO task_fts (task_fts) VALUES ('rebuild')"))
+
+@migration(6, "subtasks of deleted tasks become top-level tasks in the database")
+def _set_parent_null_on_delete():
+    if db.engine.dialect.name == "sqlite":
+        # foreign keys are not enforced on SQLite connections, the trigger does what ON DELETE SET NULL would
+        db.session.execute(text(TASK_PARENT_DELETE_TRIGGER_DDL))
+        db.session.commit()
+    elif db.engine.dialect.name == "postgresql":
+        _replace_parent_task_foreign_key()
+
+TASK_PARENT_DELETE_TRIGGER_DDL = """CREATE TRIGGER IF NOT EXISTS task_parent_after_delete AFTER DELETE ON task BEGIN
+    UPDATE task SET parent_task_id = NULL WHERE parent_task_id = old.id;
+END"""
+
+def _replace_parent_task_foreign_key():
+    """
+    Recreates the foreign key of task.parent_task_id with ON DELETE SET NULL. The new constraint is added NOT VALID
+    (in the same short transaction that drops the old one) and validated afterwards, which does not block writes
+    """
+    foreign_key = next(foreign_key for foreign_key in inspect(db.engine).get_foreign_keys("task")
+                       if foreign_key["constrained_columns"] == ["parent_task_id"])
+    if foreign_key["options"].get("ondelete", "").upper() == "SET NULL":
+        return
+    name = foreign_key["name"]
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql(f'ALTER TABLE task DROP CONSTRAINT "{name}"')
+        connection.exec_driver_sql(f'ALTER TABLE task ADD CONSTRAINT "{name}" FOREIGN KEY (parent_task_id) '
+                                   f'REFERENCES task (id) ON DELETE SET NULL NOT VALID')
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql(f'ALTER TABLE task VALIDATE CONSTRAINT "{name}"')
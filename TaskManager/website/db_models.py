@@ -1,10 +1,15 @@
 """Models for database"""
 from . import db
 from flask_login import UserMixin
-from werkzeug.security import check_password_hash, generate_password_hash
-from sqlalchemy import DateTime
+from .password_hashing import password_hasher
+from sqlalchemy import Date, DateTime
+from datetime import datetime, timedelta
+from typing import Optional
 
 
+# lifecycle of a task: it is created as "todo", then it is in progress and finally done (it can also be reopened)
+TASK_STATUSES = ("todo", "in_progress", "done")
+
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(100), unique=True, nullable=False)
@@ -18,11 +23,12 @@ class User(db.Model, UserMixin):
         self.username = username
         self.set_password(password)
 
+    # both hash in the password hashing pool and may raise PasswordHashingBusy
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password, method="scrypt")
+        self.password_hash = password_hasher.hash(password)
 
 class Task(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -32,14 +38,30 @@ class Task(db.Model):
     est_time_days = db.Column(db.Integer, nullable=True)
     description = db.Column(db.String(2000), nullable=True)
     user_id = db.Column(db.ForeignKey("user.id"), nullable=False)
-    parent_task_id = db.Column(db.ForeignKey("task.id"), nullable=True)
+    # subtasks of a deleted task become top-level tasks (SQLite does the same with a trigger, see migration 6)
+    parent_task_id = db.Column(db.ForeignKey("task.id", ondelete="SET NULL"), nullable=True)
+    # deadline - est_time_days, kept in sync by the code that writes deadline or est_time_days. Together with deadline
+    # it is the time span the task occupies in the calendar. Nullable only because it was added to existing databases
+    start_date = db.Column(DateTime, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default="todo", server_default="todo")
     children = db.relationship(
         "Task",
         backref=db.backref("parent", remote_side=[id]),
         lazy="select"
     )
 
-    def __init__(self, title, importance, deadline, est_time_days, description, user_id, parent_task_id):
+    # every query filters by owner first, the index on user_id alone also serves ORDER BY id (rowid is appended)
+    __table_args__ = (
+        db.Index("ix_task_user_id", "user_id"),
+        db.Index("ix_task_user_id_deadline", "user_id", "deadline"),
+        db.Index("ix_task_user_id_importance", "user_id", "importance"),
+        db.Index("ix_task_parent_task_id", "parent_task_id"),
+        db.Index("ix_task_user_id_start_date", "user_id", "start_date"),
+        db.Index("ix_task_user_id_est_time_days", "user_id", "est_time_days"),  # MAX(est_time_days) for one user
+    )
+
+    def __init__(self, title, importance, deadline, est_time_days, description, user_id, parent_task_id,
+                 status="todo"):
         self.title = title
         self.importance = importance
         self.deadline = deadline
@@ -47,6 +69,13 @@ class Task(db.Model):
         self.description = description
         self.user_id = user_id
         self.parent_task_id = parent_task_id
+        self.status = status
+        self.start_date = Task.compute_start_date(deadline, est_time_days)
+
+    @staticmethod
+    def compute_start_date(deadline: datetime, est_time_days: Optional[int]) -> datetime:
+        """Value of start_date for given deadline and estimated time, tasks without an estimate take no time"""
+        return deadline - timedelta(days=est_time_days or 0)
 
     def to_dict(self):
         task_dict = {
@@ -57,6 +86,30 @@ class Task(db.Model):
             "est_time_days": self.est_time_days,
             "description": self.description,
             "user_id": self.user_id,
-            "parent_task_id": self.parent_task_id
+            "parent_task_id": self.parent_task_id,
+            "status": self.status
         }
         return task_dict
+
+class TaskRevision(db.Model):
+    """Per-user counter bumped by every change of user's tasks. Used as a version (ETag) of everything user can read"""
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    revision = db.Column(db.Integer, nullable=False, default=0)
+
+class TaskDailyCount(db.Model):
+    """
+    Number of user's tasks with given status and importance that have their deadline on given day. Maintained by the
+    write functions of db_operations in the same transaction as the change of tasks, so statistics of any period are
+    read from these rows instead of the tasks. db_operations.reconcile_task_counts recomputes them from the tasks.
+    """
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    day = db.Column(Date, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    importance = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class SchemaMigration(db.Model):
+    """Migration of db_migrations applied to the database, the highest version is the version of the schema"""
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(DateTime, nullable=False)
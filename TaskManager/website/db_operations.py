@@ -1,16 +1,94 @@
 from . import db
-from .models import AddTaskRequestModel, EditTaskRequestModel
-from .models.responses import SimpleResponse, ManyTasksResponse, OneTaskResponse
-from .db_models import Task
-from typing import Optional
+from .models import AddTaskRequestModel, EditTaskRequestModel, ListTasksRequestModel, TaskTreeRequestModel, \
+    MoveTaskRequestModel, CalendarRangeRequestModel, SearchTasksRequestModel, SetTaskStatusRequestModel, \
+    TaskStatsRequestModel, TargetSpecificTaskModel, BatchOperationModel, BatchRequestModel, PatchTaskRequestModel, \
+    UrgentTasksRequestModel
+from .models.responses import SimpleResponse, ManyTasksResponse, OneTaskResponse, TasksPageResponse, \
+    ImportTasksResponse, TaskStatsResponse, BatchResponse
+from .db_models import Task, TaskRevision, TaskDailyCount, TASK_STATUSES
+from .db_migrations import TASK_SEARCH_VECTOR
+from .task_cache import task_list_cache
+from .change_feed import change_feed
+from .utils import encode_cursor, decode_cursor, assign_lanes, urgency, threshold_top_k
+from collections import Counter
+from datetime import datetime, timedelta
+import re
+from typing import Iterable, Iterator, Optional
+from pydantic import ValidationError
+from sqlalchemy import Date, DateTime, Integer, Interval, and_, delete, exists, func, insert, literal, select, text, \
+    tuple_, type_coerce, union, update
 from sqlalchemy.exc import SQLAlchemyError, NoResultFound
+from sqlalchemy.orm import aliased
 
 
-def try_add_new_task(task_data: AddTaskRequestModel, user_id:int, parent_task_id: Optional[int] = None) ->SimpleResponse:
-    if not isinstance(task_data, AddTaskRequestModel):
-        err = TypeError("Provided task_data is not instance of AddTaskRequestModel")
-        return SimpleResponse(False, str(err), err)
+def _dialect_insert(model):
+    """INSERT construct of the current database dialect, it supports ON CONFLICT (upserts)"""
+    if db.engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    return dialect_insert(model)
+
+def _bump_task_revision(user_id: int):
+    """Increments user's task revision. Has to be called in the same transaction as the change of tasks"""
+    statement = _dialect_insert(TaskRevision).values(user_id=user_id, revision=1)
+    statement = statement.on_conflict_do_update(
+        index_elements=[TaskRevision.user_id],
+        set_={"revision": TaskRevision.revision + 1}
+    )
+    db.session.execute(statement)
+
+def _count_key(deadline: datetime, status: str, importance: int) -> tuple:
+    """Key of the TaskDailyCount row that counts a task"""
+    return deadline.date(), status, importance
+
+def _adjust_task_counts(user_id: int, changes: Counter):
+    """
+    Applies changes - a mapping of _count_key() to the change of the count - to user's TaskDailyCount rows with one
+    upsert. Has to be called in the same transaction as the change of tasks
+    """
+    rows = [
+        {"user_id": user_id, "day": day, "status": status, "importance": importance, "count": change}
+        for (day, status, importance), change in changes.items() if change != 0
+    ]
+    if not rows:
+        return
+    statement = _dialect_insert(TaskDailyCount)
+    statement = statement.on_conflict_do_update(
+        index_elements=[TaskDailyCount.user_id, TaskDailyCount.day, TaskDailyCount.status, TaskDailyCount.importance],
+        set_={"count": TaskDailyCount.count + statement.excluded["count"]}
+    )
+    db.session.execute(statement, rows)
+
+def _tasks_changed(user_id: int):
+    """Has to be called after every commit that changed tasks of the user"""
+    task_list_cache.invalidate(user_id)
+    change_feed.publish(user_id)
+
+# Reads select the columns of Task.to_dict with SQLAlchemy Core and build the dicts straight from the result rows.
+# No ORM instances are created - no identity map entries, attribute instrumentation or relationship state per task
+task_table = Task.__table__
+TASK_DICT_COLUMNS = (
+    task_table.c.id.label("task_id"), task_table.c.title, task_table.c.importance, task_table.c.deadline,
+    task_table.c.est_time_days, task_table.c.description, task_table.c.user_id, task_table.c.parent_task_id,
+    task_table.c.status
+)
+READ_YIELD_PER = 1000  # rows fetched from the database at once by reads of unbounded size
 
+def _select_task_dicts(*extra_columns):
+    """SELECT of the columns of Task.to_dict (and extra_columns, under their names)"""
+    return select(*TASK_DICT_COLUMNS, *extra_columns)
+
+def _iter_task_dicts(query, yield_per: Optional[int] = None) -> Iterator[dict]:
+    """Runs a query built by _select_task_dicts and yields its rows as task dicts"""
+    options = {"yield_per": yield_per} if yield_per is not None else {}
+    result = db.session.execute(query, execution_options=options)
+    keys = tuple(result.keys())
+    for row in result:
+        yield dict(zip(keys, row))
+
+def _add_task(task_data: AddTaskRequestModel, user_id: int, parent_task_id: Optional[int] = None) -> Task:
+    """Adds the task to the session and flushes it, so that it has an id. Does not commit"""
     new_task = Task(
         title=task_data.title,
         importance=task_data.importance,
@@ -18,28 +96,122 @@ def try_add_new_task(task_data: AddTaskRequestModel, user_id:int, parent_task_id
         est_time_days=task_data.est_time_days,
         description=task_data.description,
         user_id=user_id,
-        parent_task_id=parent_task_id
+        parent_task_id=parent_task_id,
+        status=task_data.status
     )
+    db.session.add(new_task)
+    _adjust_task_counts(user_id, Counter([_count_key(task_data.deadline, task_data.status, task_data.importance)]))
+    db.session.flush()
+    return new_task
+
+def try_add_new_task(task_data: AddTaskRequestModel, user_id:int, parent_task_id: Optional[int] = None) ->SimpleResponse:
+    if not isinstance(task_data, AddTaskRequestModel):
+        err = TypeError("Provided task_data is not instance of AddTaskRequestModel")
+        return SimpleResponse(False, str(err), err)
+
     try:
-        db.session.add(new_task)
+        new_task = _add_task(task_data, user_id, parent_task_id)
+        _bump_task_revision(user_id)
         db.session.commit()
+        _tasks_changed(user_id)
         assigned_id = new_task.id
         return SimpleResponse(True, str(assigned_id))
     except SQLAlchemyError as e:
         db.session.rollback()
         return SimpleResponse(False, str(e), e)
 
+IMPORT_CHUNK_SIZE = 1000
+EXPORT_CHUNK_SIZE = 1000
+IMPORT_MAX_ERRORS = 100  # rejected rows described in the result, the rest are only counted
+
+def try_importing_tasks(records: Iterable[tuple[int, object]], user_id: int,
+                        chunk_size: int = IMPORT_CHUNK_SIZE) -> ImportTasksResponse:
+    """
+    Bulk version of try_add_new_task. records are (line_number, record) pairs, as produced by the parsers in
+    utils.bulk_formats. Records are validated with AddTaskRequestModel and inserted chunk by chunk - one executemany
+    INSERT and one commit per chunk. Invalid records are skipped and counted in rejected, the first IMPORT_MAX_ERRORS
+    of them are described in errors; a database error stops the import, chunks committed before it stay in the
+    database.
+    """
+    if not isinstance(user_id, int):
+        err = TypeError("Provided user_id is not an instance of int")
+        return ImportTasksResponse(False, str(err), err)
+
+    imported = 0
+    errors = []
+    rejected = 0
+    chunk = []
+
+    def reject(line_number: int, reason):
+        nonlocal rejected
+        rejected += 1
+        if len(errors) < IMPORT_MAX_ERRORS:
+            errors.append(f"line {line_number}: {reason}")
+
+    def insert_chunk():
+        nonlocal imported
+        db.session.execute(insert(Task), chunk)
+        _adjust_task_counts(user_id, Counter(
+            _count_key(task["deadline"], task["status"], task["importance"]) for task in chunk
+        ))
+        _bump_task_revision(user_id)
+        db.session.commit()
+        _tasks_changed(user_id)
+        imported += len(chunk)
+        chunk.clear()
+
+    try:
+        for line_number, record in records:
+            if isinstance(record, Exception):
+                reject(line_number, record)
+                continue
+            try:
+                task_data = AddTaskRequestModel.model_validate(record)
+            except ValidationError as e:
+                reject(line_number, e)
+                continue
+            start_date = Task.compute_start_date(task_data.deadline, task_data.est_time_days)
+            chunk.append(dict(task_data.model_dump(), user_id=user_id, parent_task_id=None, start_date=start_date))
+            if len(chunk) >= chunk_size:
+                insert_chunk()
+        if chunk:
+            insert_chunk()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return ImportTasksResponse(False, str(e), e, imported=imported, errors=errors, rejected=rejected)
+    return ImportTasksResponse(True, f"Imported {imported} tasks", imported=imported, errors=errors,
+                               rejected=rejected)
+
+def iter_user_tasks(user_id: int, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[dict]:
+    """
+    Yields all tasks of the user as dicts, ordered by id. Tasks are read in chunks of chunk_size with keyset
+    pagination, so memory usage does not depend on the number of tasks and no transaction stays open for the whole
+    export.
+    """
+    last_id = 0
+    while True:
+        query = (
+            _select_task_dicts()
+            .where(task_table.c.user_id == user_id, task_table.c.id > last_id)
+            .order_by(task_table.c.id)
+            .limit(chunk_size)
+        )
+        tasks = list(_iter_task_dicts(query))
+        # chunks do not depend on each other (keyset pagination), so the read snapshot is released before yielding
+        db.session.rollback()
+        yield from tasks
+        if len(tasks) < chunk_size:
+            return
+        last_id = tasks[-1]["task_id"]
+
 def try_getting_user_tasks(user_id: int) -> ManyTasksResponse:
     if not isinstance(user_id, int):
         err = TypeError("Provided user_id is not an instance of int")
         return ManyTasksResponse(False, str(err), err)
 
     try:
-        tasks = Task.query.filter_by(user_id=user_id).all()
-        tasks_formatted = []
-        for task in tasks:
-            tasks_formatted.append(task.to_dict())
-        return ManyTasksResponse(True, tasks=tasks_formatted)
+        query = _select_task_dicts().where(task_table.c.user_id == user_id)
+        return ManyTasksResponse(True, tasks=list(_iter_task_dicts(query, yield_per=READ_YIELD_PER)))
     except NoResultFound as nrf:
         db.session.rollback()
         return ManyTasksResponse(False, f'No tasks found for user {user_id}', nrf)
@@ -47,36 +219,232 @@ def try_getting_user_tasks(user_id: int) -> ManyTasksResponse:
         db.session.rollback()
         return ManyTasksResponse(False, str(e), e)
 
+def try_getting_user_tasks_page(user_id: int, list_request: ListTasksRequestModel) -> TasksPageResponse:
+    """
+    Returns one page of user's tasks. Filtering, sorting and pagination are all done by the database - the position
+    of the page is given by a keyset cursor (value of the sort column and id of the last task on the previous page),
+    so getting a page costs the same no matter how many tasks the user has.
+    """
+    if not isinstance(list_request, ListTasksRequestModel):
+        err = TypeError("Provided list_request is not instance of ListTasksRequestModel")
+        return TasksPageResponse(False, str(err), err)
+    if not isinstance(user_id, int):
+        err = TypeError("Provided user_id is not an instance of int")
+        return TasksPageResponse(False, str(err), err)
+
+    columns = task_table.c
+    sort_column = columns[list_request.sort_by]
+    query = _select_task_dicts().where(columns.user_id == user_id)
+    if list_request.importance_min is not None:
+        query = query.where(columns.importance >= list_request.importance_min)
+    if list_request.importance_max is not None:
+        query = query.where(columns.importance <= list_request.importance_max)
+    if list_request.deadline_from is not None:
+        query = query.where(columns.deadline >= list_request.deadline_from)
+    if list_request.deadline_to is not None:
+        query = query.where(columns.deadline < list_request.deadline_to)
+    if list_request.parent_task_id is not None:
+        query = query.where(columns.parent_task_id == list_request.parent_task_id)
+    if list_request.title_contains:
+        query = query.where(columns.title.contains(list_request.title_contains, autoescape=True))
+
+    if list_request.cursor is not None:
+        try:
+            last_value, last_id = decode_cursor(list_request.cursor, list_request.sort_by)
+        except ValueError as e:
+            return TasksPageResponse(False, str(e), e)
+        if list_request.sort_by == "id":
+            key, last_key = columns.id, last_id
+        else:
+            key, last_key = tuple_(sort_column, columns.id), (last_value, last_id)
+        query = query.where(key < last_key if list_request.descending else key > last_key)
+
+    order = [sort_column] if list_request.sort_by == "id" else [sort_column, columns.id]
+    order = [column.desc() if list_request.descending else column.asc() for column in order]
+
+    try:
+        # one row more than requested tells whether there is a next page
+        tasks = list(_iter_task_dicts(query.order_by(*order).limit(list_request.limit + 1)))
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return TasksPageResponse(False, str(e), e)
+
+    next_cursor = None
+    if len(tasks) > list_request.limit:
+        tasks = tasks[:list_request.limit]
+        last_task = tasks[-1]
+        sort_key = "task_id" if list_request.sort_by == "id" else list_request.sort_by
+        next_cursor = encode_cursor(list_request.sort_by, last_task[sort_key], last_task["task_id"])
+    return TasksPageResponse(True, tasks=tasks, next_cursor=next_cursor)
+
+def try_getting_task_revision(user_id: int) -> SimpleResponse:
+    """
+    Returns current revision of user's tasks as message. The revision changes whenever any task of the user changes,
+    so it can be used to answer conditional requests without reading the tasks.
+    """
+    if not isinstance(user_id, int):
+        err = TypeError("Provided user_id is not an instance of int")
+        return SimpleResponse(False, str(err), err)
+
+    try:
+        revision = db.session.scalar(select(TaskRevision.revision).where(TaskRevision.user_id == user_id))
+        return SimpleResponse(True, str(revision or 0))
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return SimpleResponse(False, str(e), e)
+
+REVISIONS_CHUNK_SIZE = 500
+
+def get_task_revisions(user_ids: Iterable[int]) -> dict[int, int]:
+    """Current revisions of tasks of many users, users without a revision have revision 0. Ends the transaction"""
+    user_ids = list(user_ids)
+    revisions = dict.fromkeys(user_ids, 0)
+    for start in range(0, len(user_ids), REVISIONS_CHUNK_SIZE):
+        chunk = user_ids[start:start + REVISIONS_CHUNK_SIZE]
+        revisions.update(db.session.execute(
+            select(TaskRevision.user_id, TaskRevision.revision).where(TaskRevision.user_id.in_(chunk))
+        ).tuples().all())
+    db.session.commit()
+    return revisions
+
 def try_getting_specific_task(user_id: int, task_id: int) -> OneTaskResponse:
     if not isinstance(task_id, int) or not isinstance(user_id, int):
         err = TypeError("At least one of provided id's is not an instance of int")
         return OneTaskResponse(False, str(err), err)
 
     try:
-        task = Task.query.filter_by(user_id=user_id, id=task_id).one()
-        task_dict = task.to_dict()
-        return OneTaskResponse(True, task=task_dict)
+        query = _select_task_dicts().where(task_table.c.user_id == user_id, task_table.c.id == task_id)
+        tasks = list(_iter_task_dicts(query))
+        if not tasks:
+            raise NoResultFound()
+        return OneTaskResponse(True, task=tasks[0])
     except NoResultFound as nrf:
         return OneTaskResponse(False, f'No task with id {task_id} found in your account', nrf)
     except SQLAlchemyError as e:
         return OneTaskResponse(False, str(e), e)
 
+def _delete_task(user_id: int, task_id: int) -> Optional[str]:
+    """
+    Deletes user's task with a single DELETE ... RETURNING, without loading it, and returns its title (None when user
+    has no such task). Its subtasks become top-level tasks - the database sets their parent_task_id to NULL (see
+    migration 6), as when the ORM deletes a task. Does not commit
+    """
+    deleted = db.session.execute(
+        delete(Task).where(Task.user_id == user_id, Task.id == task_id)
+        .returning(Task.title, Task.deadline, Task.status, Task.importance),
+        execution_options={"synchronize_session": False}  # the session expires everything on commit anyway
+    ).first()
+    if deleted is None:
+        return None
+    _adjust_task_counts(user_id, Counter({_count_key(deleted.deadline, deleted.status, deleted.importance): -1}))
+    return deleted.title
+
 def try_removing_specific_task(user_id, task_id) -> SimpleResponse:
     if not isinstance(task_id, int) or not isinstance(user_id, int):
         err = TypeError("At least one of provided id's is not an instance of int")
         return OneTaskResponse(False, str(err), err)
 
     try:
-        task = Task.query.filter_by(user_id=user_id, id=task_id).one()
-        db.session.delete(task)
+        title = _delete_task(user_id, task_id)
+        if title is None:
+            db.session.rollback()
+            raise NoResultFound(f"No task with id {task_id}")
+        _bump_task_revision(user_id)
         db.session.commit()
-        return SimpleResponse(True, message=task.title)
+        _tasks_changed(user_id)
+        return SimpleResponse(True, message=title)
     except NoResultFound as nrf:
         return OneTaskResponse(False, f'No task with id {task_id} found in your account', nrf)
     except SQLAlchemyError as e:
+        db.session.rollback()
         return OneTaskResponse(False, str(e), e)
 
+def _start_date_after(changes: dict):
+    """
+    start_date of a task after the changes of its deadline and/or est_time_days - a value when both change, otherwise
+    an SQL expression that takes the other one from the row being updated
+    """
+    if changes.keys() >= {"deadline", "est_time_days"}:
+        return Task.compute_start_date(changes["deadline"], changes["est_time_days"])
+    deadline = literal(changes["deadline"], DateTime) if "deadline" in changes else Task.deadline
+    est_time_days = literal(changes["est_time_days"], Integer) if "est_time_days" in changes else Task.est_time_days
+    days = func.coalesce(est_time_days, 0)
+    if db.engine.dialect.name == "postgresql":
+        return deadline - func.make_interval(0, 0, 0, days, type_=Interval)
+    # SQLite keeps datetimes as text and strftime() drops the microseconds, they are appended back unchanged
+    shifted = func.strftime("%Y-%m-%d %H:%M:%S", deadline, func.printf("-%d days", days))
+    return type_coerce(shifted.concat(func.substr(deadline, 20)), DateTime)
+
+def _patch_task(user_id: int, patch: PatchTaskRequestModel, *conditions) -> Optional[int]:
+    """
+    Applies the patch to user's task with a single UPDATE ... RETURNING scoped to the owner, without loading the task,
+    and returns its id (None when user has no such task, or when the task does not meet the extra conditions). Keeps
+    start_date and task counts in sync. Does not commit.
+
+    Counts depend on values before the update, so RETURNING reports them too. On PostgreSQL they come from a locked
+    subquery joined to the UPDATE. SQLite's RETURNING sees only the updated row, there they come from a MATERIALIZED
+    CTE - it is computed once, when the WHERE clause reads it before the row changes.
+    """
+    changes = patch.changes()
+    where = (Task.user_id == user_id, Task.id == patch.task_id, *conditions)
+    no_sync = {"synchronize_session": False}  # the session expires everything on commit anyway
+    if not changes.keys() & {"deadline", "est_time_days", "status", "importance"}:
+        return db.session.execute(
+            update(Task).where(*where).values(changes).returning(Task.id), execution_options=no_sync
+        ).scalar()
+
+    values = dict(changes)
+    if changes.keys() & {"deadline", "est_time_days"}:
+        values["start_date"] = _start_date_after(changes)
+    old_columns = (Task.id, Task.deadline, Task.status, Task.importance)
+    if db.engine.dialect.name == "postgresql":
+        old = select(*old_columns).where(*where).with_for_update().subquery()
+        statement = update(Task).where(Task.id == old.c.id)
+        returned_old = (old.c.deadline, old.c.status, old.c.importance)
+    else:
+        old = select(*old_columns).where(*where).cte("old_task").prefix_with("MATERIALIZED")
+        statement = update(Task).where(Task.id.in_(select(old.c.id)))
+        returned_old = tuple(select(column).scalar_subquery() for column in (old.c.deadline, old.c.status,
+                                                                             old.c.importance))
+    updated = db.session.execute(
+        statement.values(values).returning(Task.id, *returned_old, Task.deadline, Task.status, Task.importance),
+        execution_options=no_sync
+    ).first()
+    if updated is None:
+        return None
+    task_id, old_deadline, old_status, old_importance, new_deadline, new_status, new_importance = updated
+
+    count_changes = Counter()
+    count_changes[_count_key(old_deadline, old_status, old_importance)] -= 1
+    count_changes[_count_key(new_deadline, new_status, new_importance)] += 1
+    _adjust_task_counts(user_id, count_changes)
+    return task_id
+
+def try_patching_task(user_id, patch: PatchTaskRequestModel) -> SimpleResponse:
+    """Changes only the fields present in the patch"""
+    if not isinstance(patch, PatchTaskRequestModel):
+        err = TypeError("Provided patch is not instance of PatchTaskRequestModel")
+        return SimpleResponse(False, str(err), err)
+    if not isinstance(user_id, int):
+        err = TypeError("Provided user_id is not an instance of int")
+        return SimpleResponse(False, str(err), err)
+
+    task_id = patch.task_id
+    try:
+        if _patch_task(user_id, patch) is None:
+            db.session.rollback()
+            nrf = NoResultFound(f"No task with id {task_id}")
+            return SimpleResponse(False, f'Cannot edit: no task with id {task_id} found in your account', nrf)
+        _bump_task_revision(user_id)
+        db.session.commit()
+        _tasks_changed(user_id)
+        return SimpleResponse(True, message=f"successfully edited task with id {task_id}")
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return SimpleResponse(False, str(e), e)
+
 def try_editing_specific_task(user_id, edit_request: EditTaskRequestModel) -> SimpleResponse:
+    """Replaces all fields of the task (status only when it is given)"""
     if not isinstance(edit_request, EditTaskRequestModel):
         err = TypeError("Provided edit_request is not instance of EditTaskRequestModel")
         return SimpleResponse(False, str(err), err)
@@ -84,27 +452,492 @@ def try_editing_specific_task(user_id, edit_request: EditTaskRequestModel) -> Si
         err = TypeError("Provided user_id is not an instance of int")
         return SimpleResponse(False, str(err), err)
 
-    # get from database
-    task_id = edit_request.task_id
+    return try_patching_task(user_id, _edit_request_as_patch(edit_request))
+
+def _edit_request_as_patch(edit_request: EditTaskRequestModel) -> PatchTaskRequestModel:
+    """Patch setting every field of the edit request (status only when it is given)"""
+    fields = edit_request.model_dump(exclude={"status"} if edit_request.status is None else set())
+    return PatchTaskRequestModel(**fields)
+
+def _find_task_dict(user_id: int, target: TargetSpecificTaskModel) -> dict:
+    """Reads the task chosen by id or by title, raises NoResultFound or ValueError (ambiguous title)"""
+    if target.task_id:
+        condition = task_table.c.id == target.task_id
+        missing = f'No task with id {target.task_id} found in your account'
+    else:
+        condition = task_table.c.title == target.title
+        missing = f"No task titled '{target.title}' found in your account"
+    tasks = list(_iter_task_dicts(_select_task_dicts().where(task_table.c.user_id == user_id, condition).limit(2)))
+    if not tasks:
+        raise NoResultFound(missing)
+    if len(tasks) > 1:
+        raise ValueError(f"More than one task is titled '{target.title}', choose the task by its id")
+    return tasks[0]
+
+def _run_batch_operation(user_id: int, operation: BatchOperationModel):
+    """
+    Runs one command of a batch without committing and returns its result. Edits and deletes go through the same
+    single-statement writes as the edit and delete endpoints. Arguments are validated and the task is found before
+    anything is written, so a command that fails with NoResultFound or ValueError changes nothing.
+    """
+    if operation.command == "add":
+        return _add_task(AddTaskRequestModel.model_validate(operation.args), user_id).id
+    if operation.command == "edit":
+        edit_request = EditTaskRequestModel.model_validate(operation.args)
+        if _patch_task(user_id, _edit_request_as_patch(edit_request)) is None:
+            raise NoResultFound(f'No task with id {edit_request.task_id} found in your account')
+        return f"successfully edited task with id {edit_request.task_id}"
+    task = _find_task_dict(user_id, TargetSpecificTaskModel.model_validate(operation.args))
+    if operation.command == "delete":
+        return _delete_task(user_id, task["task_id"])
+    return task
+
+def try_running_batch(user_id: int, batch_request: BatchRequestModel) -> BatchResponse:
+    """
+    Runs add/edit/delete/view commands of the batch in order, in a single transaction with one commit. Later commands
+    see changes of the earlier ones. A failed command is reported in its result and skipped, or, when the batch is
+    atomic, nothing is committed. A database error rolls back the whole batch.
+    """
+    if not isinstance(batch_request, BatchRequestModel):
+        err = TypeError("Provided batch_request is not instance of BatchRequestModel")
+        return BatchResponse(False, str(err), err)
+    if not isinstance(user_id, int):
+        err = TypeError("Provided user_id is not an instance of int")
+        return BatchResponse(False, str(err), err)
+
+    results = []
+    failed = 0
+    changed = False
     try:
-        task = Task.query.filter_by(user_id=user_id, id=task_id).one()
+        for index, operation in enumerate(batch_request.operations):
+            result = {"index": index, "command": operation.command}
+            try:
+                result["result"] = _run_batch_operation(user_id, operation)
+                result["status"] = "success"
+                changed = changed or operation.command != "view"
+            except (NoResultFound, ValueError) as e:  # pydantic's ValidationError is a ValueError too
+                result["status"] = "error"
+                result["message"] = str(e)
+                failed += 1
+            results.append(result)
+
+        if failed and batch_request.atomic:
+            db.session.rollback()
+            err = ValueError(f"{failed} of {len(results)} commands failed, no changes were made")
+            return BatchResponse(False, str(err), err, results=results)
+        if changed:
+            _bump_task_revision(user_id)
+            db.session.commit()
+            _tasks_changed(user_id)
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return BatchResponse(False, str(e), e, results=results)
+    return BatchResponse(True, f"{len(results) - failed} of {len(results)} commands succeeded", results=results)
+
+URGENCY_BATCH_SIZE = 50  # rows read at once from each index (at least limit of the request)
+
+def _iter_open_tasks(user_id: int, order_by: str, descending: bool, batch_size: int) -> Iterator[dict]:
+    """
+    Yields user's tasks that are not done, with their start_date, ordered by column order_by (and id). Tasks are read
+    in batches with keyset pagination, so only as many rows as the caller consumes are read from the
+    (user_id, order_by) index.
+    """
+    columns = task_table.c
+    order_column = columns[order_by]
+    key = tuple_(order_column, columns.id)
+    order = [order_column.desc(), columns.id.desc()] if descending else [order_column.asc(), columns.id.asc()]
+    # start_date is NULL only in rows not migrated yet, they could not be ranked
+    query = _select_task_dicts(columns.start_date).where(columns.user_id == user_id, columns.status != "done",
+                                                          columns.start_date.is_not(None))
+    last_key = None
+    while True:
+        page = query if last_key is None else query.where(key < last_key if descending else key > last_key)
+        tasks = list(_iter_task_dicts(page.order_by(*order).limit(batch_size)))
+        yield from tasks
+        if len(tasks) < batch_size:
+            return
+        last_key = (tasks[-1][order_by], tasks[-1]["task_id"])
+
+def try_getting_most_urgent_tasks(user_id: int, urgent_request: UrgentTasksRequestModel,
+                                  now: Optional[datetime] = None,
+                                  batch_size: int = URGENCY_BATCH_SIZE) -> ManyTasksResponse:
+    """
+    Returns up to limit tasks that are not done, the most urgent first. Every task dict contains its start_date and
+    urgency (see utils.ranking.urgency).
+
+    Urgency grows with importance and falls with start_date, so the tasks are read in these two orders at once - from
+    the (user_id, importance) and (user_id, start_date) indexes - and reading stops when no unread task can beat the
+    limit best ones (utils.threshold_top_k). The cost depends on limit and on how the two orders agree, not on the
+    number of user's tasks.
+    """
+    if not isinstance(urgent_request, UrgentTasksRequestModel):
+        err = TypeError("Provided urgent_request is not instance of UrgentTasksRequestModel")
+        return ManyTasksResponse(False, str(err), err)
+    if not isinstance(user_id, int):
+        err = TypeError("Provided user_id is not an instance of int")
+        return ManyTasksResponse(False, str(err), err)
+
+    now = now or datetime.now()
+    batch_size = max(urgent_request.limit, batch_size)
+    by_importance = _iter_open_tasks(user_id, "importance", True, batch_size)
+    by_start_date = _iter_open_tasks(user_id, "start_date", False, batch_size)
+    try:
+        tasks = threshold_top_k(
+            urgent_request.limit,
+            [by_importance, by_start_date],
+            key=lambda task: task["task_id"],
+            score=lambda task: urgency(task["importance"], task["start_date"], now),
+            # unread tasks are at most as important as the last one read by importance and start at the earliest
+            # with the last one read by start_date
+            bound=lambda last: urgency(last[0]["importance"], last[1]["start_date"], now)
+        )
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return ManyTasksResponse(False, str(e), e)
+    for task in tasks:
+        task["urgency"] = round(urgency(task["importance"], task["start_date"], now), 4)
+    return ManyTasksResponse(True, tasks=tasks)
+
+def try_setting_task_status(user_id: int, status_request: SetTaskStatusRequestModel) -> SimpleResponse:
+    if not isinstance(status_request, SetTaskStatusRequestModel):
+        err = TypeError("Provided status_request is not instance of SetTaskStatusRequestModel")
+        return SimpleResponse(False, str(err), err)
+    if not isinstance(user_id, int):
+        err = TypeError("Provided user_id is not an instance of int")
+        return SimpleResponse(False, str(err), err)
+
+    task_id, status = status_request.task_id, status_request.status
+    try:
+        # a task that has the status already is not written, so its revision (and the cached lists) stay valid
+        if _patch_task(user_id, PatchTaskRequestModel(task_id=task_id, status=status), Task.status != status) is None:
+            db.session.rollback()
+            if not db.session.scalar(select(exists().where(Task.user_id == user_id, Task.id == task_id))):
+                raise NoResultFound(f"No task with id {task_id}")
+        else:
+            _bump_task_revision(user_id)
+            db.session.commit()
+            _tasks_changed(user_id)
+        return SimpleResponse(True, f"Task {task_id} is now {status}")
     except NoResultFound as nrf:
-        return SimpleResponse(False, f'Cannot edit: no task with id {task_id} found in your account', nrf)
+        return SimpleResponse(False, f'No task with id {task_id} found in your account', nrf)
     except SQLAlchemyError as e:
+        db.session.rollback()
         return SimpleResponse(False, str(e), e)
 
-    # edit
+def try_getting_task_stats(user_id: int, stats_request: TaskStatsRequestModel) -> TaskStatsResponse:
+    """
+    Counts user's tasks with deadline in the period, by status and by importance. It reads only the TaskDailyCount
+    rows of the period (a range of their primary key), not the tasks.
+    """
+    if not isinstance(stats_request, TaskStatsRequestModel):
+        err = TypeError("Provided stats_request is not instance of TaskStatsRequestModel")
+        return TaskStatsResponse(False, str(err), err)
+    if not isinstance(user_id, int):
+        err = TypeError("Provided user_id is not an instance of int")
+        return TaskStatsResponse(False, str(err), err)
+
+    query = (
+        select(TaskDailyCount.status, TaskDailyCount.importance, func.sum(TaskDailyCount.count))
+        .where(TaskDailyCount.user_id == user_id, TaskDailyCount.day >= stats_request.date_from,
+               TaskDailyCount.day <= stats_request.date_to)
+        .group_by(TaskDailyCount.status, TaskDailyCount.importance)
+    )
     try:
-        task.title = edit_request.title
-        task.importance = edit_request.importance
-        task.deadline = edit_request.deadline
-        task.description = edit_request.description
-        task.est_time_days = edit_request.est_time_days
+        rows = db.session.execute(query).all()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return TaskStatsResponse(False, str(e), e)
+
+    by_status = dict.fromkeys(TASK_STATUSES, 0)
+    by_importance = {}
+    for status, importance, count in rows:
+        if not count:
+            continue
+        by_status[status] = by_status.get(status, 0) + count
+        if importance not in by_importance:
+            by_importance[importance] = {"importance": importance, **dict.fromkeys(TASK_STATUSES, 0)}
+        importance_counts = by_importance[importance]
+        importance_counts[status] = importance_counts.get(status, 0) + count
+    stats = {
+        "total": sum(by_status.values()),
+        "by_status": by_status,
+        "by_importance": [by_importance[importance] for importance in sorted(by_importance, reverse=True)]
+    }
+    return TaskStatsResponse(True, stats=stats)
+
+def reconcile_task_counts(user_id: Optional[int] = None) -> int:
+    """
+    Recomputes TaskDailyCount rows of the user (or of every user) from the tasks and corrects the stored ones, one
+    transaction per user. Returns the number of corrected rows, which is 0 unless the counts drifted from the tasks.
+    """
+    if user_id is None:
+        user_ids = db.session.scalars(union(
+            select(Task.user_id).distinct(), select(TaskDailyCount.user_id).distinct()
+        )).all()
+    else:
+        user_ids = [user_id]
+
+    corrected = 0
+    for user_id in user_ids:
+        deadline_day = func.date(Task.deadline, type_=Date)
+        expected = {
+            (day, status, importance): count for day, status, importance, count in db.session.execute(
+                select(deadline_day, Task.status, Task.importance, func.count())
+                .where(Task.user_id == user_id)
+                .group_by(deadline_day, Task.status, Task.importance)
+            )
+        }
+        stored = {
+            (row.day, row.status, row.importance): row.count
+            for row in db.session.scalars(select(TaskDailyCount).where(TaskDailyCount.user_id == user_id))
+        }
+        changes = Counter()
+        for key in expected.keys() | stored.keys():
+            changes[key] = expected.get(key, 0) - stored.get(key, 0)
+        user_corrected = sum(1 for change in changes.values() if change != 0)
+        _adjust_task_counts(user_id, changes)
+        # rows counting no tasks are left behind by moving tasks between days, statuses and importances
+        db.session.execute(delete(TaskDailyCount).where(TaskDailyCount.user_id == user_id, TaskDailyCount.count == 0))
+        if user_corrected:
+            _bump_task_revision(user_id)
         db.session.commit()
+        corrected += user_corrected
+    return corrected
+
+# guards recursive queries against cycles in parent links, no real task tree is that deep
+MAX_TREE_DEPTH = 1000
 
-        return SimpleResponse(True, message=f"successfully edited task with id {task.id}")
+def _subtree_cte(user_id: int, root_task_id: Optional[int], max_depth: Optional[int]):
+    """
+    Recursive CTE with (id, depth) of all tasks in the subtree of root_task_id, or in all trees of the user when
+    root_task_id is None. Each level is found through the index on parent_task_id.
+    """
+    # an alias, so that the CTE is not correlated with the task table of an enclosing UPDATE/DELETE
+    tree_task = aliased(Task, name="tree_task")
+    if root_task_id is None:
+        anchor_condition = tree_task.parent_task_id.is_(None)
+    else:
+        anchor_condition = tree_task.id == root_task_id
+    anchor = select(tree_task.id, literal(0).label("depth")).where(tree_task.user_id == user_id, anchor_condition)
+    subtree = anchor.cte("subtree", recursive=True)
+    depth_limit = MAX_TREE_DEPTH if max_depth is None else min(max_depth, MAX_TREE_DEPTH)
+    children = (
+        select(tree_task.id, (subtree.c.depth + 1).label("depth"))
+        .join(subtree, tree_task.parent_task_id == subtree.c.id)
+        .where(tree_task.user_id == user_id, subtree.c.depth < depth_limit)
+    )
+    return subtree.union_all(children)
+
+def try_getting_task_tree(user_id: int, tree_request: TaskTreeRequestModel) -> ManyTasksResponse:
+    """
+    Returns a task together with all its subtasks (or all top-level tasks of the user with their subtasks), loaded
+    with one recursive query. tasks contains the root task dicts, every dict has a 'children' list of task dicts.
+    Tasks deeper than max_depth levels below the root are omitted.
+    """
+    if not isinstance(tree_request, TaskTreeRequestModel):
+        err = TypeError("Provided tree_request is not instance of TaskTreeRequestModel")
+        return ManyTasksResponse(False, str(err), err)
+    if not isinstance(user_id, int):
+        err = TypeError("Provided user_id is not an instance of int")
+        return ManyTasksResponse(False, str(err), err)
+
+    subtree = _subtree_cte(user_id, tree_request.task_id, tree_request.max_depth)
+    query = (
+        _select_task_dicts()
+        .join_from(task_table, subtree, task_table.c.id == subtree.c.id)
+        .order_by(subtree.c.depth, task_table.c.id)
+    )
+    try:
+        tasks = list(_iter_task_dicts(query))
     except SQLAlchemyError as e:
-        return OneTaskResponse(False, str(e), e)
+        db.session.rollback()
+        return ManyTasksResponse(False, str(e), e)
+    if not tasks and tree_request.task_id is not None:
+        nrf = NoResultFound()
+        return ManyTasksResponse(False, f'No task with id {tree_request.task_id} found in your account', nrf)
+
+    # parents always come before their children, because rows are ordered by depth
+    nodes = {}
+    roots = []
+    for node in tasks:
+        node["children"] = []
+        nodes[node["task_id"]] = node
+        parent = nodes.get(node["parent_task_id"])
+        if parent is None:
+            roots.append(node)
+        else:
+            parent["children"].append(node)
+    return ManyTasksResponse(True, tasks=roots)
+
+def try_removing_task_subtree(user_id: int, task_id: int) -> SimpleResponse:
+    """Deletes the task and all its subtasks with a single statement. message is the number of deleted tasks"""
+    if not isinstance(task_id, int) or not isinstance(user_id, int):
+        err = TypeError("At least one of provided id's is not an instance of int")
+        return SimpleResponse(False, str(err), err)
+
+    subtree = _subtree_cte(user_id, task_id, None)
+    statement = (
+        delete(Task).where(Task.id.in_(select(subtree.c.id)))
+        .returning(Task.deadline, Task.status, Task.importance)
+    )
+    try:
+        deleted_tasks = db.session.execute(statement, execution_options={"synchronize_session": False}).all()
+        if not deleted_tasks:
+            db.session.rollback()
+            nrf = NoResultFound()
+            return SimpleResponse(False, f'No task with id {task_id} found in your account', nrf)
+        count_changes = Counter()
+        for deadline, status, importance in deleted_tasks:
+            count_changes[_count_key(deadline, status, importance)] -= 1
+        _adjust_task_counts(user_id, count_changes)
+        _bump_task_revision(user_id)
+        db.session.commit()
+        _tasks_changed(user_id)
+        return SimpleResponse(True, str(len(deleted_tasks)))
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return SimpleResponse(False, str(e), e)
+
+def try_moving_task(user_id: int, move_request: MoveTaskRequestModel) -> SimpleResponse:
+    """
+    Moves the task, with its whole subtree, under another task of the user (or to the top level). It is a single
+    UPDATE, which refuses to move a task into its own subtree.
+    """
+    if not isinstance(move_request, MoveTaskRequestModel):
+        err = TypeError("Provided move_request is not instance of MoveTaskRequestModel")
+        return SimpleResponse(False, str(err), err)
+    if not isinstance(user_id, int):
+        err = TypeError("Provided user_id is not an instance of int")
+        return SimpleResponse(False, str(err), err)
 
+    task_id = move_request.task_id
+    new_parent_id = move_request.new_parent_task_id
+    condition = and_(Task.user_id == user_id, Task.id == task_id)
+    if new_parent_id is not None:
+        new_parent = Task.__table__.alias("new_parent")
+        subtree = _subtree_cte(user_id, task_id, None)
+        condition = and_(
+            condition,
+            exists().where(new_parent.c.id == new_parent_id, new_parent.c.user_id == user_id),
+            literal(new_parent_id).not_in(select(subtree.c.id))
+        )
+    # RETURNING instead of rowcount - sqlite3 does not report rowcount of statements starting with WITH
+    statement = update(Task).where(condition).values(parent_task_id=new_parent_id).returning(Task.id)
+    try:
+        moved_ids = db.session.scalars(statement, execution_options={"synchronize_session": False}).all()
+        if not moved_ids:
+            db.session.rollback()
+            task_exists = db.session.scalar(select(exists().where(Task.user_id == user_id, Task.id == task_id)))
+            if not task_exists:
+                nrf = NoResultFound()
+                return SimpleResponse(False, f'Cannot move: no task with id {task_id} found in your account', nrf)
+            err = ValueError(f"Cannot move: task {new_parent_id} does not exist in your account, or it is a "
+                             f"subtask of task {task_id}")
+            return SimpleResponse(False, str(err), err)
+        _bump_task_revision(user_id)
+        db.session.commit()
+        _tasks_changed(user_id)
+        return SimpleResponse(True, f"Moved task {task_id}")
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return SimpleResponse(False, str(e), e)
 
+def try_getting_tasks_in_range(user_id: int, range_request: CalendarRangeRequestModel) -> ManyTasksResponse:
+    """
+    Returns tasks overlapping [start, end) of range_request, i.e. tasks with start_date < end and deadline >= start,
+    ordered by start_date. Every task dict gets 'start_date' and 'lane' - overlapping tasks are put in different lanes
+    (rows of the calendar), see utils.assign_lanes.
 
+    Only tasks starting in [start - longest estimate of the user, end) can overlap the range, so the query reads a
+    bounded slice of the (user_id, start_date) index. The longest estimate is read from the (user_id, est_time_days)
+    index.
+    """
+    if not isinstance(range_request, CalendarRangeRequestModel):
+        err = TypeError("Provided range_request is not instance of CalendarRangeRequestModel")
+        return ManyTasksResponse(False, str(err), err)
+    if not isinstance(user_id, int):
+        err = TypeError("Provided user_id is not an instance of int")
+        return ManyTasksResponse(False, str(err), err)
+
+    try:
+        longest_estimate = db.session.scalar(select(func.max(Task.est_time_days)).where(Task.user_id == user_id))
+        earliest_start = range_request.start - timedelta(days=longest_estimate or 0)
+        columns = task_table.c
+        query = (
+            _select_task_dicts(columns.start_date)
+            .where(columns.user_id == user_id, columns.start_date >= earliest_start,
+                   columns.start_date < range_request.end, columns.deadline >= range_request.start)
+            .order_by(columns.start_date, columns.id)
+        )
+        tasks = list(_iter_task_dicts(query))
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return ManyTasksResponse(False, str(e), e)
+
+    lanes = assign_lanes([(task["start_date"], task["deadline"]) for task in tasks])
+    for task, lane in zip(tasks, lanes):
+        task["lane"] = lane
+    return ManyTasksResponse(True, tasks=tasks)
+
+def _search_words(query: str) -> list[str]:
+    return re.findall(r"\w+", query)
+
+def _search_match_expression(query: str) -> str:
+    """FTS5 MATCH expression for a user query - every word quoted (so it cannot be an operator) and prefix-matched"""
+    return " ".join(f'"{word}"*' for word in _search_words(query))
+
+def _search_tsquery(query: str) -> str:
+    """PostgreSQL version of _search_match_expression, for to_tsquery"""
+    return " & ".join(f"{word}:*" for word in _search_words(query))
+
+# both return the same columns, matched words are enclosed in square brackets
+_SEARCH_QUERY_SQLITE = """
+    SELECT task.id AS task_id, task.title, task.importance, task.deadline, task.est_time_days,
+           highlight(task_fts, 0, '[', ']') AS title_highlight,
+           snippet(task_fts, 1, '[', ']', '...', 12) AS snippet
+    FROM task_fts JOIN task ON task.id = task_fts.rowid
+    WHERE task_fts MATCH :match_expression AND task.user_id = :user_id
+    ORDER BY bm25(task_fts, 10.0, 1.0)
+    LIMIT :limit
+"""
+_SEARCH_QUERY_POSTGRESQL = f"""
+    SELECT task.id AS task_id, task.title, task.importance, task.deadline, task.est_time_days,
+           ts_headline('simple', task.title, search_query, 'StartSel=[, StopSel=], HighlightAll=true')
+               AS title_highlight,
+           ts_headline('simple', coalesce(task.description, ''), search_query,
+                       'StartSel=[, StopSel=], MaxWords=12, MinWords=3, ShortWord=0, MaxFragments=1')
+               AS snippet
+    FROM task, to_tsquery('simple', :match_expression) AS search_query
+    WHERE ({TASK_SEARCH_VECTOR}) @@ search_query AND task.user_id = :user_id
+    ORDER BY ts_rank(({TASK_SEARCH_VECTOR}), search_query) DESC, task.id
+    LIMIT :limit
+"""
+
+def try_searching_tasks(user_id: int, search_request: SearchTasksRequestModel) -> ManyTasksResponse:
+    """
+    Full-text search over titles and descriptions of user's tasks, best matches first (title matches weigh more).
+    Every task dict contains title_highlight and snippet - matched words are enclosed in square brackets. Uses the
+    FTS5 index on SQLite and the GIN index of a tsvector on PostgreSQL (see db_migrations).
+    """
+    if not isinstance(search_request, SearchTasksRequestModel):
+        err = TypeError("Provided search_request is not instance of SearchTasksRequestModel")
+        return ManyTasksResponse(False, str(err), err)
+    if not isinstance(user_id, int):
+        err = TypeError("Provided user_id is not an instance of int")
+        return ManyTasksResponse(False, str(err), err)
+    if not _search_words(search_request.query):
+        err = ValueError("Search query has to contain at least one word")
+        return ManyTasksResponse(False, str(err), err)
+
+    if db.engine.dialect.name == "postgresql":
+        query, match_expression = _SEARCH_QUERY_POSTGRESQL, _search_tsquery(search_request.query)
+    else:
+        query, match_expression = _SEARCH_QUERY_SQLITE, _search_match_expression(search_request.query)
+    query = text(query).columns(deadline=DateTime)
+    try:
+        rows = db.session.execute(query, {"match_expression": match_expression, "user_id": user_id,
+                                          "limit": search_request.limit}).mappings().all()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return ManyTasksResponse(False, str(e), e)
+    return ManyTasksResponse(True, tasks=[dict(row) for row in rows])
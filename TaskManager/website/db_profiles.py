@@ -0,0 +1,131 @@
+"""
+Performance profiles of the database connection. A profile is a set of SQLite pragmas applied on every new
+connection plus SQLAlchemy engine (pool) options. The profile is chosen with the DB_PERFORMANCE_PROFILE config key.
+
+Pool options can also be set with environment variables (see POOL_ENVIRONMENT_VARIABLES), which is how they are
+configured for a shared PostgreSQL database.
+"""
+from flask import Flask
+from os import environ
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+from typing import Optional
+import re
+
+
+SQLITE_PROFILES = {
+    # plain SQLite defaults - rollback journal, no tuning
+    "default": {
+        "pragmas": {},
+        "engine_options": {},
+    },
+    # many Gunicorn workers reading and writing the same file
+    "production": {
+        "pragmas": {
+            "journal_mode": "WAL",  # readers do not block the writer and the other way round
+            "synchronous": "NORMAL",  # safe in WAL mode, fsync only on checkpoints
+            "busy_timeout": 5000,  # wait up to 5s for the write lock instead of failing with 'database is locked'
+            "cache_size": -64000,  # negative value means KiB, so 64 MB of page cache per connection
+            "mmap_size": 268435456,  # 256 MB of memory mapped I/O
+            "temp_store": "MEMORY",
+        },
+        "engine_options": {
+            "pool_size": 5,
+            "max_overflow": 10,
+            "pool_timeout": 30,
+        },
+    },
+}
+
+# engine option -> (environment variable, type of its value)
+POOL_ENVIRONMENT_VARIABLES = {
+    "pool_size": ("TASKMANAGER_DB_POOL_SIZE", int),
+    "max_overflow": ("TASKMANAGER_DB_MAX_OVERFLOW", int),
+    "pool_timeout": ("TASKMANAGER_DB_POOL_TIMEOUT", int),
+    "pool_recycle": ("TASKMANAGER_DB_POOL_RECYCLE", int),  # seconds, e.g. less than the server's idle timeout
+    "pool_pre_ping": ("TASKMANAGER_DB_POOL_PRE_PING", bool),  # test connections before use, survives DB restarts
+}
+
+# options only QueuePool accepts, other pools (e.g. StaticPool of in-memory SQLite) make create_engine() fail on them
+QUEUE_POOL_OPTIONS = ("pool_size", "max_overflow", "pool_timeout")
+
+_PRAGMA_NAME_PATTERN = re.compile(r"^[a-z_]+$")
+_PRAGMA_VALUE_PATTERN = re.compile(r"^(-?\d+|[A-Za-z_]+)$")
+
+
+def get_profile(profile_name: str) -> dict:
+    """Returns profile with the given name, raises ValueError when there is no such profile"""
+    if profile_name not in SQLITE_PROFILES:
+        raise ValueError(f"Unknown database performance profile '{profile_name}', "
+                         f"available profiles: {', '.join(SQLITE_PROFILES)}")
+    return SQLITE_PROFILES[profile_name]
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas: dict):
+    """Executes 'PRAGMA name = value' for each item of pragmas on a raw DBAPI (sqlite3) connection"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            if not _PRAGMA_NAME_PATTERN.match(name) or not _PRAGMA_VALUE_PATTERN.match(str(value)):
+                raise ValueError(f"Invalid pragma {name} = {value}")
+            cursor.execute(f"PRAGMA {name} = {value}")
+    finally:
+        cursor.close()
+
+def pool_options_from_environment(variables=environ) -> dict:
+    """Engine options set with the environment variables of POOL_ENVIRONMENT_VARIABLES"""
+    options = {}
+    for option, (variable, value_type) in POOL_ENVIRONMENT_VARIABLES.items():
+        value = variables.get(variable)
+        if value is None:
+            continue
+        if value_type is bool:
+            options[option] = value.lower() in ("1", "true", "yes")
+        else:
+            try:
+                options[option] = value_type(value)
+            except ValueError:
+                raise ValueError(f"{variable} has to be an integer, got '{value}'")
+    return options
+
+def configure_engine_options(app: Flask):
+    """
+    Puts engine options of the selected profile, updated with the pool options from environment variables, into
+    SQLALCHEMY_ENGINE_OPTIONS. Options already present in the config take precedence. Options of QueuePool are left
+    out when the engine gets another pool. Has to be called before db.init_app(app).
+    """
+    profile = get_profile(app.config["DB_PERFORMANCE_PROFILE"])
+    engine_options = dict(profile["engine_options"])
+    engine_options.update(pool_options_from_environment())
+    configured_options = app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {})
+    if not _uses_queue_pool(app.config.get("SQLALCHEMY_DATABASE_URI"), configured_options.get("poolclass")):
+        engine_options = {option: value for option, value in engine_options.items()
+                          if option not in QUEUE_POOL_OPTIONS}
+    engine_options.update(configured_options)
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options
+
+def _uses_queue_pool(database_uri: Optional[str], poolclass: Optional[type]) -> bool:
+    """Whether the engine of the database will pool connections with QueuePool (the default of SQLAlchemy)"""
+    if poolclass is not None:
+        return issubclass(poolclass, QueuePool)
+    if database_uri is None:
+        return True
+    url = make_url(database_uri)
+    # Flask-SQLAlchemy gives in-memory SQLite databases a StaticPool - the one connection that holds the data
+    return not (url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"))
+
+def register_connection_pragmas(app: Flask, engine):
+    """
+    Makes the engine apply pragmas of the selected profile (updated with SQLITE_PRAGMAS from config) to every new
+    connection. Does nothing for databases other than SQLite.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    pragmas = dict(get_profile(app.config["DB_PERFORMANCE_PROFILE"])["pragmas"])
+    pragmas.update(app.config.get("SQLITE_PRAGMAS", {}))
+    if not pragmas:
+        return
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, pragmas)
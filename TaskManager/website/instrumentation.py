@@ -0,0 +1,224 @@
+"""
+Request instrumentation: latency of every endpoint, number and time of SQL queries and time of JSON serialization
+per request, logs of slow requests and slow queries, all exported in Prometheus text format by GET /metrics.
+
+It is enabled with the INSTRUMENTATION config key (TASKMANAGER_INSTRUMENTATION=1). When it is off nothing is
+registered - no request hooks, no SQLAlchemy events - and /metrics does not exist.
+
+The number of queries per request is what shows N+1 regressions: a handler whose histogram moves to higher buckets
+issues a query per task again. Queries and serialization outside of requests (CLI commands, the event stream of the
+ASGI app) are not counted, but slow queries are logged everywhere.
+
+Metrics are kept per process, every Gunicorn worker exports its own. Durations of streamed responses cover only
+the handler, not sending of the stream.
+"""
+from bisect import bisect_left
+from flask import Blueprint, Flask, Response, g, has_request_context, request
+from sqlalchemy import event
+from threading import Lock
+from time import perf_counter
+import logging
+
+from . import db
+from .utils import serialization
+
+
+logger = logging.getLogger("taskmanager.performance")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _format_labels(label_names: tuple, label_values: tuple, extra: str = "") -> str:
+    labels = [f'{name}="{value}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, label_names: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._values = {}
+        self._lock = Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def get(self, *label_values) -> float:
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets, like the Prometheus client's one"""
+    def __init__(self, name: str, documentation: str, buckets: tuple, label_names: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.label_names = label_names
+        self._series = {}  # label values -> [count of every bucket (+Inf last), sum]
+        self._lock = Lock()
+
+    def observe(self, value: float, *label_values):
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bucket] += 1
+            series[1] += value
+
+    def count(self, *label_values) -> int:
+        with self._lock:
+            series = self._series.get(label_values)
+            return sum(series[0]) if series is not None else 0
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, (bucket_counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip((*self.buckets, "+Inf"), bucket_counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.label_names, label_values, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.label_names, label_values)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class RequestStats:
+    """What happened during one request, kept in flask.g"""
+    __slots__ = ("start", "queries", "query_time", "serialization_time")
+
+    def __init__(self):
+        self.start = perf_counter()
+        self.queries = 0
+        self.query_time = 0.0
+        self.serialization_time = 0.0
+
+
+class Instrumentation:
+    def __init__(self):
+        self.enabled = False
+        self.slow_request_seconds = 1.0
+        self.slow_query_seconds = 0.1
+        self.requests = Counter("taskmanager_requests_total", "Handled requests",
+                                ("endpoint", "method", "status"))
+        self.request_duration = Histogram("taskmanager_request_duration_seconds", "Time spent handling requests",
+                                          LATENCY_BUCKETS, ("endpoint", "method"))
+        self.request_queries = Histogram("taskmanager_request_queries", "SQL queries issued by a request",
+                                         QUERY_COUNT_BUCKETS, ("endpoint",))
+        self.request_query_duration = Histogram("taskmanager_request_query_seconds",
+                                                "Time spent in SQL queries by a request", LATENCY_BUCKETS,
+                                                ("endpoint",))
+        self.serialization_duration = Histogram("taskmanager_serialization_seconds",
+                                                "Time spent serializing JSON by a request", LATENCY_BUCKETS,
+                                                ("endpoint",))
+        self.slow_requests = Counter("taskmanager_slow_requests_total", "Requests slower than the slow request "
+                                     "threshold", ("endpoint",))
+        self.slow_queries = Counter("taskmanager_slow_queries_total", "SQL queries slower than the slow query "
+                                    "threshold")
+        self._engines = set()
+
+    def init_app(self, app: Flask):
+        """Registers the hooks on app and its engine when app.config['INSTRUMENTATION'] is true. Requires app context"""
+        if not app.config.get("INSTRUMENTATION", False):
+            return
+        self.enabled = True
+        self.slow_request_seconds = app.config.get("SLOW_REQUEST_SECONDS", 1.0)
+        self.slow_query_seconds = app.config.get("SLOW_QUERY_SECONDS", 0.1)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.register_blueprint(metrics)
+        if db.engine not in self._engines:
+            event.listen(db.engine, "before_cursor_execute", self._before_cursor_execute)
+            event.listen(db.engine, "after_cursor_execute", self._after_cursor_execute)
+            self._engines.add(db.engine)
+        serialization.serialization_timer = self._record_serialization
+
+    def _before_request(self):
+        g._request_stats = RequestStats()
+
+    def _after_request(self, response: Response) -> Response:
+        stats = g.pop("_request_stats", None)
+        if stats is None:
+            return response
+        duration = perf_counter() - stats.start
+        endpoint = request.endpoint or "unmatched"  # not the path, which would make a series of every task id
+        self.requests.inc(endpoint, request.method, str(response.status_code))
+        self.request_duration.observe(duration, endpoint, request.method)
+        self.request_queries.observe(stats.queries, endpoint)
+        self.request_query_duration.observe(stats.query_time, endpoint)
+        self.serialization_duration.observe(stats.serialization_time, endpoint)
+        if duration >= self.slow_request_seconds:
+            self.slow_requests.inc(endpoint)
+            logger.warning("Slow request %s %s: %.3f s, %d queries taking %.3f s, serialization %.3f s",
+                           request.method, endpoint, duration, stats.queries, stats.query_time,
+                           stats.serialization_time)
+        return response
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration = perf_counter() - conn.info["query_start"].pop()
+        if has_request_context():
+            stats = g.get("_request_stats")
+            if stats is not None:
+                stats.queries += 1
+                stats.query_time += duration
+        if duration >= self.slow_query_seconds:
+            self.slow_queries.inc()
+            logger.warning("Slow query (%.3f s): %s", duration, statement)
+
+    @staticmethod
+    def _record_serialization(duration: float):
+        if has_request_context():
+            stats = g.get("_request_stats")
+            if stats is not None:
+                stats.serialization_time += duration
+
+    def render(self) -> str:
+        """All metrics in Prometheus text format"""
+        from .change_feed import change_feed
+        from .user_cache import user_cache
+        lines = []
+        for metric in [self.requests, self.request_duration, self.request_queries, self.request_query_duration,
+                       self.serialization_duration, self.slow_requests, self.slow_queries]:
+            lines.extend(metric.render())
+        user_cache_stats = user_cache.stats()
+        lines += [
+            "# HELP taskmanager_user_cache_hits_total Logged in users found in the user cache",
+            "# TYPE taskmanager_user_cache_hits_total counter",
+            f"taskmanager_user_cache_hits_total {user_cache_stats['hits']}",
+            "# HELP taskmanager_user_cache_misses_total Logged in users loaded from the database",
+            "# TYPE taskmanager_user_cache_misses_total counter",
+            f"taskmanager_user_cache_misses_total {user_cache_stats['misses']}",
+            "# HELP taskmanager_change_feed_subscriptions Open streams of task changes",
+            "# TYPE taskmanager_change_feed_subscriptions gauge",
+            f"taskmanager_change_feed_subscriptions {change_feed.subscription_count()}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+instrumentation = Instrumentation()
+
+metrics = Blueprint("metrics", __name__)
+
+@metrics.route("/metrics")
+def show_metrics():
+    return Response(instrumentation.render(), mimetype="text/plain; version=0.0.4")
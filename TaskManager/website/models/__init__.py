@@ -1,3 +1,5 @@
 from . import responses
-from .requests import AddTaskRequestModel, TargetSpecificTaskModel, EditTaskRequestModel
-
+from .requests import AddTaskRequestModel, TargetSpecificTaskModel, EditTaskRequestModel, PatchTaskRequestModel, \
+    ListTasksRequestModel, TaskTreeRequestModel, MoveTaskRequestModel, CalendarRangeRequestModel, \
+    SearchTasksRequestModel, UrgentTasksRequestModel, SetTaskStatusRequestModel, TaskStatsRequestModel, \
+    BatchOperationModel, BatchRequestModel
\ No newline at end of file
@@ -1,14 +1,17 @@
 from pydantic import BaseModel, Field, NonNegativeInt, ValidationError, model_validator
-from typing import Optional
-from datetime import datetime
+from typing import Any, Literal, Optional
+from datetime import date, datetime
 
 
+TaskStatus = Literal["todo", "in_progress", "done"]
+
 class AddTaskRequestModel(BaseModel):
     title: str = Field(max_length=100)
     importance: NonNegativeInt
     deadline: datetime
     est_time_days: Optional[NonNegativeInt]
     description: Optional[str] = Field(max_length=2000)
+    status: TaskStatus = "todo"
 
     model_config = {"validate_assignment": True}
 
@@ -28,5 +31,128 @@ class TargetSpecificTaskModel(BaseModel):
 
 class EditTaskRequestModel(AddTaskRequestModel):
     task_id: NonNegativeInt
+    status: Optional[TaskStatus] = None  # None keeps the current status
+
+    model_config = {"validate_assignment": True}
+
+class PatchTaskRequestModel(BaseModel):
+    """
+    Partial edit of a task - only the fields present in the request are changed, est_time_days and description can
+    be cleared with null
+    """
+    task_id: NonNegativeInt
+    title: Optional[str] = Field(max_length=100, default=None)
+    importance: Optional[NonNegativeInt] = None
+    deadline: Optional[datetime] = None
+    est_time_days: Optional[NonNegativeInt] = None
+    description: Optional[str] = Field(max_length=2000, default=None)
+    status: Optional[TaskStatus] = None
+
+    @model_validator(mode='after')
+    def validate_changes(self):
+        changes = self.changes()
+        if not changes:
+            raise ValueError("Nothing to change, provide at least one field of the task")
+        for field in ["title", "importance", "deadline", "status"]:
+            if field in changes and changes[field] is None:
+                raise ValueError(f"{field} cannot be null")
+        return self
+
+    def changes(self) -> dict[str, Any]:
+        """Fields present in the request with their values"""
+        return {field: getattr(self, field) for field in self.model_fields_set if field != "task_id"}
+
+    model_config = {"validate_assignment": True}
+
+
+class ListTasksRequestModel(BaseModel):
+    """Parameters of one page of the task list. All filters are optional and are applied by the database."""
+    limit: int = Field(default=50, ge=1, le=500)
+    cursor: Optional[str] = None
+    sort_by: Literal["id", "deadline", "importance"] = "id"
+    descending: bool = False
+    importance_min: Optional[NonNegativeInt] = None
+    importance_max: Optional[NonNegativeInt] = None
+    deadline_from: Optional[datetime] = None
+    deadline_to: Optional[datetime] = None
+    parent_task_id: Optional[NonNegativeInt] = None
+    title_contains: Optional[str] = Field(max_length=100, default=None)
+
+    model_config = {"validate_assignment": True}
+
+class TaskTreeRequestModel(BaseModel):
+    """Selects a subtree rooted at task_id, or the whole forest of user's tasks when task_id is not given"""
+    task_id: Optional[NonNegativeInt] = None
+    max_depth: Optional[NonNegativeInt] = None
+
+    model_config = {"validate_assignment": True}
+
+class MoveTaskRequestModel(BaseModel):
+    """Moves task (with all its subtasks) under a new parent, or makes it a top-level task when parent is None"""
+    task_id: NonNegativeInt
+    new_parent_task_id: Optional[NonNegativeInt] = None
+
+    model_config = {"validate_assignment": True}
+
+class CalendarRangeRequestModel(BaseModel):
+    """Time range [start, end) of the calendar view"""
+    start: datetime
+    end: datetime
+
+    @model_validator(mode='after')
+    def validate_range(self):
+        if self.end <= self.start:
+            raise ValueError("end of the range has to be later than its start")
+        return self
+
+    model_config = {"validate_assignment": True}
+
+class SearchTasksRequestModel(BaseModel):
+    """Full-text search - every word of the query has to appear (as a word or a prefix of a word) in a task"""
+    query: str = Field(min_length=1, max_length=200)
+    limit: int = Field(default=20, ge=1, le=100)
+
+    model_config = {"validate_assignment": True}
+
+class UrgentTasksRequestModel(BaseModel):
+    """The limit most urgent tasks that are not done yet, see utils.ranking.urgency"""
+    limit: int = Field(default=10, ge=1, le=100)
+
+    model_config = {"validate_assignment": True}
+
+class SetTaskStatusRequestModel(BaseModel):
+    """Moves a task to another stage of its lifecycle"""
+    task_id: NonNegativeInt
+    status: TaskStatus
+
+    model_config = {"validate_assignment": True}
+
+class TaskStatsRequestModel(BaseModel):
+    """Period [date_from, date_to] (both days included) of task statistics, tasks are counted by their deadline"""
+    date_from: date
+    date_to: date
+
+    @model_validator(mode='after')
+    def validate_period(self):
+        if self.date_to < self.date_from:
+            raise ValueError("date_to cannot be earlier than date_from")
+        return self
+
+    model_config = {"validate_assignment": True}
+
+class BatchOperationModel(BaseModel):
+    """One command of a batch. args are the same as the body of the command's own endpoint"""
+    command: Literal["add", "edit", "delete", "view"]
+    args: dict[str, Any] = Field(default_factory=dict)
+
+    model_config = {"validate_assignment": True}
+
+class BatchRequestModel(BaseModel):
+    """
+    Commands run in order in one transaction. With atomic, nothing is saved when any command fails, otherwise only
+    the failed commands are skipped
+    """
+    operations: list[BatchOperationModel] = Field(min_length=1, max_length=1000)
+    atomic: bool = False
 
     model_config = {"validate_assignment": True}
@@ -2,6 +2,7 @@
 One may be responses from API, other internal server messages - we will see"""
 from dataclasses import dataclass
 from pydantic import BaseModel
+from typing import Any, Optional
 
 
 @dataclass(frozen=True)
@@ -23,6 +24,39 @@ class ManyTasksResponse(SimpleResponse):
 class OneTaskResponse(SimpleResponse):
     task: dict = None
 
+@dataclass(frozen=True)
+class TasksPageResponse(ManyTasksResponse):
+    """
+    One page of a task list. next_cursor is an opaque string that has to be sent back to get the following page,
+    it is None when there are no more tasks
+    """
+    next_cursor: str = None
+
+@dataclass(frozen=True)
+class ImportTasksResponse(SimpleResponse):
+    """
+    Result of a bulk import - number of inserted tasks, number of rejected rows and descriptions of the first of them
+    (at most db_operations.IMPORT_MAX_ERRORS)
+    """
+    imported: int = 0
+    errors: list[str] = None
+    rejected: int = 0
+
+@dataclass(frozen=True)
+class TaskStatsResponse(SimpleResponse):
+    """Task counts of a period - total, by status and by importance (each importance split by status)"""
+    stats: dict = None
+
+@dataclass(frozen=True)
+class BatchResponse(SimpleResponse):
+    """
+    Result of a batch of commands - one dict per command, in order, with 'index', 'command', 'status' and either
+    'result' or 'message'
+    """
+    results: list[dict] = None
+
 class TerminalAPIResponse(BaseModel):
+    """Shape of the terminal endpoints' responses. result is a string, or any JSON value in structured mode"""
     status: str
-    result: str
\ No newline at end of file
+    result: Any = None
+    message: Optional[str] = None
\ No newline at end of file
@@ -0,0 +1,80 @@
+"""
+Password hashing in a bounded pool of threads. scrypt is deliberately slow and memory hungry, so hashes are computed
+by a small pool of threads (hashlib releases the GIL while hashing) and at most PASSWORD_HASH_WORKERS of them run at
+once in a worker process. Another PASSWORD_HASH_QUEUE requests may wait for a free thread, any more are
+rejected with PasswordHashingBusy immediately - a burst of logins then costs a bounded amount of CPU and memory.
+The request thread waits for its hash, so task requests keep being served only when the worker has more request
+threads than PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE - gunicorn.conf.py runs threaded workers for that reason.
+
+PASSWORD_HASH_METHOD is the werkzeug method of new hashes. Hashes made with other parameters are recognized by
+needs_rehash(), so that they can be replaced when the user logs in with the correct password.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask
+from os import getpid
+from threading import BoundedSemaphore, Lock
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class PasswordHashingBusy(Exception):
+    """Raised when too many passwords are being hashed already"""
+
+
+class PasswordHasher:
+    def __init__(self, method: str = "scrypt", workers: int = 2, queue_size: int = 8):
+        self.method = method
+        self.workers = workers
+        self.queue_size = queue_size
+        self._lock = Lock()
+        self._executor = None
+        self._executor_pid = None
+        self._slots = BoundedSemaphore(workers + queue_size)
+        self._method_prefix = None
+
+    def init_app(self, app: Flask):
+        with self._lock:
+            self.method = app.config.get("PASSWORD_HASH_METHOD", "scrypt")
+            self.workers = app.config.get("PASSWORD_HASH_WORKERS", 2)
+            self.queue_size = app.config.get("PASSWORD_HASH_QUEUE", 8)
+            self._slots = BoundedSemaphore(self.workers + self.queue_size)
+            self._method_prefix = None
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # threads do not survive fork, so every (Gunicorn worker) process creates its own pool
+        with self._lock:
+            if self._executor is None or self._executor_pid != getpid():
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="password-hashing")
+                self._executor_pid = getpid()
+            return self._executor
+
+    def _run(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHashingBusy("Too many passwords are being checked right now, try again in a moment")
+        try:
+            future = self._get_executor().submit(function, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+    def hash(self, password: str) -> str:
+        """Hash of password made with the current method. Raises PasswordHashingBusy"""
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash: str, password: str) -> bool:
+        """Checks password against a hash made with any method. Raises PasswordHashingBusy"""
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """True when password_hash was made with other method or parameters than the current ones"""
+        if self._method_prefix is None:
+            # werkzeug stores the method with all its parameters, e.g. scrypt:32768:8:1, before the first '$'
+            self._method_prefix = generate_password_hash("", self.method).split("$", 1)[0]
+        return password_hash.split("$", 1)[0] != self._method_prefix
+
+
+password_hasher = PasswordHasher()
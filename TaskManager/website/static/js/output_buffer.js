@@ -0,0 +1,161 @@
+// Pixels of lines rendered above and below the visible part of the output, so that scrolling does not show gaps
+const OVERSCAN_PX = 300;
+// Height assumed for lines that were not rendered yet
+const ESTIMATED_LINE_HEIGHT = 20;
+
+/**
+ * Output of the terminal. Lines are only appended to a list, and only the lines in (and around) the visible part of
+ * the output are in the document - printing a line costs the same no matter how long the history is. A spacer as
+ * tall as all the lines keeps the scrollbar right. Heights of lines are measured when they are rendered (until then
+ * they are estimated). At most maxLines lines are kept, the oldest ones are dropped.
+ *
+ * Lines added at once are rendered in the next animation frame, together.
+ */
+class OutputBuffer {
+    /**
+     * @param {HTMLElement} container - scrollable element of the output
+     * @param {number} maxLines - lines of the scrollback
+     */
+    constructor(container, maxLines = 20000) {
+        this.container = container;
+        this.maxLines = maxLines;
+        this.lines = [];     // {html, className, height}, height is null until the line is rendered
+        this.pending = [];   // lines appended since the last render
+        this.offsets = null; // offsets[i] is the top of line i, offsets[lines.length] the height of all lines
+        this.frameRequested = false;
+
+        this.spacer = document.createElement('div');
+        this.spacer.className = 'output-spacer';
+        this.rendered = document.createElement('div');
+        this.rendered.className = 'output-lines';
+        this.spacer.appendChild(this.rendered);
+        container.replaceChildren(this.spacer);
+        container.addEventListener('scroll', () => this.requestRender());
+    }
+
+    /**
+     * Appends a line
+     * @param {string} html - content of the line
+     * @param {string} className - CSS classes of the line (e.g. 'response-line error' or 'command-line')
+     */
+    append(html, className) {
+        this.pending.push({html: html, className: className, height: null});
+        this.requestRender();
+    }
+
+    clear() {
+        this.lines = [];
+        this.pending = [];
+        this.offsets = null;
+        this.requestRender();
+    }
+
+    requestRender() {
+        if (!this.frameRequested) {
+            this.frameRequested = true;
+            requestAnimationFrame(() => this.render());
+        }
+    }
+
+    isScrolledToBottom() {
+        const container = this.container;
+        return container.scrollTop + container.clientHeight >= container.scrollHeight - 2;
+    }
+
+    render() {
+        this.frameRequested = false;
+        // the output follows new lines only when the user did not scroll away from the end
+        const followEnd = this.isScrolledToBottom();
+        if (this.pending.length > 0) {
+            this.lines.push(...this.pending);
+            this.pending = [];
+            this.offsets = null;
+        }
+        if (this.lines.length > this.maxLines) {
+            const dropped = this.lines.splice(0, this.lines.length - this.maxLines);
+            if (!followEnd) {
+                // keep the lines the user is looking at in place
+                this.container.scrollTop -= dropped.reduce((sum, line) => sum + this.heightOf(line), 0);
+            }
+            this.offsets = null;
+        }
+        if (this.offsets === null) {
+            this.computeOffsets();
+        }
+        const totalHeight = this.offsets[this.lines.length];
+        this.spacer.style.height = `${totalHeight}px`;
+        if (followEnd) {
+            this.container.scrollTop = totalHeight;
+        }
+
+        const top = this.container.scrollTop;
+        const first = Math.max(this.lineAt(top - OVERSCAN_PX), 0);
+        const end = Math.min(this.lineAt(top + this.container.clientHeight + OVERSCAN_PX) + 1, this.lines.length);
+        const rows = [];
+        for (let index = first; index < end; index++) {
+            const row = document.createElement('div');
+            row.className = 'output-row';
+            const line = document.createElement('div');
+            line.className = this.lines[index].className;
+            line.innerHTML = this.lines[index].html;
+            row.appendChild(line);
+            rows.push(row);
+        }
+        this.rendered.style.transform = `translateY(${this.offsets[first] || 0}px)`;
+        this.rendered.replaceChildren(...rows);
+
+        // estimated heights are replaced with measured ones, the positions are corrected in the next frame
+        let heightsChanged = false;
+        rows.forEach((row, i) => {
+            const line = this.lines[first + i];
+            if (line.height !== row.offsetHeight) {
+                line.height = row.offsetHeight;
+                heightsChanged = true;
+            }
+        });
+        if (heightsChanged) {
+            this.offsets = null;
+            this.requestRender();
+        }
+    }
+
+    heightOf(line) {
+        return line.height === null ? ESTIMATED_LINE_HEIGHT : line.height;
+    }
+
+    computeOffsets() {
+        this.offsets = new Array(this.lines.length + 1);
+        this.offsets[0] = 0;
+        for (let index = 0; index < this.lines.length; index++) {
+            this.offsets[index + 1] = this.offsets[index] + this.heightOf(this.lines[index]);
+        }
+    }
+
+    /**
+     * Index of the line at the given distance from the top of the output (binary search in the offsets)
+     * @param {number} position - pixels from the top of the output
+     */
+    lineAt(position) {
+        let low = 0;
+        let high = this.lines.length - 1;
+        while (low < high) {
+            const middle = Math.ceil((low + high) / 2);
+            if (this.offsets[middle] <= position) {
+                low = middle;
+            } else {
+                high = middle - 1;
+            }
+        }
+        return low;
+    }
+}
+
+/**
+ * Escapes text to be shown as it is in a line of the output
+ * @param {string} text
+ */
+function escapeHtml(text) {
+    return text.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;').replace(/"/g, '&quot;');
+}
+
+export { OutputBuffer, escapeHtml };
@@ -1,22 +1,33 @@
 import {showTaskForm} from "./show_task_dialog.js";
+import {OutputBuffer, escapeHtml} from "./output_buffer.js";
 
-const output = document.getElementById('terminal-output');  // The terminal output display area
+const output = new OutputBuffer(document.getElementById('terminal-output'));  // The terminal output display area
 const input = document.getElementById('command-input');     // The command input field
 
 // Variables for command history functionality
 let commandHistory = [];  // Array to store previously entered commands
 let historyIndex = -1;    // Current position in command history (-1 means not browsing history)
 
+// Variables for list pagination
+let lastListArgs = null;  // Filters of the last 'list' command, reused by 'list more'
+let lastListCursor = null;  // Cursor of the next page returned by the last 'list' command
+
+// Stream of changes of the tasks, open while the 'watch' command is on
+let taskEvents = null;
+
 /**
  * Adds a new line to the terminal output
  * @param {string} text - The text content to add
  * @param {string} className - Optional CSS class for styling (e.g., 'error', 'success', 'info')
  */
 function addLine(text, className = '') {
-    // Create a new line with the provided text and class
-    output.innerHTML += `<div class="response-line ${className}">${text}</div>`;
-    // Scroll to the bottom of the output to show the newest content
-    output.scrollTop = output.scrollHeight;
+    // every line of a long text (e.g. a printed list) is a line of the output, so that only the visible ones are
+    // rendered. The output scrolls to the newest content by itself
+    const parts = String(text).split('\n');
+    parts.forEach((part, index) => {
+        const compact = index < parts.length - 1 ? ' compact' : '';
+        output.append(part, `response-line ${className}${compact}`);
+    });
 }
 
 /**
@@ -26,34 +37,55 @@ function displayHelp() {
     // Add header
     addLine('<span class="help-header">Available commands:</span>', 'info');
     addLine('<span class="help-command">help</span><span class="help-description">Show this help message</span>', 'info');
-    addLine('<span class="help-command">list</span><span class="help-description">List all tasks</span>', 'info');
+    addLine('<span class="help-command">list [key=value ...]</span><span class="help-description">List your tasks, one page at a time (list all prints all of them as they arrive). Optional keys: limit, sort_by (id, deadline, importance), descending, importance_min, importance_max, deadline_from, deadline_to, parent_task_id, title_contains</span>', 'info');
+    addLine('<span class="help-command">list more</span><span class="help-description">Show the next page of the last list</span>', 'info');
     addLine('<span class="help-command">view &lt;id&gt;</span><span class="help-description">View a task by ID</span>', 'info');
     addLine('<span class="help-command">add</span><span class="help-description">Add a new task. This will open a form to fill data of the new task</span>', 'info');
     addLine('<span class="help-command">edit &lt;id&gt;</span><span class="help-description">Edit a task with given ID. This will open a form</span>', 'info');
     addLine('<span class="help-command">delete &lt;id&gt;</span><span class="help-description">Delete a task by ID</span>', 'info');
+    addLine('<span class="help-command">tree [id] [depth]</span><span class="help-description">Show a task with its subtasks (or all your tasks) as a tree, optionally only depth levels deep</span>', 'info');
+    addLine('<span class="help-command">move &lt;id&gt; &lt;parent id|none&gt;</span><span class="help-description">Make a task (with its subtasks) a subtask of another task, or a top-level task</span>', 'info');
+    addLine('<span class="help-command">delete_tree &lt;id&gt;</span><span class="help-description">Delete a task together with all its subtasks</span>', 'info');
+    addLine('<span class="help-command">calendar &lt;from&gt; &lt;to&gt;</span><span class="help-description">Show tasks overlapping the given dates (e.g. 2030-01-01 2030-02-01) with their calendar lanes</span>', 'info');
+    addLine('<span class="help-command">search &lt;words&gt;</span><span class="help-description">Find tasks by words (or beginnings of words) in their title or description</span>', 'info');
+    addLine('<span class="help-command">status &lt;id&gt; &lt;todo|in_progress|done&gt;</span><span class="help-description">Change status of a task</span>', 'info');
+    addLine('<span class="help-command">stats &lt;from&gt; &lt;to&gt;</span><span class="help-description">Count tasks with deadline between the given days (both included) by status and importance</span>', 'info');
+    addLine('<span class="help-command">next [count]</span><span class="help-description">Show the most urgent tasks that are not done yet (10 by default) - important ones that have to be started soon come first</span>', 'info');
+    addLine('<span class="help-command">watch [off]</span><span class="help-description">Follow changes of your tasks live, the last list is shown again whenever your tasks change (needs the ASGI server)</span>', 'info');
+    addLine('<span class="help-command">(paste many lines)</span><span class="help-description">Run a pasted script with one request. One command per line: add {json}, edit &lt;id&gt; {json}, delete &lt;id&gt;, view &lt;id&gt;. Empty lines and lines starting with # are skipped</span>', 'info');
     addLine('<span class="help-command">clear</span><span class="help-description">Clear the terminal</span>', 'info');
     addLine('<span class="help-command">')
 }
 
 /**
- * Sends `args` as a JSON to `endpoint` via a POST request.
+ * Formats a result received from the server for printing
+ * @param {*} result - a string is printed as it is, any other JSON value is pretty printed
+ */
+function formatResult(result) {
+    return typeof result === 'string' ? result : JSON.stringify(result, null, 4);
+}
+
+/**
+ * Sends `args` as a JSON to `endpoint` via a POST request (or another `method`).
  * Displays the result on the terminal
  * when silent === true the function will NOT display result on the terminal
  * when return_results === true the function will return result of fetch()
  */
-async function send_terminal_cmd(endpoint, args, silent=false, return_results=false) {
+async function send_terminal_cmd(endpoint, args, silent=false, return_results=false, method='POST') {
     try {
+        // ask for results as JSON values, they are formatted here instead of on the server
+        const body = (typeof args === 'object' && args !== null) ? {...args, format: 'structured'} : args;
         const response = await fetch(endpoint, {
-            method: 'POST',
+            method: method,
             headers: {'Content-Type': 'application/json'},
-            body: JSON.stringify(args)
+            body: JSON.stringify(body)
         });
 
         const data = await response.json();
 
         if (!silent) {
             if (data.status === 'success') {
-                addLine(data.result, 'success');
+                addLine(formatResult(data.result), 'success');
             } else {
                 addLine(data.message, 'error');
             }
@@ -79,13 +111,198 @@ async function send_terminal_cmd(endpoint, args, silent=false, return_results=fa
     }
 }
 
+/**
+ * Fields of the task form that differ from the task, an empty estimated time or description clears it
+ * @param {Object} task - the task as returned by view
+ * @param {Object} values - values of the task form
+ */
+function changedTaskFields(task, values) {
+    const changes = {};
+    for (const [field, value] of Object.entries(values)) {
+        const previous = task[field] === null || task[field] === undefined ? '' : String(task[field]);
+        if (value === previous) {
+            continue;
+        }
+        const clearable = field === 'est_time_days' || field === 'description';
+        changes[field] = (value === '' && clearable) ? null : value;
+    }
+    return changes;
+}
+
+/**
+ * Parses `key=value` arguments of the list command into an object
+ * @param {string[]} params - arguments following the command name
+ */
+function parseListArgs(params) {
+    const listArgs = {};
+    for (const param of params) {
+        const separatorIndex = param.indexOf('=');
+        if (separatorIndex <= 0) {
+            return null;
+        }
+        listArgs[param.slice(0, separatorIndex)] = param.slice(separatorIndex + 1);
+    }
+    return listArgs;
+}
+
+/**
+ * Sends the list command and remembers the cursor of the next page
+ * @param {Object} listArgs - filters and sort order of the list
+ */
+async function sendListCmd(listArgs) {
+    const data = await send_terminal_cmd('/terminal/list', listArgs, false, true);
+    lastListArgs = listArgs;
+    lastListCursor = data.status === 'success' ? data.next_cursor : null;
+    if (lastListCursor) {
+        addLine("More tasks available, type 'list more' to see the next page.", 'info');
+    }
+}
+
+/**
+ * Prints all tasks, one per line, while they are being received - the export is read as a stream of newline
+ * delimited JSON and every received chunk is printed right away
+ */
+async function streamAllTasks() {
+    let count = 0;
+    try {
+        const response = await fetch('/terminal/export');
+        if (!response.ok) {
+            addLine(`Couldn't list tasks: ${response.status} ${response.statusText}`, 'error');
+            return;
+        }
+        const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+        let rest = '';
+        while (true) {
+            const {value, done} = await reader.read();
+            if (done) {
+                break;
+            }
+            const lines = (rest + value).split('\n');
+            rest = lines.pop();  // the last line may be incomplete
+            for (const line of lines) {
+                if (line === '') {
+                    continue;
+                }
+                const {user_id, parent_task_id, ...task} = JSON.parse(line);
+                output.append(escapeHtml(JSON.stringify(task)), 'response-line success compact');
+                count++;
+            }
+        }
+    } catch (error) {
+        addLine(`Error: ${error}`, 'error');
+        return;
+    }
+    addLine(`${count} tasks.`, 'info');
+}
+
+/**
+ * Starts or stops following changes of the tasks. The server sends an event with the revision of the tasks whenever
+ * they change, the last list is then shown again
+ * @param {boolean} stop - only stop following the changes
+ */
+function watchTasks(stop) {
+    if (taskEvents !== null) {
+        taskEvents.close();
+        taskEvents = null;
+    }
+    if (stop) {
+        addLine('Stopped watching your tasks.', 'info');
+        return;
+    }
+    const events = new EventSource('/terminal/events');
+    let seenRevision = null;
+    events.addEventListener('tasks', (event) => {
+        const revision = JSON.parse(event.data).revision;
+        if (seenRevision === null) {
+            addLine("Watching your tasks, type 'watch off' to stop.", 'info');
+        } else if (revision !== seenRevision && lastListArgs !== null) {
+            const {cursor, ...listArgs} = lastListArgs;
+            addLine('Your tasks changed:', 'info');
+            sendListCmd(listArgs);
+        } else if (revision !== seenRevision) {
+            addLine('Your tasks changed.', 'info');
+        }
+        seenRevision = revision;
+    });
+    events.onerror = () => {
+        // the browser reconnects by itself, unless the server does not serve the stream at all
+        if (events.readyState === EventSource.CLOSED) {
+            addLine('Live updates are not available on this server.', 'error');
+            if (taskEvents === events) {
+                taskEvents = null;
+            }
+        }
+    };
+    taskEvents = events;
+}
+
+/**
+ * Parses a pasted script into operations of the batch endpoint, one command per line
+ * @param {string} script - lines like 'add {json}', 'edit <id> {json}', 'delete <id>' or 'view <id>'
+ * @returns {Object[]} operations, throws Error describing the first invalid line
+ */
+function parseScript(script) {
+    const operations = [];
+    const lines = script.split(/\r?\n/);
+    for (let i = 0; i < lines.length; i++) {
+        const line = lines[i].trim();
+        if (line === '' || line.startsWith('#')) {
+            continue;
+        }
+        const match = line.match(/^(add|edit|delete|view)(?:\s+(\d+))?(?:\s+(.*))?$/);
+        if (match === null) {
+            throw new Error(`line ${i + 1}: unknown command '${line.split(' ')[0]}'`);
+        }
+        const [, command, taskId, json] = match;
+        try {
+            if (command === 'add' && taskId === undefined && json !== undefined) {
+                operations.push({command: command, args: JSON.parse(json)});
+            } else if (command === 'edit' && taskId !== undefined && json !== undefined) {
+                operations.push({command: command, args: {...JSON.parse(json), task_id: taskId}});
+            } else if ((command === 'delete' || command === 'view') && taskId !== undefined && json === undefined) {
+                operations.push({command: command, args: {task_id: taskId}});
+            } else {
+                throw new Error(`wrong arguments of ${command}`);
+            }
+        } catch (error) {
+            throw new Error(`line ${i + 1}: ${error.message}`);
+        }
+    }
+    return operations;
+}
+
+/**
+ * Runs a pasted multi-line script through the batch endpoint - all commands in one request and one transaction
+ * @param {string} script - the pasted text
+ */
+async function runScript(script) {
+    let operations;
+    try {
+        operations = parseScript(script);
+    } catch (error) {
+        addLine(`Script not run: ${error.message}`, 'error');
+        return;
+    }
+    if (operations.length === 0) {
+        return;
+    }
+    output.append(`<span class="prompt">$</span> (script with ${operations.length} commands)`, 'command-line');
+
+    const data = await send_terminal_cmd('/terminal/batch', {operations: operations}, true, true);
+    for (const result of data.result || []) {
+        const text = result.status === 'success' ? formatResult(result.result) : result.message;
+        addLine(`[${result.index + 1}] ${result.command}: ${text}`, result.status === 'success' ? 'success' : 'error');
+    }
+    addLine(data.message, data.status === 'success' ? 'info' : 'error');
+}
+
 /**
  * Processes a command entered by the user
  * @param {string} command - The command string to process
  */
 async function processCommand(command) {
     // Display the command in the terminal with the prompt
-    output.innerHTML += `<div class="command-line"><span class="prompt">$</span> ${command}</div>`;
+    output.append(`<span class="prompt">$</span> ${command}`, 'command-line');
 
     // Parse the command into the base command and its arguments
     const parts = command.trim().split(' ');  // Split by spaces
@@ -93,7 +310,7 @@ async function processCommand(command) {
     let args = parts.slice(1).join(' ');    // Rest is joined back as arguments
 
     if (cmd === 'clear') {
-        output.innerHTML = '';
+        output.clear();
         addLine('Terminal cleared.', 'info');
         return;
     }
@@ -101,6 +318,10 @@ async function processCommand(command) {
         displayHelp();
         return;
     }
+    if (cmd === 'watch') {
+        watchTasks(parts[1] === 'off');
+        return;
+    }
 
     // Map of command names to their corresponding server endpoints
     const endpoints = {
@@ -108,7 +329,15 @@ async function processCommand(command) {
         'view': '/terminal/view',
         'add': '/terminal/add',
         'edit': '/terminal/edit',
-        'delete': '/terminal/delete'
+        'delete': '/terminal/delete',
+        'tree': '/terminal/tree',
+        'move': '/terminal/move',
+        'delete_tree': '/terminal/delete_tree',
+        'calendar': '/terminal/calendar',
+        'search': '/terminal/search',
+        'status': '/terminal/status',
+        'stats': '/terminal/stats',
+        'next': '/terminal/next'
     };
 
     // Check if the command exists in our endpoint map
@@ -121,6 +350,32 @@ async function processCommand(command) {
     const endpoint = endpoints[cmd];
 
     // Prepare the args
+    if (cmd === 'list')
+    {
+        if (parts.length === 2 && parts[1] === 'all')
+        {
+            streamAllTasks();
+            return;
+        }
+        if (parts.length === 2 && parts[1] === 'more')
+        {
+            if (!lastListCursor)
+            {
+                addLine("There is no next page to show.");
+                return;
+            }
+            sendListCmd({...lastListArgs, cursor: lastListCursor});
+            return;
+        }
+        const listArgs = parseListArgs(parts.slice(1).filter(part => part !== ''));
+        if (listArgs === null)
+        {
+            addLine("Command list expects arguments in form key=value.");
+            return;
+        }
+        sendListCmd(listArgs);
+        return;
+    }
     if (cmd === 'add')
     {
         args = await showTaskForm();
@@ -130,7 +385,76 @@ async function processCommand(command) {
             return;
         }
     }
-    if (cmd === 'view' || cmd === 'edit' || cmd === 'delete')
+    if (cmd === 'tree')
+    {
+        if (parts.length > 3)
+        {
+            addLine("Command tree expected at most two parameters - task id and depth.");
+            return;
+        }
+        args = {};
+        if (parts.length >= 2) {
+            args.task_id = parts[1];
+        }
+        if (parts.length === 3) {
+            args.max_depth = parts[2];
+        }
+    }
+    if (cmd === 'move')
+    {
+        if (parts.length !== 3)
+        {
+            addLine("Command move expected exactly two parameters - task id and new parent id (or 'none').");
+            return;
+        }
+        args = {"task_id": parts[1], "new_parent_task_id": parts[2] === 'none' ? null : parts[2]};
+    }
+    if (cmd === 'search')
+    {
+        if (args.trim() === '')
+        {
+            addLine("Command search expected words to search for.");
+            return;
+        }
+        args = {"query": args};
+    }
+    if (cmd === 'calendar')
+    {
+        if (parts.length !== 3)
+        {
+            addLine("Command calendar expected exactly two parameters - start and end of the range.");
+            return;
+        }
+        args = {"start": parts[1], "end": parts[2]};
+    }
+    if (cmd === 'status')
+    {
+        if (parts.length !== 3)
+        {
+            addLine("Command status expected exactly two parameters - task id and the new status.");
+            return;
+        }
+        args = {"task_id": parts[1], "status": parts[2]};
+    }
+    if (cmd === 'stats')
+    {
+        if (parts.length !== 3)
+        {
+            addLine("Command stats expected exactly two parameters - first and last day of the period.");
+            return;
+        }
+        args = {"date_from": parts[1], "date_to": parts[2]};
+    }
+    if (cmd === 'next')
+    {
+        if (parts.length > 2)
+        {
+            addLine("Command next expected at most one parameter - number of tasks to show.");
+            return;
+        }
+        args = parts.length === 2 ? {"limit": parts[1]} : {};
+    }
+    if (cmd === 'view' || cmd === 'edit' || cmd === 'delete' || cmd === 'delete_tree')
     {
         if (parts.length !== 2)
         {
@@ -152,7 +476,7 @@ async function processCommand(command) {
         addLine(`Couldn't edit: ${task_response.message}`);
         return;
     }
-    const task_data = JSON.parse(task_response.result);
+    const task_data = task_response.result;
     args = await showTaskForm(task_data);
     console.log("args from showTaskForm()", args);
     if (args === null)
@@ -160,8 +484,15 @@ async function processCommand(command) {
         addLine("Edit command cancelled. No changes made");
         return;
     }
-    args.task_id = parts[1];
-    const edit_response = await send_terminal_cmd(endpoint, args, true, true);
+    // only the changed fields are sent, the rest of the task stays as it is
+    const changes = changedTaskFields(task_data, args);
+    if (Object.keys(changes).length === 0)
+    {
+        addLine("No changes made");
+        return;
+    }
+    changes.task_id = parts[1];
+    const edit_response = await send_terminal_cmd(endpoint, changes, true, true, 'PATCH');
     if (edit_response.status !== 'success')
     {
         addLine(edit_response.message);
@@ -175,6 +506,16 @@ async function processCommand(command) {
 
 }
 
+// Pasted text with many lines is run as a script, a single line is pasted into the input as usual
+input.addEventListener('paste', function(e) {
+    const text = (e.clipboardData || window.clipboardData).getData('text');
+    if (!text.includes('\n')) {
+        return;
+    }
+    e.preventDefault();
+    runScript(text);
+});
+
 // Set up event listener for keyboard input
 input.addEventListener('keydown', function(e) {
     if (e.key === 'Enter') {
@@ -0,0 +1,200 @@
+"""
+Cache of serialized task lists, one set of entries per user (a user can have many cached pages/filters).
+
+Every user has a generation number. Writes to user's tasks bump it (see db_operations), which makes all cached
+entries of that user stale at once. Readers get the generation together with the entry and have to pass it back
+when storing a freshly computed value - a value computed before a concurrent write is then silently dropped,
+instead of being cached forever.
+
+Invalidation reaches only the cache of the host that changed the tasks. Hosts sharing a database (e.g. PostgreSQL)
+see each other's changes because the list endpoint keys its entries by the revision of user's tasks as well, which
+is read from the database (TaskRevision) before the tasks.
+
+Two backends are available, chosen with the TASK_LIST_CACHE_BACKEND config key:
+ - "memory" - in-process LRU. Fastest, but every Gunicorn worker has its own copy and does not see invalidations
+   made by other workers, so it should only be used with a single worker
+ - "sqlite" - a separate SQLite file shared by all workers on the host (TASK_LIST_CACHE_PATH, by default a file in
+   the temporary directory, one per database, so that it is never written into the source tree)
+ - "none" - caching disabled
+"""
+from collections import OrderedDict
+from flask import Flask
+from hashlib import sha1
+from os import getpid, path
+from tempfile import gettempdir
+from threading import Lock, local
+from typing import Optional
+import sqlite3
+
+from .db_profiles import apply_sqlite_pragmas, get_profile
+
+
+class MemoryCacheBackend:
+    """In-process LRU bounded by the number of entries"""
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (user_id, key) -> (generation, value)
+        self._generations = {}
+        self._lock = Lock()
+
+    def get(self, user_id: int, key: str) -> tuple[Optional[str], int]:
+        with self._lock:
+            generation = self._generations.get(user_id, 0)
+            entry = self._entries.get((user_id, key))
+            if entry is None or entry[0] != generation:
+                return None, generation
+            self._entries.move_to_end((user_id, key))
+            return entry[1], generation
+
+    def set(self, user_id: int, key: str, value: str, generation: int):
+        with self._lock:
+            if self._generations.get(user_id, 0) != generation:
+                return
+            self._entries[(user_id, key)] = (generation, value)
+            self._entries.move_to_end((user_id, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        # stale entries are not looked up anymore, they are evicted like any other unused entry
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+
+
+class SQLiteCacheBackend:
+    """
+    Cache kept in a separate SQLite file, so that all worker processes share entries and invalidations.
+    When there are more than max_entries entries, the oldest ones are removed.
+    """
+    # how many set() calls may pass between checks of the number of entries
+    TRIM_INTERVAL = 64
+
+    def __init__(self, database_path: str, max_entries: int):
+        self.database_path = database_path
+        self.max_entries = max_entries
+        self._local = local()
+        self._sets_since_trim = 0
+        with self._connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS cache_generation "
+                               "(user_id INTEGER PRIMARY KEY, generation INTEGER NOT NULL)")
+            connection.execute("CREATE TABLE IF NOT EXISTS cache_entry (user_id INTEGER NOT NULL, key TEXT NOT NULL, "
+                               "generation INTEGER NOT NULL, value TEXT NOT NULL, PRIMARY KEY (user_id, key))")
+
+    def _connection(self) -> sqlite3.Connection:
+        # one connection per thread, opened again after fork - sqlite connections must not cross processes
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != getpid():
+            connection = sqlite3.connect(self.database_path, isolation_level=None, check_same_thread=False)
+            apply_sqlite_pragmas(connection, get_profile("production")["pragmas"])
+            self._local.connection = connection
+            self._local.pid = getpid()
+        return connection
+
+    def get(self, user_id: int, key: str) -> tuple[Optional[str], int]:
+        row = self._connection().execute(
+            "SELECT g.generation, (SELECT value FROM cache_entry "
+            "                      WHERE user_id = :user_id AND key = :key AND generation = g.generation) "
+            "FROM (SELECT COALESCE(MAX(generation), 0) AS generation "
+            "      FROM cache_generation WHERE user_id = :user_id) AS g",
+            {"user_id": user_id, "key": key}
+        ).fetchone()
+        return row[1], row[0]
+
+    def set(self, user_id: int, key: str, value: str, generation: int):
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO cache_entry (user_id, key, generation, value) "
+            "SELECT :user_id, :key, :generation, :value "
+            "WHERE (SELECT COALESCE(MAX(generation), 0) FROM cache_generation WHERE user_id = :user_id) = :generation",
+            {"user_id": user_id, "key": key, "generation": generation, "value": value}
+        )
+        self._sets_since_trim += 1
+        if self._sets_since_trim >= self.TRIM_INTERVAL:
+            self._sets_since_trim = 0
+            connection.execute(
+                "DELETE FROM cache_entry WHERE rowid IN (SELECT rowid FROM cache_entry ORDER BY rowid "
+                "LIMIT MAX((SELECT COUNT(*) FROM cache_entry) - ?, 0))",
+                (self.max_entries,)
+            )
+
+    def invalidate(self, user_id: int):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("INSERT INTO cache_generation (user_id, generation) VALUES (?, 1) "
+                               "ON CONFLICT (user_id) DO UPDATE SET generation = generation + 1", (user_id,))
+            connection.execute("DELETE FROM cache_entry WHERE user_id = ?", (user_id,))
+            connection.execute("COMMIT")
+        except sqlite3.Error:
+            connection.execute("ROLLBACK")
+            raise
+
+    def clear(self):
+        connection = self._connection()
+        connection.execute("DELETE FROM cache_entry")
+        connection.execute("DELETE FROM cache_generation")
+
+    def close(self):
+        """Closes the connection of the calling thread, e.g. before the process forks"""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None and self._local.pid == getpid():
+            connection.close()
+        self._local.connection = None
+
+
+def default_cache_path(app: Flask) -> str:
+    """Cache file in the temporary directory, keyed by the database - apps using other databases must not share it"""
+    database_key = sha1(str(app.config.get("SQLALCHEMY_DATABASE_URI")).encode()).hexdigest()[:16]
+    return path.join(gettempdir(), f"taskmanager-{database_key}.task-cache.db")
+
+
+class TaskListCache:
+    """Flask extension-like wrapper around the configured backend. Without a backend every lookup is a miss"""
+    def __init__(self):
+        self.backend = None
+
+    def init_app(self, app: Flask):
+        backend_name = app.config.setdefault("TASK_LIST_CACHE_BACKEND", "memory")
+        max_entries = app.config.setdefault("TASK_LIST_CACHE_SIZE", 1024)
+        if backend_name == "memory":
+            self.backend = MemoryCacheBackend(max_entries)
+        elif backend_name == "sqlite":
+            cache_path = app.config.setdefault("TASK_LIST_CACHE_PATH", default_cache_path(app))
+            self.backend = SQLiteCacheBackend(cache_path, max_entries)
+        elif backend_name == "none":
+            self.backend = None
+        else:
+            raise ValueError(f"Unknown task list cache backend '{backend_name}'")
+
+    def get(self, user_id: int, key: str) -> tuple[Optional[str], int]:
+        """Returns (cached value or None, generation). The generation has to be passed to set()"""
+        if self.backend is None:
+            return None, 0
+        return self.backend.get(user_id, key)
+
+    def set(self, user_id: int, key: str, value: str, generation: int):
+        """Stores the value, unless user's tasks changed since get() returned the generation"""
+        if self.backend is not None:
+            self.backend.set(user_id, key, value, generation)
+
+    def invalidate(self, user_id: int):
+        """Makes all cached entries of the user stale"""
+        if self.backend is not None:
+            self.backend.invalidate(user_id)
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    def close(self):
+        """Releases connections of the backend, it reconnects when used again"""
+        if hasattr(self.backend, "close"):
+            self.backend.close()
+
+
+task_list_cache = TaskListCache()
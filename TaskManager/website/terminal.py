@@ -1,33 +1,87 @@
-from .db_operations import try_add_new_task, try_getting_user_tasks, try_getting_specific_task, \
-    try_removing_specific_task, try_editing_specific_task
-from .models import AddTaskRequestModel, EditTaskRequestModel
-from .utils import DateTimeEncoder
+from .db_operations import try_add_new_task, try_getting_user_tasks_page, try_getting_specific_task, \
+    try_removing_specific_task, try_editing_specific_task, try_importing_tasks, iter_user_tasks, \
+    try_getting_task_revision, try_getting_task_tree, try_removing_task_subtree, try_moving_task, \
+    try_getting_tasks_in_range, try_searching_tasks, try_setting_task_status, try_getting_task_stats, \
+    try_running_batch, try_patching_task, try_getting_most_urgent_tasks
+from .models import AddTaskRequestModel, EditTaskRequestModel, ListTasksRequestModel, TaskTreeRequestModel, \
+    MoveTaskRequestModel, CalendarRangeRequestModel, SearchTasksRequestModel, SetTaskStatusRequestModel, \
+    TaskStatsRequestModel, BatchRequestModel, PatchTaskRequestModel, UrgentTasksRequestModel
+from .task_cache import task_list_cache
+from .utils import iter_ndjson_records, iter_csv_records, dumps, dumps_text, json_response, wants_pretty, \
+    wants_structured
 from pydantic import ValidationError
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, request, stream_with_context
 from flask_login import login_required, current_user
 from sqlalchemy.exc import NoResultFound
-import json
+import io
 
 
 terminal = Blueprint('terminal', __name__)
 
-@terminal.route('/view', methods=['POST'])
-@login_required
-def view():
-    """Allows to see all contents of one specific task based on its id"""
-    if not request.json["task_id"].isdigit():
-        return jsonify({"status": "error", "message": "Expected task_id to be integer!"}), 400
-    task_id = int(request.json["task_id"])
+def conditional_get(build_response):
+    """
+    Answers a GET request using the revision of user's tasks as ETag. When the client already has the current
+    revision, 304 is returned without reading any task, otherwise build_response() is called and the ETag is attached.
+    """
+    user_id = current_user.id
+    revision = try_getting_task_revision(user_id)
+    if revision.success is False:
+        return json_response({"status": "error", "message": revision.message}), 500
+    etag = f"{user_id}-{revision.message}"
+
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response, code = build_response()
+        response.status_code = code
+    response.set_etag(etag)
+    # responses differ between users, so shared caches must not store them and clients have to revalidate
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.vary.add("Cookie")
+    return response
+
+def format_result(result, args: dict):
+    """
+    Prepares result for the response according to output options of the request (see utils.serialization): a JSON
+    value in structured mode, otherwise a JSON string that the terminal prints as it is (pretty printed by default)
+    """
+    if wants_structured(args):
+        return result
+    return dumps_text(result, pretty=wants_pretty_result(args))
+
+def wants_pretty_result(args: dict) -> bool:
+    """Whether format_result pretty prints the text result - it does unless 'pretty' is explicitly turned off"""
+    return args.get("pretty") is None or wants_pretty(args)
+
+def view_task(task_id: str, args: dict):
+    """Body of the view command, shared by POST and GET version. args are the request options"""
+    if not task_id.isdigit():
+        return json_response({"status": "error", "message": "Expected task_id to be integer!"}), 400
+    task_id = int(task_id)
     result = try_getting_specific_task(current_user.id, task_id)
     if result.success is False:
         if isinstance(result.exception, NoResultFound):
-            return jsonify({"status": "error", "message": result.message}), 404
-        return jsonify({"status": "error", "message": result.message}), 500
+            return json_response({"status": "error", "message": result.message}), 404
+        return json_response({"status": "error", "message": result.message}), 500
 
     task_dict = result.task
     task_dict.pop("parent_task_id")
     task_dict.pop("user_id")
-    return jsonify({"status": "success", "result": json.dumps(task_dict, cls=DateTimeEncoder, indent=4)}), 200
+    return json_response({"status": "success", "result": format_result(task_dict, args)}, wants_pretty(args)), 200
+
+@terminal.route('/view', methods=['POST'])
+@login_required
+def view():
+    """
+    Allows to see all contents of one specific task based on its id. Accepts output options 'format' and 'pretty'
+    """
+    return view_task(request.json["task_id"], request.json)
+
+@terminal.route('/view', methods=['GET'])
+@login_required
+def view_conditional():
+    """Read-only version of view, task id is passed in query string. Supports If-None-Match"""
+    return conditional_get(lambda: view_task(request.args.get("task_id", ""), request.args))
 
 @terminal.route('/add', methods=['POST'])
 @login_required
@@ -36,33 +90,71 @@ def add():
     try:
         task_data = AddTaskRequestModel.model_validate(request.json)
     except ValidationError as e:
-        return jsonify({"status": "error", "message": str(e)}), 400
+        return json_response({"status": "error", "message": str(e)}), 400
 
     user_id = current_user.id
     result = try_add_new_task(task_data, user_id)
     if result.success is False:
-        return jsonify({"status": "error", "message": result.message}), 500
+        return json_response({"status": "error", "message": result.message}), 500
     msg = (f"Your task '{task_data.title}', with importance {task_data.importance} and deadline {task_data.deadline} "
            f"has been succesfully added.'")
-    return jsonify({"status": "success", "result": msg}), 200
+    return json_response({"status": "success", "result": msg}), 200
 
-@terminal.route('/list', methods=['POST'])
-@login_required
-def show_list():
-    """Shows all tasks of requesting user"""
-    # unfortunately name 'list' is built in python
-    result = try_getting_user_tasks(current_user.id)
+def list_tasks(list_args: dict):
+    """Body of the list command, shared by POST and GET version"""
+    try:
+        list_request = ListTasksRequestModel.model_validate(list_args)
+    except ValidationError as e:
+        return json_response({"status": "error", "message": str(e)}), 400
+
+    user_id = current_user.id
+    # the revision is read before the tasks, so an entry is never stored under a revision older than its tasks.
+    # Invalidation reaches only the cache of the process (host) that made the change, the revision in the key
+    # makes entries of every other host stale as soon as the change is committed
+    revision = try_getting_task_revision(user_id)
+    if revision.success is False:
+        return json_response({"status": "error", "message": revision.message}), 500
+    pretty = wants_pretty(list_args)
+    # every option that changes the body is a part of the key
+    cache_key = (f"{revision.message}:{wants_structured(list_args)}:{pretty}:{wants_pretty_result(list_args)}:"
+                 f"{list_request.model_dump_json()}")
+    cached_response, cache_generation = task_list_cache.get(user_id, cache_key)
+    if cached_response is not None:
+        return Response(cached_response, mimetype="application/json"), 200
+
+    result = try_getting_user_tasks_page(user_id, list_request)
     if result.success is False:
-        if isinstance(result.exception, NoResultFound):
-            return jsonify({"status": "error", "message": result.message}), 404
-        return jsonify({"status": "error", "message": result.message}), 500
+        if isinstance(result.exception, ValueError):
+            return json_response({"status": "error", "message": result.message}), 400
+        return json_response({"status": "error", "message": result.message}), 500
     tasks = result.tasks
     for task in tasks:
         # task.pop("task_id")
         task.pop("parent_task_id")
         task.pop("user_id")
-    tasks_json = json.dumps(tasks, indent=4, cls=DateTimeEncoder)
-    return jsonify({"status": "success", "result": tasks_json}), 200
+    response_json = dumps_text(
+        {"status": "success", "result": format_result(tasks, list_args), "next_cursor": result.next_cursor}, pretty)
+    task_list_cache.set(user_id, cache_key, response_json, cache_generation)
+    return Response(response_json, mimetype="application/json"), 200
+
+@terminal.route('/list', methods=['POST'])
+@login_required
+def show_list():
+    """
+    Shows one page of tasks of requesting user. Accepts optional filters, sort order and the cursor returned
+    with the previous page (see ListTasksRequestModel), as well as output options 'format' and 'pretty'
+    """
+    # unfortunately name 'list' is built in python
+    list_args = request.get_json(silent=True)
+    if not isinstance(list_args, dict):
+        list_args = {}
+    return list_tasks(list_args)
+
+@terminal.route('/list', methods=['GET'])
+@login_required
+def show_list_conditional():
+    """Read-only version of list, parameters are passed in query string. Supports If-None-Match"""
+    return conditional_get(lambda: list_tasks(request.args.to_dict()))
 
 @terminal.route('/delete', methods=['POST'])
 @login_required
@@ -70,16 +162,16 @@ def delete():
     """Deletes a task from the database, based on its id"""
     print(request.json["task_id"])
     if not request.json["task_id"].isdigit():
-        return jsonify({"status": "error", "message": "Expected task_id to be integer!"}), 400
+        return json_response({"status": "error", "message": "Expected task_id to be integer!"}), 400
     task_id = int(request.json["task_id"])
 
     result = try_removing_specific_task(current_user.id, task_id)
     if result.success is False:
         if isinstance(result.exception, NoResultFound):
-            return jsonify({"status": "error", "message": result.message}), 404
-        return jsonify({"status": "error", "message": result.message}), 500
+            return json_response({"status": "error", "message": result.message}), 404
+        return json_response({"status": "error", "message": result.message}), 500
 
-    return jsonify({"status": "success", "result": f"Succesfully deleted task '{result.message}'"}), 200
+    return json_response({"status": "success", "result": f"Succesfully deleted task '{result.message}'"}), 200
 
 @terminal.route('/edit', methods=['POST'])
 @login_required
@@ -90,15 +182,297 @@ def edit():
     try:
         edit_request = EditTaskRequestModel.model_validate(request.json)
     except ValidationError as e:
-        return jsonify({"status": "error", "message": str(e)}), 400
+        return json_response({"status": "error", "message": str(e)}), 400
 
     user_id = current_user.id
     result = try_editing_specific_task(user_id, edit_request)
     if result.success is False:
         if isinstance(result.exception, NoResultFound):
-            return jsonify({"status": "error", "message": result.message}), 404
-        return jsonify({"status": "error", "message": result.message}), 500
+            return json_response({"status": "error", "message": result.message}), 404
+        return json_response({"status": "error", "message": result.message}), 500
+
+    return json_response({"status": "success", "result": result.message}), 200
+
+@terminal.route('/edit', methods=['PATCH'])
+@login_required
+def patch():
+    """
+    Changes only the given fields of the task, e.g. {"task_id": 1, "deadline": "2030-01-01T12:00:00"}. Nullable
+    fields (est_time_days, description) are cleared with null.
+    """
+    try:
+        patch_request = PatchTaskRequestModel.model_validate(request.json)
+    except ValidationError as e:
+        return json_response({"status": "error", "message": str(e)}), 400
+
+    result = try_patching_task(current_user.id, patch_request)
+    if result.success is False:
+        if isinstance(result.exception, NoResultFound):
+            return json_response({"status": "error", "message": result.message}), 404
+        return json_response({"status": "error", "message": result.message}), 500
+
+    return json_response({"status": "success", "result": result.message}), 200
+
+@terminal.route('/import', methods=['POST'])
+@login_required
+def import_tasks():
+    """
+    Adds many tasks at once. The body is streamed - newline delimited JSON (one task per line) by default, or CSV
+    with a header row when Content-Type is text/csv. Fields are the same as in the add command. Lines that are not
+    valid UTF-8 are rejected, like lines with invalid tasks.
+    """
+    lines = io.TextIOWrapper(request.stream, encoding="utf-8", errors="replace", newline="")
+    if request.mimetype == "text/csv":
+        records = iter_csv_records(lines)
+    else:
+        records = iter_ndjson_records(lines)
+
+    result = try_importing_tasks(records, current_user.id)
+    response = {"imported": result.imported, "rejected": result.rejected, "errors": result.errors}
+    if result.success is False:
+        return json_response({"status": "error", "message": result.message, **response}), 500
+    return json_response({"status": "success", "result": result.message, **response}), 200
+
+@terminal.route('/export', methods=['GET'])
+@login_required
+def export_tasks():
+    """Streams all tasks of requesting user as newline delimited JSON, one task per line"""
+    user_id = current_user.id
+
+    def generate():
+        for task in iter_user_tasks(user_id):
+            yield dumps(task) + b"\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+def show_task_tree(tree_args: dict):
+    """Body of the tree command, shared by POST and GET version"""
+    try:
+        tree_request = TaskTreeRequestModel.model_validate(tree_args)
+    except ValidationError as e:
+        return json_response({"status": "error", "message": str(e)}), 400
+
+    result = try_getting_task_tree(current_user.id, tree_request)
+    if result.success is False:
+        if isinstance(result.exception, NoResultFound):
+            return json_response({"status": "error", "message": result.message}), 404
+        return json_response({"status": "error", "message": result.message}), 500
+    return json_response({"status": "success", "result": format_result(result.tasks, tree_args)},
+                         wants_pretty(tree_args)), 200
+
+@terminal.route('/tree', methods=['POST'])
+@login_required
+def tree():
+    """
+    Shows a task with all its subtasks (or all tasks of the user) as a tree, optionally limited to max_depth levels.
+    Accepts output options 'format' and 'pretty'
+    """
+    tree_args = request.get_json(silent=True)
+    if not isinstance(tree_args, dict):
+        tree_args = {}
+    return show_task_tree(tree_args)
+
+@terminal.route('/tree', methods=['GET'])
+@login_required
+def tree_conditional():
+    """Read-only version of tree, parameters are passed in query string. Supports If-None-Match"""
+    return conditional_get(lambda: show_task_tree(request.args.to_dict()))
+
+@terminal.route('/delete_tree', methods=['POST'])
+@login_required
+def delete_tree():
+    """Deletes a task together with all its subtasks"""
+    if not str(request.json["task_id"]).isdigit():
+        return json_response({"status": "error", "message": "Expected task_id to be integer!"}), 400
+    task_id = int(request.json["task_id"])
+
+    result = try_removing_task_subtree(current_user.id, task_id)
+    if result.success is False:
+        if isinstance(result.exception, NoResultFound):
+            return json_response({"status": "error", "message": result.message}), 404
+        return json_response({"status": "error", "message": result.message}), 500
+    return json_response({"status": "success", "result": f"Succesfully deleted {result.message} tasks"}), 200
+
+@terminal.route('/move', methods=['POST'])
+@login_required
+def move():
+    """Moves a task with all its subtasks under another task, or to the top level when new_parent_task_id is null"""
+    try:
+        move_request = MoveTaskRequestModel.model_validate(request.json)
+    except ValidationError as e:
+        return json_response({"status": "error", "message": str(e)}), 400
+
+    result = try_moving_task(current_user.id, move_request)
+    if result.success is False:
+        if isinstance(result.exception, NoResultFound):
+            return json_response({"status": "error", "message": result.message}), 404
+        if isinstance(result.exception, ValueError):
+            return json_response({"status": "error", "message": result.message}), 400
+        return json_response({"status": "error", "message": result.message}), 500
+    return json_response({"status": "success", "result": result.message}), 200
+
+def show_calendar(range_args: dict):
+    """Body of the calendar command, shared by POST and GET version"""
+    try:
+        range_request = CalendarRangeRequestModel.model_validate(range_args)
+    except ValidationError as e:
+        return json_response({"status": "error", "message": str(e)}), 400
+
+    result = try_getting_tasks_in_range(current_user.id, range_request)
+    if result.success is False:
+        return json_response({"status": "error", "message": result.message}), 500
+    for task in result.tasks:
+        task.pop("user_id")
+    return json_response({"status": "success", "result": format_result(result.tasks, range_args)},
+                         wants_pretty(range_args)), 200
+
+@terminal.route('/calendar', methods=['POST'])
+@login_required
+def calendar():
+    """
+    Shows tasks overlapping the time range [start, end), each with the calendar lane it should be drawn in.
+    Accepts output options 'format' and 'pretty'
+    """
+    range_args = request.get_json(silent=True)
+    if not isinstance(range_args, dict):
+        range_args = {}
+    return show_calendar(range_args)
+
+@terminal.route('/calendar', methods=['GET'])
+@login_required
+def calendar_conditional():
+    """Read-only version of calendar, parameters are passed in query string. Supports If-None-Match"""
+    return conditional_get(lambda: show_calendar(request.args.to_dict()))
+
+def search_tasks(search_args: dict):
+    """Body of the search command, shared by POST and GET version"""
+    try:
+        search_request = SearchTasksRequestModel.model_validate(search_args)
+    except ValidationError as e:
+        return json_response({"status": "error", "message": str(e)}), 400
+
+    result = try_searching_tasks(current_user.id, search_request)
+    if result.success is False:
+        if isinstance(result.exception, ValueError):
+            return json_response({"status": "error", "message": result.message}), 400
+        return json_response({"status": "error", "message": result.message}), 500
+    return json_response({"status": "success", "result": format_result(result.tasks, search_args)},
+                         wants_pretty(search_args)), 200
+
+@terminal.route('/search', methods=['POST'])
+@login_required
+def search():
+    """
+    Full-text search in titles and descriptions of requesting user's tasks, best matches first. Words of the query
+    are matched as prefixes. Accepts output options 'format' and 'pretty'
+    """
+    search_args = request.get_json(silent=True)
+    if not isinstance(search_args, dict):
+        search_args = {}
+    return search_tasks(search_args)
+
+@terminal.route('/search', methods=['GET'])
+@login_required
+def search_conditional():
+    """Read-only version of search, parameters are passed in query string. Supports If-None-Match"""
+    return conditional_get(lambda: search_tasks(request.args.to_dict()))
+
+@terminal.route('/next', methods=['POST'])
+@login_required
+def next_tasks():
+    """
+    The most urgent tasks that are not done yet, most urgent first - important tasks that have to be started soon.
+    Accepts 'limit' (10 by default) and output options 'format' and 'pretty'
+    """
+    next_args = request.get_json(silent=True)
+    if not isinstance(next_args, dict):
+        next_args = {}
+    try:
+        urgent_request = UrgentTasksRequestModel.model_validate(next_args)
+    except ValidationError as e:
+        return json_response({"status": "error", "message": str(e)}), 400
+
+    result = try_getting_most_urgent_tasks(current_user.id, urgent_request)
+    if result.success is False:
+        return json_response({"status": "error", "message": result.message}), 500
+    for task in result.tasks:
+        task.pop("parent_task_id")
+        task.pop("user_id")
+    return json_response({"status": "success", "result": format_result(result.tasks, next_args)},
+                         wants_pretty(next_args)), 200
+
+@terminal.route('/status', methods=['POST'])
+@login_required
+def set_status():
+    """Changes status of a task - 'todo', 'in_progress' or 'done'"""
+    try:
+        status_request = SetTaskStatusRequestModel.model_validate(request.json)
+    except ValidationError as e:
+        return json_response({"status": "error", "message": str(e)}), 400
+
+    result = try_setting_task_status(current_user.id, status_request)
+    if result.success is False:
+        if isinstance(result.exception, NoResultFound):
+            return json_response({"status": "error", "message": result.message}), 404
+        return json_response({"status": "error", "message": result.message}), 500
+    return json_response({"status": "success", "result": result.message}), 200
+
+def show_stats(stats_args: dict):
+    """Body of the stats command, shared by POST and GET version"""
+    try:
+        stats_request = TaskStatsRequestModel.model_validate(stats_args)
+    except ValidationError as e:
+        return json_response({"status": "error", "message": str(e)}), 400
+
+    result = try_getting_task_stats(current_user.id, stats_request)
+    if result.success is False:
+        return json_response({"status": "error", "message": result.message}), 500
+    return json_response({"status": "success", "result": format_result(result.stats, stats_args)},
+                         wants_pretty(stats_args)), 200
+
+@terminal.route('/stats', methods=['POST'])
+@login_required
+def stats():
+    """
+    Counts tasks with deadline between date_from and date_to (both included) by status and importance. Accepts output
+    options 'format' and 'pretty'
+    """
+    stats_args = request.get_json(silent=True)
+    if not isinstance(stats_args, dict):
+        stats_args = {}
+    return show_stats(stats_args)
 
-    return jsonify({"status": "success", "result": result.message}), 200
+@terminal.route('/stats', methods=['GET'])
+@login_required
+def stats_conditional():
+    """Read-only version of stats, parameters are passed in query string. Supports If-None-Match"""
+    return conditional_get(lambda: show_stats(request.args.to_dict()))
 
+@terminal.route('/batch', methods=['POST'])
+@login_required
+def batch():
+    """
+    Runs many add/edit/delete/view commands with one request and one commit. Body is {"operations": [{"command": ...,
+    "args": {...}}, ...], "atomic": false}, result has one item per command. Accepts output options 'format' and
+    'pretty'
+    """
+    batch_args = request.get_json(silent=True)
+    if not isinstance(batch_args, dict):
+        batch_args = {}
+    try:
+        batch_request = BatchRequestModel.model_validate(batch_args)
+    except ValidationError as e:
+        return json_response({"status": "error", "message": str(e)}), 400
 
+    result = try_running_batch(current_user.id, batch_request)
+    for operation_result in result.results or []:
+        if operation_result["command"] == "view" and operation_result["status"] == "success":
+            operation_result["result"].pop("parent_task_id")
+            operation_result["result"].pop("user_id")
+    pretty = wants_pretty(batch_args)
+    if result.success is False:
+        code = 400 if isinstance(result.exception, ValueError) else 500
+        return json_response({"status": "error", "message": result.message,
+                              "result": format_result(result.results, batch_args)}, pretty), code
+    return json_response({"status": "success", "message": result.message,
+                          "result": format_result(result.results, batch_args)}, pretty), 200
@@ -0,0 +1,84 @@
+"""
+In-process cache of logged in users, so that authenticated requests do not have to SELECT the user first.
+
+The login manager's user_loader keeps a CachedUser - an immutable snapshot of the identity (id, username, email) -
+for USER_CACHE_TTL seconds, in a LRU bounded by USER_CACHE_SIZE entries. Code that changes a user (or logs them out)
+calls invalidate(), other Gunicorn workers see the change when their entry expires, so TTL is the longest time
+a worker can use outdated user data. USER_CACHE_TTL = 0 disables the cache.
+"""
+from collections import OrderedDict
+from dataclasses import dataclass
+from flask import Flask
+from flask_login import UserMixin
+from threading import Lock
+from typing import Optional
+import time
+
+
+@dataclass(frozen=True, eq=False)
+class CachedUser(UserMixin):
+    """What requests need to know about the logged in user, detached from any database session"""
+    id: int
+    username: str
+    email: str
+
+
+class UserCache:
+    def __init__(self, ttl: float = 60, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # user_id -> (expires_at, CachedUser)
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app: Flask):
+        self.ttl = app.config.get("USER_CACHE_TTL", 60)
+        self.max_entries = app.config.get("USER_CACHE_SIZE", 1024)
+        self.clear()
+
+    def get(self, user_id: int) -> Optional[CachedUser]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] <= time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, user) -> CachedUser:
+        """Stores a snapshot of user (e.g. a db_models.User) and returns it"""
+        cached_user = CachedUser(id=user.id, username=user.username, email=user.email)
+        if self.ttl <= 0:
+            return cached_user
+        with self._lock:
+            self._entries[user.id] = (time.monotonic() + self.ttl, cached_user)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return cached_user
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """Hit and miss counters of this process since the start (or the last clear)"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+            }
+
+
+user_cache = UserCache()
@@ -1 +1,6 @@
-from .json_encoders import DateTimeEncoder
\ No newline at end of file
+from .json_encoders import DateTimeEncoder
+from .pagination import encode_cursor, decode_cursor
+from .bulk_formats import iter_ndjson_records, iter_csv_records
+from .serialization import dumps, dumps_text, json_response, wants_pretty, wants_structured
+from .intervals import assign_lanes
+from .ranking import urgency, threshold_top_k
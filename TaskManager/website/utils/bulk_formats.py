@@ -0,0 +1,41 @@
+"""Parsers of the formats accepted by the bulk task import. Both work on an iterable of text lines, so the request
+body can be consumed as a stream. Bytes that are not valid UTF-8 are expected to be decoded to U+FFFD
+(errors="replace"), records containing that character are rejected like any other invalid record"""
+from typing import Iterable, Iterator
+import csv
+import json
+
+
+REPLACEMENT_CHARACTER = "\ufffd"
+
+
+def iter_ndjson_records(lines: Iterable[str]) -> Iterator[tuple[int, object]]:
+    """
+    Yields (line_number, record) for every non-empty line of newline delimited JSON. When a line is not valid JSON
+    the record is the ValueError raised while parsing it.
+    """
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        if REPLACEMENT_CHARACTER in line:
+            yield line_number, ValueError("Line is not valid UTF-8")
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, e
+
+def iter_csv_records(lines: Iterable[str]) -> Iterator[tuple[int, object]]:
+    """
+    Yields (line_number, record) for every row of CSV with a header row. Empty cells are turned into None, so that
+    optional fields can be left blank.
+    """
+    reader = csv.DictReader(lines)
+    for row in reader:
+        if None in row:
+            yield reader.line_num, ValueError("Row has more cells than the header")
+            continue
+        if any(REPLACEMENT_CHARACTER in value for value in row.values() if value):
+            yield reader.line_num, ValueError("Row is not valid UTF-8")
+            continue
+        yield reader.line_num, {key: (value if value != "" else None) for key, value in row.items()}
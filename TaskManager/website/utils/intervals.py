@@ -0,0 +1,28 @@
+"""Interval helpers for the calendar view"""
+from typing import Sequence
+import heapq
+
+
+def assign_lanes(intervals: Sequence[tuple]) -> list[int]:
+    """
+    Packs (start, end) intervals into as few rows (lanes) as possible, so that intervals in one lane never overlap.
+    Returns the lane number of each interval, in the order of the input. An interval ending exactly when another one
+    starts may share its lane. O(n log n).
+    """
+    order = sorted(range(len(intervals)), key=lambda i: (intervals[i][0], intervals[i][1]))
+    lanes = [0] * len(intervals)
+    busy = []  # heap of (end, lane) of intervals placed so far
+    free = []  # heap of lane numbers whose intervals already ended
+    lane_count = 0
+    for i in order:
+        start, end = intervals[i]
+        while busy and busy[0][0] <= start:
+            heapq.heappush(free, heapq.heappop(busy)[1])
+        if free:
+            lane = heapq.heappop(free)
+        else:
+            lane = lane_count
+            lane_count += 1
+        lanes[i] = lane
+        heapq.heappush(busy, (end, lane))
+    return lanes
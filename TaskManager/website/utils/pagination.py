@@ -0,0 +1,28 @@
+"""Helpers for keyset (cursor based) pagination"""
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from datetime import datetime
+import json
+
+
+def encode_cursor(sort_by: str, last_value, last_id: int) -> str:
+    """Encodes position of the last returned row into an opaque, url-safe string"""
+    if isinstance(last_value, datetime):
+        last_value = last_value.isoformat()
+    raw = json.dumps([sort_by, last_value, last_id], separators=(",", ":"))
+    return urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str, sort_by: str) -> tuple:
+    """
+    Reverses encode_cursor(). Returns (last_value, last_id).
+    Raises ValueError if the cursor is malformed or was created for a different sort order
+    """
+    try:
+        cursor_sort_by, last_value, last_id = json.loads(urlsafe_b64decode(cursor.encode()))
+        if sort_by == "deadline":
+            last_value = datetime.fromisoformat(last_value)
+    except (BinasciiError, UnicodeDecodeError, ValueError, TypeError) as e:
+        raise ValueError("Malformed cursor") from e
+    if cursor_sort_by != sort_by or not isinstance(last_id, int):
+        raise ValueError("Cursor does not match requested sort order")
+    return last_value, last_id
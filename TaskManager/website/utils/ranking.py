@@ -0,0 +1,51 @@
+"""Urgency of tasks and selection of the most urgent ones for the 'next' command"""
+from datetime import datetime
+from itertools import count
+from typing import Callable, Hashable, Iterator, Optional, Sequence
+import heapq
+
+
+def urgency(importance: int, start_date: datetime, now: datetime) -> float:
+    """
+    How urgent a task is: (importance + 1) divided by (1 + days left until the task has to be started), where the
+    start is deadline - est_time_days. Tasks that should have been started already count as having no days left.
+    Grows with importance and falls with the start date, which is what threshold_top_k relies on.
+    """
+    days_left = max((start_date - now).total_seconds() / 86400, 0.0)
+    return (importance + 1) / (1 + days_left)
+
+
+def threshold_top_k(k: int, sources: Sequence[Iterator], key: Callable[[object], Hashable],
+                    score: Callable[[object], float], bound: Callable[[list], float]) -> list:
+    """
+    k items with the highest score, best first - Fagin's threshold algorithm. Every source yields all the items,
+    each in the order of one attribute the score is monotone in (e.g. importance descending, start date ascending).
+    Sources are read in turns, one item at a time. bound(last items read from the sources) is the highest score an
+    item not read yet can have, so reading stops as soon as the k best items read so far all score at least the
+    bound, or when a source runs out (every item has been read then). Items are kept in a heap of size k.
+    """
+    best = []  # heap of (score, order of reading, item), the worst of the k best on top
+    seen = set()
+    order = count()
+    last: list[Optional[object]] = [None] * len(sources)
+    while True:
+        for index, source in enumerate(sources):
+            item = next(source, None)
+            if item is None:
+                return _best_first(best)
+            last[index] = item
+            if key(item) in seen:
+                continue
+            seen.add(key(item))
+            # on equal scores the item read first wins, so that the result does not depend on the heap
+            entry = (score(item), -next(order), item)
+            if len(best) < k:
+                heapq.heappush(best, entry)
+            elif entry[:2] > best[0][:2]:
+                heapq.heapreplace(best, entry)
+        if len(best) == k and best[0][0] >= bound(last):
+            return _best_first(best)
+
+
+def _best_first(heap: list) -> list:
+    return [item for _, _, item in sorted(heap, reverse=True)]
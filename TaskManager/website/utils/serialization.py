@@ -0,0 +1,58 @@
+"""
+Single-pass JSON serialization of API responses. Uses orjson when it is installed and falls back to pydantic-core
+(always available, as pydantic depends on it). Both encode datetime objects as ISO 8601 strings and pydantic models
+natively, so payloads do not have to be converted to JSON-friendly dicts first.
+"""
+from flask import Response
+from pydantic import BaseModel
+from pydantic_core import to_json
+from time import perf_counter
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+def _orjson_default(obj):
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+# called with the seconds spent in every dumps(), set by the request instrumentation when it is enabled
+serialization_timer = None
+
+def dumps(obj, pretty: bool = False) -> bytes:
+    """Encodes obj to JSON bytes. Output is compact unless pretty is True"""
+    if serialization_timer is None:
+        return _encode(obj, pretty)
+    start = perf_counter()
+    encoded = _encode(obj, pretty)
+    serialization_timer(perf_counter() - start)
+    return encoded
+
+def _encode(obj, pretty: bool) -> bytes:
+    # orjson can only indent by 2 spaces, pretty output is always made by pydantic-core so that it does not depend on
+    # the installed packages
+    if orjson is not None and not pretty:
+        return orjson.dumps(obj, default=_orjson_default)
+    return to_json(obj, indent=4 if pretty else None)
+
+def dumps_text(obj, pretty: bool = False) -> str:
+    """Same as dumps(), but returns str"""
+    return dumps(obj, pretty).decode()
+
+def json_response(payload, pretty: bool = False) -> Response:
+    """Replacement of flask.jsonify that encodes the payload in one pass with dumps()"""
+    return Response(dumps(payload, pretty), mimetype="application/json")
+
+def wants_pretty(args: dict) -> bool:
+    """Reads the optional 'pretty' flag of a request, which may be a JSON boolean or a query string value"""
+    return str(args.get("pretty", "")).lower() in ("1", "true", "yes")
+
+def wants_structured(args: dict) -> bool:
+    """
+    Reads the optional 'format' of a request. With 'structured' the result is sent as a JSON value, by default it is
+    a (pretty printed) JSON string embedded in the response, as older clients expect.
+    """
+    return args.get("format") == "structured"
@@ -0,0 +1,16 @@
+"""
+Production (WSGI) entry point: gunicorn -c gunicorn.conf.py
+The app is created once, in the Gunicorn master (preload_app), and forked into the workers - imports, configuration
+and the schema check are not repeated by every worker and (re)started workers serve requests right away.
+"""
+from time import perf_counter
+
+_started = perf_counter()
+
+from website import create_app, prepare_for_fork
+
+app = create_app()
+# workers must not inherit connections opened by migrations and the cache
+prepare_for_fork(app)
+
+startup_seconds = perf_counter() - _started